@@ -1,28 +1,58 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import os
+import json
 import logging
 from datetime import datetime
 import sys
-from queue import Queue
-from threading import Lock, Thread
+import random
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Condition, Lock
 
 # Add the src directory to Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
-from lang.lexer import tokenize
+from lang.lexer import asks_for_input, tokenize
 from lang.parser import parse
-from lang.interpreter import Interpreter
+from lang.optimizer import optimize
+from lang.resolver import resolve
+from lang.interpreter import ENGINE_VERSION, Interpreter
+from lang.cache import ProgramCache, ResultCache, normalize_source, result_key
+from lang.workers import WorkerPool
+from lang.budget import BudgetExceeded, ExecutionBudget
+from lang.metrics import Registry
+from lang.profiler import ProfilingInterpreter
+from lang.analyzer import Document
 
 # Configure logging
 logging.basicConfig(
-    level='INFO',
+    level=os.environ.get('BRO_LOG_LEVEL', 'INFO').upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'default-secret-key-bro'
+app.config['PROGRAM_CACHE_ENTRIES'] = 256
+app.config['PROGRAM_CACHE_BYTES'] = 16 * 1024 * 1024
+app.config['RESULT_CACHE_ENTRIES'] = 1024
+app.config['RESULT_CACHE_BYTES'] = 16 * 1024 * 1024  # characters of cached output
+app.config['RESULT_CACHE_TTL'] = 300  # seconds
+app.config['MAX_SESSIONS'] = 500
+app.config['SESSION_IDLE_TTL'] = 300  # seconds
+app.config['EXECUTION_BACKEND'] = os.environ.get('BRO_EXECUTION_BACKEND', 'process')  # 'process' or 'thread'
+app.config['WORKER_POOL_SIZE'] = int(os.environ.get('BRO_WORKER_POOL_SIZE', 0)) or os.cpu_count() or 1
+app.config['RUN_THREADS'] = int(os.environ.get('BRO_RUN_THREADS', 0)) or 32  # runs in progress at once; more wait their turn
+app.config['EXECUTION_TIMEOUT'] = 5  # seconds of wall-clock time per run, not counting waits for input
+app.config['MAX_STEPS'] = 10_000_000  # statements and loop iterations per run
+app.config['MAX_OUTPUT'] = 1024 * 1024  # characters printed per run
+app.config['HARD_TIMEOUT_GRACE'] = 1  # seconds past EXECUTION_TIMEOUT before a worker process is killed
+app.config['STREAM_HEARTBEAT'] = 15  # seconds between keep-alive comments on an idle /stream
+app.config['LOG_SAMPLE_RATE'] = float(os.environ.get('BRO_LOG_SAMPLE_RATE', 1))  # share of INFO events logged
+app.config['MAX_DOCUMENTS'] = 500  # editor buffers /analyze keeps for incremental updates
+app.config['DOCUMENT_IDLE_TTL'] = 600  # seconds
 
 # Configure CORS
 CORS(app, resources={
@@ -33,167 +63,784 @@ CORS(app, resources={
     }
 })
 
+def log_event(event, level=logging.INFO, **fields):
+    """
+    Log one structured line: the event name and its fields as JSON. Nothing
+    is formatted unless the level is enabled, and events below WARNING are
+    sampled down to LOG_SAMPLE_RATE.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    rate = app.config['LOG_SAMPLE_RATE']
+    if level < logging.WARNING and rate < 1 and random.random() >= rate:
+        return
+    logger.log(level, "%s %s", event, json.dumps(fields, default=str))
+
+metrics = Registry()
+PHASES = ('lex', 'parse', 'execute')
+phase_seconds = {
+    phase: metrics.histogram('bro_phase_seconds', 'Seconds spent in each phase of running a program', phase=phase)
+    for phase in PHASES
+}
+request_seconds = {
+    endpoint: metrics.histogram('bro_request_seconds', 'Seconds taken to answer a request', endpoint=endpoint)
+    for endpoint in ('run', 'input', 'analyze')
+}
+OUTCOMES = ('success', 'error', 'budget_exceeded', 'timed_out')
+runs_total = {
+    outcome: metrics.counter('bro_runs_total', 'Finished runs by outcome', outcome=outcome)
+    for outcome in OUTCOMES
+}
+
+def count_error(error_type):
+    metrics.counter('bro_run_errors_total', 'Failed runs by error type', type=error_type).inc()
+
+def count_server_error(endpoint):
+    metrics.counter('bro_server_errors_total', 'Requests that failed with a server error', endpoint=endpoint).inc()
+
+def outcome_of(result):
+    if result['success']:
+        return 'success'
+    if result.get('timed_out'):
+        return 'timed_out'
+    if result.get('budget_exceeded'):
+        return 'budget_exceeded'
+    return 'error'
+
+def compile_source(code):
+    """Lex, parse, optimize and resolve a program, ready for any Interpreter."""
+    with phase_seconds['lex'].time():
+        tokens = tokenize(code)
+    logger.debug("Tokens generated: %s", tokens)
+    with phase_seconds['parse'].time():
+        ast = resolve(optimize(parse(tokens)))
+    return ast
+
+program_cache = ProgramCache(
+    max_entries=app.config['PROGRAM_CACHE_ENTRIES'],
+    max_bytes=app.config['PROGRAM_CACHE_BYTES'],
+)
+
+result_cache = ResultCache(
+    max_entries=app.config['RESULT_CACHE_ENTRIES'],
+    max_bytes=app.config['RESULT_CACHE_BYTES'],
+    ttl=app.config['RESULT_CACHE_TTL'],
+)
+
+worker_pool = None
+worker_pool_lock = Lock()
+
+# /run answers with the session id at once and the program runs here, so /stream shows output as it is printed
+run_threads = ThreadPoolExecutor(max_workers=app.config['RUN_THREADS'], thread_name_prefix='bro-run')
+
+def get_worker_pool():
+    """The shared WorkerPool, started on first use; None when running programs in-process."""
+    global worker_pool
+    if app.config['EXECUTION_BACKEND'] != 'process':
+        return None
+    with worker_pool_lock:
+        if worker_pool is None:
+            logger.info("Starting %d worker processes", app.config['WORKER_POOL_SIZE'])
+            worker_pool = WorkerPool(
+                size=app.config['WORKER_POOL_SIZE'],
+                timeout=app.config['EXECUTION_TIMEOUT'] + app.config['HARD_TIMEOUT_GRACE'],
+                cache_entries=app.config['PROGRAM_CACHE_ENTRIES'],
+                cache_bytes=app.config['PROGRAM_CACHE_BYTES'],
+            )
+        return worker_pool
+
+def worker_pool_stats():
+    return worker_pool.stats() if worker_pool is not None else None
+
+def collect_state():
+    """Gauges and counters read from the cache, sessions and worker pool on each /metrics scrape."""
+    cache = program_cache.stats()
+    yield 'bro_program_cache_entries', 'gauge', 'Compiled programs in the cache', None, cache['entries']
+    yield 'bro_program_cache_bytes', 'gauge', 'Source bytes of the cached programs', None, cache['bytes']
+    yield 'bro_program_cache_hits_total', 'counter', 'Program cache hits', None, cache['hits']
+    yield 'bro_program_cache_misses_total', 'counter', 'Program cache misses', None, cache['misses']
+    yield 'bro_program_cache_evictions_total', 'counter', 'Programs evicted from the cache', None, cache['evictions']
+    results = result_cache.stats()
+    yield 'bro_result_cache_entries', 'gauge', 'Run results in the cache', None, results['entries']
+    yield 'bro_result_cache_bytes', 'gauge', 'Characters of output in the result cache', None, results['bytes']
+    yield 'bro_result_cache_hits_total', 'counter', 'Runs answered from the result cache', None, results['hits']
+    yield 'bro_result_cache_misses_total', 'counter', 'Result cache misses', None, results['misses']
+    yield 'bro_result_cache_evictions_total', 'counter', 'Results evicted from the cache', None, results['evictions']
+    yield 'bro_result_cache_expirations_total', 'counter', 'Results dropped for being older than the TTL', None, results['expirations']
+    session_stats = sessions.stats()
+    yield 'bro_sessions', 'gauge', 'Sessions by state', {'state': 'active'}, session_stats['active']
+    yield 'bro_sessions', 'gauge', 'Sessions by state', {'state': 'waiting_for_input'}, session_stats['waiting_for_input']
+    yield 'bro_sessions_max', 'gauge', 'Most sessions allowed at once', None, session_stats['max_sessions']
+    yield 'bro_documents', 'gauge', 'Editor buffers kept for /analyze', None, documents.stats()['active']
+    pool = worker_pool_stats()
+    if pool is not None:
+        yield 'bro_workers', 'gauge', 'Worker processes by state', {'state': 'total'}, pool['size']
+        yield 'bro_workers', 'gauge', 'Worker processes by state', {'state': 'idle'}, pool['idle']
+        yield 'bro_worker_jobs_total', 'counter', 'Runs handed to worker processes', None, pool['jobs']
+        yield 'bro_worker_restarts_total', 'counter', 'Worker processes killed and replaced', None, pool['restarts']
+        cache = pool['program_cache']
+        yield 'bro_worker_program_cache_entries', 'gauge', 'Compiled programs in the worker caches', None, cache['entries']
+        yield 'bro_worker_program_cache_bytes', 'gauge', 'Source bytes of the programs the workers cache', None, cache['bytes']
+        yield 'bro_worker_program_cache_hits_total', 'counter', 'Program cache hits in the workers', None, cache['hits']
+        yield 'bro_worker_program_cache_misses_total', 'counter', 'Program cache misses in the workers', None, cache['misses']
+        yield 'bro_worker_program_cache_evictions_total', 'counter', 'Programs evicted from the worker caches', None, cache['evictions']
+
+metrics.add_collector(collect_state)
+
 class CodeExecutor:
-    def __init__(self):
-        self.timeout = 5
-        self.interpreter = Interpreter()
-        self.input_queue = Queue()
+    def __init__(self, program_cache=None, interpreter=None, session_id=None):
+        self.session_id = session_id  # only for logs
+        self.timeout = app.config['EXECUTION_TIMEOUT']
+        self.max_steps = app.config['MAX_STEPS']
+        self.max_output = app.config['MAX_OUTPUT']
+        self.program_cache = program_cache
+        self.interpreter = interpreter or Interpreter()
+        self.continuation = None  # a run paused at 'bro ask', resumed by provide_input()
         self.output = []
         self.waiting_for_input = False
+        self.input_requests = 0  # times this run has asked for input
         self.lock = Lock()
+        self.changed = Condition(self.lock)  # notified on new output, input requests and completion
         self.execution_complete = False
         self.result = None
+        self.execute_seconds = None  # time spent running the program so far, across input waits
+        self.profile = None  # per-statement report of a profiled run, added to its result
+        self.cache_key = None  # result_cache key a successful run is stored under
 
     def reset(self):
         with self.lock:
-            self.input_queue = Queue()
+            self.execute_seconds = None
+            self.profile = None
+            self.cache_key = None
+            self.continuation = None
             self.output = []
             self.waiting_for_input = False
+            self.input_requests = 0
             self.execution_complete = False
             self.result = None
             self.interpreter.reset()
 
-    def execute(self, code):
-        logger.info("Starting code execution")
-        self.reset()
+    def make_budget(self, limits=None):
+        """
+        The ExecutionBudget for one run. `limits` may lower 'max_steps',
+        'timeout' and 'max_output' below this executor's own, never raise them.
+        """
+        limits = limits or {}
+
+        def lower(name, ceiling):
+            value = limits.get(name)
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or value <= 0:
+                return ceiling
+            return min(value, ceiling)
+
+        return ExecutionBudget(
+            max_steps=int(lower('max_steps', self.max_steps)),
+            timeout=lower('timeout', self.timeout),
+            max_output=int(lower('max_output', self.max_output)),
+        )
+
+    def compile(self, code):
+        if self.program_cache is not None:
+            return self.program_cache.get_or_compile(code, compile_source)
+        return compile_source(normalize_source(code))
+
+    def output_callback(self, value):
+        with self.changed:
+            self.output.append(value)
+            self.changed.notify_all()
+        logger.debug("Output captured: %r", value)
+
+    def timed(self, run):
+        """Call run(), adding the time it takes to this run's execute time."""
+        started = time.perf_counter()
+        try:
+            return run()
+        finally:
+            self.execute_seconds = (self.execute_seconds or 0) + time.perf_counter() - started
+
+    def finish(self, result, error_type=None):
+        if self.profile is not None:
+            result['profile'] = self.profile
+        if self.cache_key is not None:
+            # Before the run is marked complete, so a client that saw it end can already hit the cache
+            result_cache.put(self.cache_key, result)
+        with self.changed:
+            self.result = result
+            self.waiting_for_input = False
+            self.execution_complete = True
+            self.changed.notify_all()
+        outcome = outcome_of(result)
+        runs_total[outcome].inc()
+        if error_type is not None:
+            count_error(error_type)
+        if self.execute_seconds is not None:
+            phase_seconds['execute'].observe(self.execute_seconds)
+        log_event('run_finished', session_id=self.session_id, outcome=outcome, error_type=error_type,
+                  execute_ms=round((self.execute_seconds or 0) * 1000, 3), output_lines=len(self.output))
+
+    def succeed(self):
+        with self.lock:
+            output = '\n'.join(self.output)
+        self.finish({'success': True, 'output': output, 'waiting_for_input': False})
 
-        def run_execution():
+    def fail(self, error):
+        logger.debug("Error executing code: %s", error)
+        result = {
+            'success': False,
+            'output': f'Bro, there was an error: {str(error)}',
+            'waiting_for_input': False
+        }
+        if isinstance(error, BudgetExceeded):
+            result['budget_exceeded'] = error.kind
+            result['budget'] = self.interpreter.budget.stats()
+        self.finish(result, type(error).__name__)
+
+    def advance(self, run):
+        """
+        Call run(), which runs the program until it next asks for input or
+        ends and returns its Continuation, and record where it stopped.
+        """
+        try:
+            continuation = self.timed(run)
+        except Exception as e:
+            self.fail(e)
+            return
+        if continuation.done:
+            self.succeed()
+            return
+        logger.debug("Waiting for input for %s", continuation.waiting_for)
+        with self.changed:
+            self.continuation = continuation
+            self.waiting_for_input = True
+            self.input_requests += 1
+            self.changed.notify_all()
+
+    def start(self, code, limits=None, profile=False, cache=True):
+        """
+        Run `code` as execute() does, on one of the run_threads, and return
+        the result so far. Output, input requests and the final result
+        follow through get_result() and stream().
+        """
+        def run():
             try:
-                tokens = tokenize(code)
-                logger.info(f"Tokens generated: {tokens}")
-                ast = parse(tokens)
-                logger.info("AST parsing complete")
-
-                def input_callback():
-                    logger.info("Waiting for input")
-                    self.waiting_for_input = True
-                    input_value = self.input_queue.get()  # Blocks until input
-                    self.waiting_for_input = False
-                    logger.info(f"Received input: {input_value}")
-                    return input_value
-
-                def output_callback(value):
-                    self.output.append(value)
-                    logger.info(f"Output captured: {value}")
-
-                self.interpreter.set_callbacks(input_callback, output_callback)
-                logger.info("Callbacks set, starting interpreter")
-                self.interpreter.visit(ast)
-                logger.info("Interpreter execution complete")
+                self.execute(code, limits, profile, cache)
+            except Exception as e:
+                logger.exception('Server error running session %s: %s', self.session_id, e)
+                count_server_error('run')
+                self.fail(e)
+
+        run_threads.submit(run)
+        return self.get_result()
 
+    def execute(self, code, limits=None, profile=False, cache=True):
+        """
+        Run `code`, returning its result once it ends or asks for input. With
+        `profile`, programs that don't ask for input are timed statement by
+        statement and the report is the result's 'profile'. Otherwise their
+        output depends on nothing but the code, engine and budget, so with
+        `cache` a result_cache hit answers without running them, marked
+        'cached'.
+        """
+        self.reset()
+        budget = self.make_budget(limits)
+        self.interpreter.budget = budget
+        self.interpreter.set_callbacks(None, self.output_callback)
+
+        pool = get_worker_pool()
+        key = None
+        if cache and not profile:
+            engine = pool.engine if pool is not None else self.interpreter.engine
+            key = result_key(code, (engine, ENGINE_VERSION, budget.max_steps, budget.timeout, budget.max_output))
+            # Only programs asks_for_input() cleared are ever stored, so a hit needs no compile
+            cached = result_cache.get(key)
+            if cached is not None:
+                logger.debug("Code does not require input, answering from the result cache")
+                result = dict(cached, waiting_for_input=False, cached=True)
                 with self.lock:
-                    self.result = {
-                        'success': True,
-                        'output': '\n'.join(self.output),
-                        'waiting_for_input': self.waiting_for_input
-                    }
-                    self.execution_complete = True
+                    self.output = result['output'].split('\n') if result['output'] else []
+                self.finish(result)
+                return result
 
+        if asks_for_input(code):
+            # Run up to the first input statement here; /input resumes the paused run, so no thread waits on the user
+            logger.debug("Code requires input, running it until it asks")
+            try:
+                program = self.compile(code)
             except Exception as e:
-                logger.error(f'Error executing code: {str(e)}')
-                with self.lock:
-                    self.result = {
-                        'success': False,
-                        'output': f'Bro, there was an error: {str(e)}',
-                        'waiting_for_input': False
-                    }
-                    self.execution_complete = True
-
-        # Check if the code contains 'bro ask' to determine if threading is needed
-        if 'bro ask' in code.lower():
-            logger.info("Code requires input, running in thread")
-            Thread(target=run_execution).start()
-            return {
-                'success': True,
-                'output': '',
-                'waiting_for_input': False
-            }
+                self.fail(e)
+            else:
+                self.advance(lambda: self.interpreter.start(program))
+            return self.get_result()
+
+        self.cache_key = key
+        if pool is not None:
+            logger.debug("Code does not require input, running in a worker process")
+            hard_timeout = budget.timeout + app.config['HARD_TIMEOUT_GRACE']
+            # Lines reach self.output as the worker prints them; on failure the result's output is the error
+            result = pool.run(code, timeout=hard_timeout, budget=budget, profile=profile, output_callback=self.output_callback)
+            result = dict(result, waiting_for_input=False)
+            # The worker timed its own phases; they are recorded here and kept out of the response
+            timings = result.pop('timings', {})
+            for phase in ('lex', 'parse'):
+                if phase in timings:
+                    phase_seconds[phase].observe(timings[phase])
+            self.execute_seconds = timings.get('execute')
+            if result.get('timed_out'):
+                self.execute_seconds = hard_timeout
+            self.finish(result, result.pop('error_type', None))
+            return result
+
+        logger.debug("Code does not require input, running synchronously")
+        interpreter = self.interpreter
+        if profile:
+            interpreter = ProfilingInterpreter(budget)
+            interpreter.set_callbacks(None, self.output_callback)
+        try:
+            program = self.compile(code)
+            self.timed(lambda: interpreter.visit(program))
+        except Exception as e:
+            if profile:
+                self.profile = interpreter.profile.to_dict(code)
+            self.fail(e)
         else:
-            logger.info("Code does not require input, running synchronously")
-            run_execution()
-            with self.lock:
-                return self.result
+            if profile:
+                self.profile = interpreter.profile.to_dict(code)
+            self.succeed()
+        with self.lock:
+            return self.result
 
     def provide_input(self, input_value):
-        logger.info(f"Providing input: {input_value}")
+        logger.debug("Providing input: %r", input_value)
         with self.lock:
             if not self.waiting_for_input:
                 logger.warning("Not waiting for input, rejecting request")
                 return {'success': False, 'error': 'Not waiting for input'}
-            
-            self.input_queue.put(input_value)
-            logger.info("Input added to queue")
-            return {'success': True, 'message': 'Input accepted, waiting for execution to complete'}
+            self.waiting_for_input = False  # claimed, so a second /input can't resume the run twice
+            continuation = self.continuation
 
-    def get_result(self):
+        self.advance(lambda: continuation.resume(input_value))
+        return {'success': True, 'message': 'Input accepted, waiting for execution to complete'}
+
+    def get_result(self, since=0):
+        """
+        The run's result so far. With `since`, only output lines from that
+        offset on are joined; 'next_offset' is the offset to ask for next.
+        """
         with self.lock:
+            next_offset = len(self.output)
             if self.execution_complete:
-                return self.result
-            elif self.waiting_for_input:
-                return {'success': True, 'output': '\n'.join(self.output), 'waiting_for_input': True}
-            else:
-                return {'success': True, 'output': '\n'.join(self.output), 'waiting_for_input': False}
+                if since and self.result['success']:
+                    return dict(self.result, output='\n'.join(self.output[since:]), next_offset=next_offset)
+                return dict(self.result, next_offset=next_offset)
+            return {
+                'success': True,
+                'output': '\n'.join(self.output[since:]),
+                'waiting_for_input': self.waiting_for_input,
+                'next_offset': next_offset
+            }
+
+    def stream(self, since=0, heartbeat=15):
+        """
+        Yield (event, data, offset) as the run progresses: 'output' for each
+        printed line from offset `since` on, 'input' when the program waits
+        for input, then 'done' with the result. 'heartbeat' is yielded after
+        `heartbeat` quiet seconds so callers can keep the connection alive.
+        """
+        position = since
+        announced = 0  # input requests already sent to this client
+
+        def has_news():
+            return (len(self.output) > position or self.execution_complete
+                    or (self.waiting_for_input and self.input_requests > announced))
+
+        while True:
+            with self.changed:
+                self.changed.wait_for(has_news, heartbeat)
+                lines = self.output[position:]
+                asking = self.waiting_for_input and self.input_requests > announced
+                input_requests = self.input_requests
+                result = self.result if self.execution_complete else None
+
+            if not (lines or asking or result):
+                yield 'heartbeat', None, position
+                continue
+            for line in lines:
+                position += 1
+                yield 'output', {'line': line}, position
+            if asking:
+                announced = input_requests
+                yield 'input', {}, position
+            if result is not None:
+                # Printed lines have been streamed already; a failed run's output is its error
+                done = {key: value for key, value in result.items() if key not in ('output', 'waiting_for_input')}
+                if not result['success']:
+                    done['error'] = result['output']
+                yield 'done', done, position
+                return
+
+    def close(self):
+        """Abandon a run that is still waiting for input."""
+        with self.lock:
+            if not self.waiting_for_input:
+                return
+            self.waiting_for_input = False
+            self.continuation.close()
+        self.fail(RuntimeError("Bro, your session expired while waiting for input"))
+
+class SessionLimitError(Exception):
+    pass
+
+class SessionPool:
+    """
+    Hands every /run its own CodeExecutor under a fresh session id, so
+    concurrent users never share interpreter state, paused runs or output.
+
+    Sessions idle for longer than `idle_ttl` seconds are evicted. At most
+    `max_sessions` live at once; when full, the least recently used finished
+    session makes room, and if none has finished the new run is refused.
+    Interpreters of evicted sessions are reset and handed to new sessions.
+    """
+
+    def __init__(self, program_cache=None, max_sessions=500, idle_ttl=300):
+        self.program_cache = program_cache
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.sessions = {}  # session id -> CodeExecutor, least recently used first
+        self.last_used = {}
+        self.idle_interpreters = []
+        self.lock = Lock()
+        self.next_sweep = 0
+
+    def create(self):
+        with self.lock:
+            self._evict_expired()
+            if len(self.sessions) >= self.max_sessions:
+                for session_id, session in self.sessions.items():
+                    if session.execution_complete:
+                        self._evict(session_id)
+                        break
+                else:
+                    raise SessionLimitError("Bro, the server is packed right now, try again in a sec")
+            interpreter = self.idle_interpreters.pop() if self.idle_interpreters else None
+            session_id = secrets.token_urlsafe(16)
+            session = CodeExecutor(self.program_cache, interpreter, session_id)
+            self.sessions[session_id] = session
+            self.last_used[session_id] = time.monotonic()
+            return session_id, session
+
+    def get(self, session_id):
+        """The session's executor, or None if it expired or never existed."""
+        with self.lock:
+            self._evict_expired()
+            session = self.sessions.pop(session_id, None)
+            if session is not None:
+                # Re-insert to keep the dict in least-recently-used order
+                self.sessions[session_id] = session
+                self.last_used[session_id] = time.monotonic()
+            return session
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        if now < self.next_sweep:
+            return
+        self.next_sweep = now + 1  # a sweep walks every session, so at most once a second
+        expired = [session_id for session_id, used in self.last_used.items() if now - used > self.idle_ttl]
+        for session_id in expired:
+            self._evict(session_id)
+
+    def _evict(self, session_id):
+        session = self.sessions.pop(session_id)
+        del self.last_used[session_id]
+        session.close()
+        if session.execution_complete and len(self.idle_interpreters) < self.max_sessions:
+            session.interpreter.reset()
+            self.idle_interpreters.append(session.interpreter)
+        logger.debug("Session %s closed", session_id)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'active': len(self.sessions),
+                'waiting_for_input': sum(session.waiting_for_input for session in self.sessions.values()),
+                'max_sessions': self.max_sessions,
+                'idle_interpreters': len(self.idle_interpreters),
+            }
+
+sessions = SessionPool(
+    program_cache,
+    max_sessions=app.config['MAX_SESSIONS'],
+    idle_ttl=app.config['SESSION_IDLE_TTL'],
+)
+
+class DocumentStore:
+    """
+    The editor buffers /analyze has seen, as lang.analyzer Documents, so each
+    keystroke only re-reads the statements it touched. Documents idle for
+    longer than `idle_ttl` seconds are dropped, and the least recently used
+    one makes room when `max_documents` are open; the editor then just
+    sends its whole code again.
+    """
+
+    def __init__(self, max_documents=500, idle_ttl=600):
+        self.max_documents = max_documents
+        self.idle_ttl = idle_ttl
+        self.documents = {}  # document id -> (Document, Lock), least recently used first
+        self.last_used = {}
+        self.lock = Lock()
+        self.next_sweep = 0
+
+    def create(self, code):
+        document = Document(code)
+        with self.lock:
+            self._evict_expired()
+            if len(self.documents) >= self.max_documents:
+                self._evict(next(iter(self.documents)))
+            document_id = secrets.token_urlsafe(16)
+            self.documents[document_id] = (document, Lock())
+            self.last_used[document_id] = time.monotonic()
+        return document_id, document
+
+    def get(self, document_id):
+        """The document and the lock to hold while editing it, or None if it expired or never existed."""
+        with self.lock:
+            self._evict_expired()
+            entry = self.documents.pop(document_id, None)
+            if entry is not None:
+                self.documents[document_id] = entry
+                self.last_used[document_id] = time.monotonic()
+            return entry
 
-executor = CodeExecutor()
+    def _evict_expired(self):
+        now = time.monotonic()
+        if now < self.next_sweep:
+            return
+        self.next_sweep = now + 1
+        expired = [document_id for document_id, used in self.last_used.items() if now - used > self.idle_ttl]
+        for document_id in expired:
+            self._evict(document_id)
+
+    def _evict(self, document_id):
+        del self.documents[document_id]
+        del self.last_used[document_id]
+
+    def stats(self):
+        with self.lock:
+            return {'active': len(self.documents), 'max_documents': self.max_documents}
+
+documents = DocumentStore(
+    max_documents=app.config['MAX_DOCUMENTS'],
+    idle_ttl=app.config['DOCUMENT_IDLE_TTL'],
+)
+
+def session_from_request(session_id):
+    """Look up a session, or build the error response for a missing one."""
+    if not session_id:
+        return None, (jsonify({'error': 'Bro, you need to provide a session_id!'}), 400)
+    session = sessions.get(session_id)
+    if session is None:
+        return None, (jsonify({'error': 'Bro, that session expired or never existed'}), 404)
+    return session, None
+
+def sse_event(event, data, event_id=None):
+    """Format one server-sent event."""
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data)}")
+    return '\n'.join(lines) + '\n\n'
 
 @app.route('/run', methods=['POST'])
 def run_code():
-    logger.info("Received /run request")
+    logger.debug("Received /run request")
+    started = time.perf_counter()
     try:
         code = request.json.get('code')
         if not code:
             logger.warning("No code provided in request")
             return jsonify({'error': 'Bro, you need to provide some code!'}), 400
+        limits = request.json.get('limits')
+        if limits is not None and not isinstance(limits, dict):
+            logger.warning("Bad limits in request: %r", limits)
+            return jsonify({'error': 'Bro, limits should be an object like {"max_steps": 1000}'}), 400
 
-        logger.info(f"Executing code: {code}")
-        result = executor.execute(code)
-        logger.info(f"Run result: {result}")
+        try:
+            session_id, session = sessions.create()
+        except SessionLimitError as e:
+            logger.warning("Session limit reached, rejecting request")
+            return jsonify({'error': str(e)}), 503
+
+        logger.debug("Executing code in session %s: %s", session_id, code)
+        profile = request.json.get('profile') is True
+        cache = request.json.get('cache') is not False  # {"cache": false} always runs the code
+        result = dict(session.start(code, limits, profile, cache), session_id=session_id)
+        logger.debug("Run result: %s", result)
+        request_seconds['run'].observe(time.perf_counter() - started)
         return jsonify(result)
 
     except Exception as e:
-        logger.error(f'Server error in /run: {str(e)}')
+        logger.exception('Server error in /run: %s', e)
+        count_server_error('run')
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
 @app.route('/input', methods=['POST'])
 def provide_input():
-    logger.info("Received /input request")
+    logger.debug("Received /input request")
+    started = time.perf_counter()
     try:
         input_value = request.json.get('input')
         if input_value is None:
             logger.warning("No input provided in request")
             return jsonify({'error': 'Bro, you need to provide input!'}), 400
 
-        logger.info(f"Processing input: {input_value}")
-        result = executor.provide_input(input_value)
-        logger.info(f"Input result: {result}")
+        session, error = session_from_request(request.json.get('session_id'))
+        if error:
+            return error
+
+        result = session.provide_input(input_value)
+        logger.debug("Input result: %s", result)
+        request_seconds['input'].observe(time.perf_counter() - started)
         return jsonify(result)
 
     except Exception as e:
-        logger.error(f'Server error in /input: {str(e)}')
+        logger.exception('Server error in /input: %s', e)
+        count_server_error('input')
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
 @app.route('/result', methods=['GET'])
 def get_result():
-    logger.info("Received /result request")
-    result = executor.get_result()
-    logger.info(f"Result response: {result}")
+    logger.debug("Received /result request")
+    session, error = session_from_request(request.args.get('session_id'))
+    if error:
+        return error
+    try:
+        since = max(int(request.args.get('since', 0)), 0)
+    except ValueError:
+        return jsonify({'error': 'Bro, since has to be a number'}), 400
+    result = session.get_result(since)
+    logger.debug("Result response: %s", result)
     return jsonify(result)
 
+@app.route('/stream', methods=['GET'])
+def stream_output():
+    """
+    Server-sent events for a session's run: 'output' per printed line, 'input'
+    when it waits for input and a final 'done'. Each event's id is the output
+    offset, so a reconnecting client resumes with ?since= or Last-Event-ID.
+    """
+    logger.debug("Received /stream request")
+    session, error = session_from_request(request.args.get('session_id'))
+    if error:
+        return error
+    try:
+        since = max(int(request.args.get('since') or request.headers.get('Last-Event-ID') or 0), 0)
+    except ValueError:
+        return jsonify({'error': 'Bro, since has to be a number'}), 400
+
+    def events():
+        for event, data, offset in session.stream(since, app.config['STREAM_HEARTBEAT']):
+            if event == 'heartbeat':
+                yield ': keep-alive\n\n'
+            else:
+                yield sse_event(event, data, offset)
+
+    return Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # let proxies pass events through as they come
+    })
+
+@app.route('/analyze', methods=['POST'])
+def analyze():
+    """
+    Syntax errors for the editor's code, without running it. Send 'code' to
+    open a document, then 'document_id' and 'edits', each {'start', 'end',
+    'text'} replacing characters start..end, and only the statements an edit
+    touches are lexed and parsed again. 'version' is the document's version
+    the edits apply to; on a 404 or 409 send the whole code again.
+    """
+    logger.debug("Received /analyze request")
+    started = time.perf_counter()
+    try:
+        data = request.json or {}
+        document_id = data.get('document_id')
+        if document_id is None:
+            code = data.get('code')
+            if not isinstance(code, str):
+                return jsonify({'error': 'Bro, you need to provide some code or a document_id!'}), 400
+            document_id, document = documents.create(code)
+            lock = Lock()
+        else:
+            entry = documents.get(document_id)
+            if entry is None:
+                return jsonify({'error': 'Bro, that document expired or never existed'}), 404
+            document, lock = entry
+
+        with lock:
+            if 'edits' in data:
+                version = data.get('version')
+                if version is not None and version != document.version:
+                    return jsonify({
+                        'error': f'Bro, those edits are for version {version} but the code is at {document.version}',
+                        'version': document.version,
+                    }), 409
+                try:
+                    for edit in data['edits']:
+                        document.edit(int(edit['start']), int(edit['end']), str(edit['text']))
+                except (KeyError, TypeError):
+                    return jsonify({
+                        'error': 'Bro, every edit needs a start, an end and its text',
+                        'version': document.version,
+                    }), 400
+                except ValueError as e:
+                    return jsonify({'error': str(e), 'version': document.version}), 400
+            result = {
+                'document_id': document_id,
+                'version': document.version,
+                'diagnostics': document.diagnostics(),
+            }
+        request_seconds['analyze'].observe(time.perf_counter() - started)
+        return jsonify(result)
+
+    except Exception as e:
+        logger.exception('Server error in /analyze: %s', e)
+        count_server_error('analyze')
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    logger.info("Received /health request")
+    logger.debug("Received /health request")
     response = {
         'status': 'healthy',
         'version': '1.0.0',
-        'timestamp': datetime.now().isoformat()
+        'timestamp': datetime.now().isoformat(),
+        'program_cache': program_cache.stats(),
+        'result_cache': result_cache.stats(),
+        'sessions': sessions.stats(),
+        'documents': documents.stats(),
+        'worker_pool': worker_pool_stats()
     }
-    logger.info(f"Health check response: {response}")
+    logger.debug("Health check response: %s", response)
     return jsonify(response)
 
+@app.route('/stats', methods=['GET'])
+def stats():
+    logger.debug("Received /stats request")
+    return jsonify({
+        'program_cache': program_cache.stats(),
+        'result_cache': result_cache.stats(),
+        'sessions': sessions.stats(),
+        'documents': documents.stats(),
+        'worker_pool': worker_pool_stats(),
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text exposition of the phase timings, counters and gauges."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     port = 5000
     host = '0.0.0.0'
     debug = True
-    logger.info(f"Starting Flask server on {host}:{port}")
+    logger.info("Starting Flask server on %s:%s", host, port)
     app.run(host=host, port=port, debug=debug)
     
\ No newline at end of file
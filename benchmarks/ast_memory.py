@@ -0,0 +1,64 @@
+"""
+Measures how much memory parsed programs and their token streams keep alive.
+
+    python benchmarks/ast_memory.py [statements]
+
+Bytes are what tracemalloc sees allocated while building the structure and
+still held afterwards, divided by the number of AST nodes or tokens.
+"""
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lang import lexer
+from lang.parser import ASTNode, parse
+from benchmarks.generators import mixed_program
+
+
+def count_nodes(node):
+    """Number of AST nodes reachable from `node`."""
+    count = 0
+    pending = [node]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, list):
+            pending.extend(node)
+        elif isinstance(node, ASTNode):
+            count += 1
+            if hasattr(node, "__dict__"):
+                pending.extend(vars(node).values())
+            else:
+                pending.extend(getattr(node, name) for cls in type(node).__mro__
+                               for name in getattr(cls, "__slots__", ()) if hasattr(node, name))
+    return count
+
+
+def measure(build):
+    """Return (result, bytes still allocated after building it)."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def main():
+    statements = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    code = mixed_program(statements)
+
+    tokens, token_bytes = measure(lambda: lexer.tokenize(code))
+    print(f"token list:   {len(tokens):>8} tokens  {token_bytes / len(tokens):7.1f} bytes/token")
+    if hasattr(lexer, "tokenize_buffer"):
+        buffer, buffer_bytes = measure(lambda: lexer.tokenize_buffer(code))
+        print(f"token buffer: {len(buffer):>8} tokens  {buffer_bytes / len(buffer):7.1f} bytes/token")
+
+    program, ast_bytes = measure(lambda: parse(tokens))
+    nodes = count_nodes(program)
+    print(f"AST:          {nodes:>8} nodes   {ast_bytes / nodes:7.1f} bytes/node")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Synthetic Bro programs for the benchmarks, each scaled by one knob.
+
+Every generator takes a size and returns the source of a complete program
+that runs without input, so any of them can be lexed, parsed and executed.
+"""
+
+
+def mixed_program(statements):
+    """A program mixing every statement kind, `statements` lines long."""
+    lines = ["yo bro", 'bro this is name = "bro"', "bro this is total = 0"]
+    while len(lines) < statements:
+        i = len(lines)
+        lines.append(f"bro this is x{i % 50} = total * {i} + (total - {i}) % 7")
+        lines.append(f'bro say "step " + x{i % 50} + " of " + name')
+        lines.append(f"bro if total > {i} {{ total = total - 1 }} bro else {{ total = total + {i % 9} }}")
+        lines.append(f"keep going bro total < {i % 5} {{ total = total + 1 }}")
+    lines.append("peace out bro")
+    return "\n".join(lines) + "\n"
+
+
+def nested_expression(depth, count=50):
+    """`count` assignments of an expression nested `depth` parentheses deep."""
+    expression = "x"
+    for i in range(depth):
+        expression = f"({expression} {'+-*'[i % 3]} {i % 7 + 1})"
+    lines = ["yo bro", "bro this is x = 1", "bro this is y = 0"]
+    for i in range(count):
+        lines.append(f"y = {expression} % 1000")
+    lines.append("bro say y")
+    lines.append("peace out bro")
+    return "\n".join(lines) + "\n"
+
+
+def counting_loop(trips):
+    """One while loop running `trips` times over arithmetic and a branch."""
+    return f"""yo bro
+bro this is i = 0
+bro this is total = 0
+keep going bro i < {trips} {{
+    total = total + i * 3 % 7
+    bro if i % 2 == 0 {{
+        total = total - 1
+    }}
+    i = i + 1
+}}
+bro say total
+peace out bro
+"""
+
+
+def string_building(size, count=20):
+    """String literals `size` characters long, concatenated and printed `count` times."""
+    chunk = ("bro " * (size // 4 + 1))[:size]
+    lines = ["yo bro", f'bro this is chunk = "{chunk}"', 'bro this is text = ""', "bro this is i = 0"]
+    lines.append(f"keep going bro i < {count} {{")
+    lines.append(f'    text = "{chunk}" + chunk + i')
+    lines.append("    bro say text")
+    lines.append("    i = i + 1")
+    lines.append("}")
+    lines.append("peace out bro")
+    return "\n".join(lines) + "\n"
+
+
+# name -> (generator, default size, what the size scales)
+WORKLOADS = {
+    "lines": (mixed_program, 20000, "statements"),
+    "depth": (nested_expression, 200, "expression depth"),
+    "loop": (counting_loop, 100000, "loop trips"),
+    "strings": (string_building, 100000, "string size"),
+}
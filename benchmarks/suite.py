@@ -0,0 +1,177 @@
+"""
+Throughput benchmarks for the lexer, parser and each execution engine.
+
+    python benchmarks/suite.py [--scale 0.1] [--only loop,lines] [--save results.json]
+    python benchmarks/suite.py --compare baseline.json [--threshold 0.1]
+
+Every workload from benchmarks.generators is lexed, parsed and run on each
+engine. Speed is the best of --repeat timed samples: tokens/sec for the lexer,
+nodes/sec for the parser and statements/sec for the engines, where a
+statement is one step of the ExecutionBudget. Peak memory comes from a
+separate run under tracemalloc, so tracing never skews the timings.
+
+--compare re-runs the suite and flags every result whose rate dropped, or
+whose peak memory grew, by more than --threshold against a saved baseline,
+exiting with status 1 if there were any.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lang.lexer import tokenize
+from lang.parser import parse
+from lang.optimizer import optimize
+from lang.interpreter import Interpreter, ENGINES
+from lang.budget import ExecutionBudget
+from benchmarks.ast_memory import count_nodes
+from benchmarks.generators import WORKLOADS
+
+
+def best_time(run, repeat):
+    """
+    Seconds per call to run(), the fastest of `repeat` samples. Quick calls
+    are looped until a sample takes at least 0.2s, like `python -m timeit`.
+    """
+    timer = timeit.Timer(run)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def peak_memory(run):
+    """Peak bytes tracemalloc sees allocated while run() runs."""
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def execute(program, engine):
+    """Run `program` on `engine` without limits; returns the statements it executed."""
+    interpreter = Interpreter(engine, ExecutionBudget(max_steps=None, max_output=None))
+    interpreter.visit(program)
+    return interpreter.budget.steps
+
+
+def measure(name, run, count, unit, repeat):
+    amount = count(run())
+    seconds = best_time(run, repeat)
+    return {
+        'stage': name,
+        'seconds': seconds,
+        'count': amount,
+        'unit': unit,
+        'rate': amount / seconds if seconds else 0.0,
+        'peak_bytes': peak_memory(run),
+    }
+
+
+def run_workload(code, engines, repeat):
+    """Results of every stage for one program, keyed by stage name."""
+    tokens = tokenize(code)
+    program = optimize(parse(tokens))
+    stages = [
+        measure("lex", lambda: tokenize(code), len, "tokens", repeat),
+        measure("parse", lambda: parse(tokens), count_nodes, "nodes", repeat),
+    ]
+    for engine in engines:
+        stages.append(measure(f"execute:{engine}", lambda: execute(program, engine), lambda steps: steps,
+                              "statements", repeat))
+    return {stage['stage']: stage for stage in stages}
+
+
+def run_suite(names, engines, scale, repeat):
+    results = {}
+    for name in names:
+        generator, size, knob = WORKLOADS[name]
+        size = max(1, int(size * scale))
+        code = generator(size)
+        print(f"{name}: {knob} = {size}", file=sys.stderr)
+        for stage, result in run_workload(code, engines, repeat).items():
+            results[f"{name}/{stage}"] = dict(result, workload=name, size=size)
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'scale': scale,
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def print_results(report):
+    print(f"{'benchmark':<24} {'count':>10} {'seconds':>10} {'rate':>26} {'peak KiB':>10}")
+    for key, result in report['results'].items():
+        rate = f"{result['rate']:,.0f} {result['unit']}/s"
+        print(f"{key:<24} {result['count']:>10} {result['seconds']:>10.5f} {rate:>26} "
+              f"{result['peak_bytes'] / 1024:>10.1f}")
+
+
+def compare(report, baseline, threshold):
+    """Print each result against `baseline`; returns the keys that regressed."""
+    regressions = []
+    print(f"{'benchmark':<24} {'rate':>9} {'memory':>9}")
+    for key, result in report['results'].items():
+        before = baseline['results'].get(key)
+        if before is None or before['size'] != result['size']:
+            print(f"{key:<24} {'new':>9} {'new':>9}")
+            continue
+        rate_change = result['rate'] / before['rate'] - 1 if before['rate'] else 0.0
+        memory_change = result['peak_bytes'] / before['peak_bytes'] - 1 if before['peak_bytes'] else 0.0
+        regressed = rate_change < -threshold or memory_change > threshold
+        if regressed:
+            regressions.append(key)
+        print(f"{key:<24} {rate_change:>+8.1%} {memory_change:>+8.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def names_from(value, choices):
+    names = [name for name in value.split(",") if name]
+    for name in names:
+        if name not in choices:
+            raise argparse.ArgumentTypeError(f"Bro, no such benchmark: {name} (pick from {', '.join(choices)})")
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Bro lexer, parser and engines.")
+    parser.add_argument("--only", type=lambda value: names_from(value, WORKLOADS), default=list(WORKLOADS),
+                        help=f"comma-separated workloads (default: {','.join(WORKLOADS)})")
+    parser.add_argument("--engines", type=lambda value: names_from(value, ENGINES), default=list(ENGINES),
+                        help=f"comma-separated engines (default: {','.join(ENGINES)})")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every workload's size")
+    parser.add_argument("--repeat", type=int, default=3, help="timed samples per stage; the fastest counts")
+    parser.add_argument("--save", metavar="PATH", help="write the results as JSON")
+    parser.add_argument("--compare", metavar="BASELINE", help="flag regressions against saved results")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="fraction a rate may drop, or memory grow, before it counts (default 0.10)")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        # Same sizes as the baseline, or nothing lines up
+        args.scale = baseline['scale']
+
+    report = run_suite(args.only, args.engines, args.scale, args.repeat)
+    print_results(report)
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.compare:
+        print()
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -22,6 +22,42 @@ interface TerminalMessage {
   content: string;
 }
 
+interface Diagnostic {
+  line: number | null;
+  column: number | null;
+  message: string;
+}
+
+interface Edit {
+  start: number;
+  end: number;
+  text: string;
+}
+
+// The server counts characters in code points, JavaScript strings in UTF-16 units
+const codePoints = (text: string) => text.length - (text.match(/[\uD800-\uDBFF][\uDC00-\uDFFF]/g)?.length ?? 0);
+
+// The one edit turning `before` into `after`: everything between their common prefix and suffix
+function diffEdit(before: string, after: string): Edit {
+  let prefix = 0;
+  const shortest = Math.min(before.length, after.length);
+  while (prefix < shortest && before[prefix] === after[prefix]) prefix++;
+  let suffix = 0;
+  while (
+    suffix < shortest - prefix &&
+    before[before.length - 1 - suffix] === after[after.length - 1 - suffix]
+  ) suffix++;
+  // Never split a surrogate pair
+  if (prefix > 0 && /[\uD800-\uDBFF]/.test(before[prefix - 1])) prefix--;
+  if (suffix > 0 && /[\uDC00-\uDFFF]/.test(before[before.length - suffix])) suffix--;
+  const start = codePoints(before.slice(0, prefix));
+  return {
+    start,
+    end: start + codePoints(before.slice(prefix, before.length - suffix)),
+    text: after.slice(prefix, after.length - suffix),
+  };
+}
+
 export function CodeEditor({
   initialValue = '',
   onChange,
@@ -39,8 +75,43 @@ export function CodeEditor({
   const [waitingForInput, setWaitingForInput] = useState<boolean>(false);
   const terminalRef = useRef<HTMLDivElement>(null);
   const inputRef = useRef<HTMLInputElement>(null);
-  const pollingInterval = useRef<NodeJS.Timeout | null>(null);
-  const lastOutput = useRef<string | null>(null);
+  const eventSource = useRef<EventSource | null>(null);
+  const sessionId = useRef<string | null>(null);
+  const [diagnostics, setDiagnostics] = useState<Diagnostic[]>([]);
+  // What /analyze last saw, so each change is sent as one small edit
+  const analyzed = useRef<{ documentId: string; version: number; code: string } | null>(null);
+  const analyzing = useRef<Promise<void>>(Promise.resolve());
+
+  const analyze = useCallback((value: string) => {
+    // One request at a time, so edits reach the server in order
+    analyzing.current = analyzing.current.then(async () => {
+      const previous = analyzed.current;
+      if (previous && previous.code === value) return;
+      try {
+        let data;
+        try {
+          if (!previous) throw new Error('no document yet');
+          const response = await axios.post('http://localhost:5000/analyze', {
+            document_id: previous.documentId,
+            version: previous.version,
+            edits: [diffEdit(previous.code, value)],
+          });
+          data = response.data;
+        } catch {
+          // New, expired or out of sync: send the whole code
+          const response = await axios.post('http://localhost:5000/analyze', { code: value });
+          data = response.data;
+        }
+        analyzed.current = { documentId: data.document_id, version: data.version, code: value };
+        setDiagnostics(data.diagnostics);
+      } catch (err: unknown) {
+        analyzed.current = null;
+        console.error('Analyze error:', (err as AxiosError).message);
+      }
+    });
+  }, []);
+
+  const debouncedAnalyze = useCallback(debounce(analyze, 150), [analyze]);
 
   const debouncedSave = useCallback(
     debounce((value: string) => {
@@ -52,9 +123,14 @@ export function CodeEditor({
   const handleChange = (value: string) => {
     setCode(value);
     debouncedSave(value);
+    debouncedAnalyze(value);
     onChange?.(value);
   };
 
+  useEffect(() => {
+    analyze(code);
+  }, []);
+
   const scrollToBottom = () => {
     if (terminalRef.current) {
       terminalRef.current.scrollTop = terminalRef.current.scrollHeight;
@@ -65,47 +141,46 @@ export function CodeEditor({
     scrollToBottom();
   }, [terminalMessages, waitingForInput]);
 
-  const pollResult = useCallback(async () => {
-    try {
-      console.log('Polling /result');
-      const response = await axios.get('http://localhost:5000/result');
-      console.log('Poll response:', response.data);
-
-      if (response.data.waiting_for_input === true) {
-        console.log('Setting waitingForInput to true');
-        setWaitingForInput(true);
-        if (response.data.output && response.data.output !== lastOutput.current) {
-          setTerminalMessages((prev) => [
-            ...prev,
-            { type: 'output', content: response.data.output }
-          ]);
-          lastOutput.current = response.data.output;
-        }
-      } else if (response.data.success === true && response.data.waiting_for_input === false) {
-        console.log('Execution complete or intermediate output, waitingForInput false');
-        setWaitingForInput(false);
-        if (response.data.output && response.data.output !== lastOutput.current) {
-          setTerminalMessages((prev) => [
-            ...prev,
-            { type: 'output', content: response.data.output }
-          ]);
-          lastOutput.current = response.data.output;
-        }
-        if (pollingInterval.current && !response.data.waiting_for_input) {
-          clearInterval(pollingInterval.current);
-          pollingInterval.current = null;
-          console.log('Polling stopped');
-        }
+  const closeStream = () => {
+    if (eventSource.current) {
+      eventSource.current.close();
+      eventSource.current = null;
+    }
+  };
+
+  const openStream = useCallback(() => {
+    closeStream();
+    console.log('Opening /stream');
+    // EventSource reconnects by itself and resumes from the last event id it saw
+    const source = new EventSource(
+      `http://localhost:5000/stream?session_id=${encodeURIComponent(sessionId.current ?? '')}`
+    );
+    eventSource.current = source;
+
+    source.addEventListener('output', (event) => {
+      const { line } = JSON.parse((event as MessageEvent).data);
+      setTerminalMessages((prev) => [...prev, { type: 'output', content: line }]);
+    });
+    source.addEventListener('input', () => {
+      console.log('Setting waitingForInput to true');
+      setWaitingForInput(true);
+    });
+    source.addEventListener('done', (event) => {
+      const result = JSON.parse((event as MessageEvent).data);
+      console.log('Execution complete:', result);
+      setWaitingForInput(false);
+      if (!result.success) {
+        setTerminalMessages((prev) => [...prev, { type: 'error', content: result.error }]);
       }
-    } catch (err: unknown) {
-      const error = err as AxiosError;
-      console.error('Poll error:', error.message, error.response?.data);
-      setTerminalMessages((prev) => [...prev, { type: 'error', content: 'Failed to fetch result' }]);
-      if (pollingInterval.current) {
-        clearInterval(pollingInterval.current);
-        pollingInterval.current = null;
+      closeStream();
+    });
+    source.onerror = () => {
+      if (source.readyState === EventSource.CLOSED) {
+        console.error('Stream closed by the server');
+        setTerminalMessages((prev) => [...prev, { type: 'error', content: 'Lost connection to the program' }]);
+        eventSource.current = null;
       }
-    }
+    };
   }, []);
 
   const handleInput = async (e: React.KeyboardEvent<HTMLInputElement>) => {
@@ -117,13 +192,9 @@ export function CodeEditor({
       setWaitingForInput(false);
 
       try {
-        const response = await axios.post('http://localhost:5000/input', { input });
+        const response = await axios.post('http://localhost:5000/input', { input, session_id: sessionId.current });
         console.log('Input response:', response.data);
         toast.success('Input submitted, waiting for result');
-        if (!pollingInterval.current) {
-          pollingInterval.current = setInterval(pollResult, 500);
-          console.log('Restarted polling after input');
-        }
       } catch (err: unknown) {
         const error = err as AxiosError;
         console.error('Input error:', error.message, error.response?.data);
@@ -144,7 +215,7 @@ export function CodeEditor({
     setIsRunning(true);
     setTerminalMessages([]);
     setWaitingForInput(false);
-    lastOutput.current = null;
+    closeStream();
 
     try {
       console.log('Sending POST request to http://localhost:5000/run');
@@ -157,16 +228,9 @@ export function CodeEditor({
         console.log('Error in response:', response.data.error);
         setTerminalMessages([{ type: 'error', content: response.data.error }]);
       } else {
-        console.log('Success response, updating terminal with output:', response.data.output);
-        if (response.data.output) {
-          setTerminalMessages([{ type: 'output', content: response.data.output }]);
-          lastOutput.current = response.data.output;
-        }
-        console.log('Starting polling');
-        if (pollingInterval.current) {
-          clearInterval(pollingInterval.current);
-        }
-        pollingInterval.current = setInterval(pollResult, 500);
+        sessionId.current = response.data.session_id;
+        // Output, input requests and errors all arrive on the stream, even for runs that already finished
+        openStream();
       }
       toast.success('Code execution started!');
     } catch (err: unknown) {
@@ -186,11 +250,9 @@ export function CodeEditor({
     setTerminalMessages([]);
     setWaitingForInput(false);
     setCurrentInput('');
-    lastOutput.current = null;
-    if (pollingInterval.current) {
-      clearInterval(pollingInterval.current);
-      pollingInterval.current = null;
-    }
+    sessionId.current = null;
+    closeStream();
+    analyze(initialValue);
     toast.success('Editor reset to initial state!');
   };
 
@@ -205,12 +267,11 @@ export function CodeEditor({
     window.addEventListener('keydown', handleKeyPress);
     return () => {
       window.removeEventListener('keydown', handleKeyPress);
-      if (pollingInterval.current) {
-        clearInterval(pollingInterval.current);
-      }
     };
   }, [code]);
 
+  useEffect(() => closeStream, []);
+
   useEffect(() => {
     console.log('waitingForInput changed to:', waitingForInput);
     if (waitingForInput && inputRef.current) {
@@ -285,6 +346,17 @@ export function CodeEditor({
         />
       </div>
 
+      {diagnostics.length > 0 && (
+        <div className="rounded border border-red-800 bg-gray-800 p-2 font-mono text-sm text-red-400">
+          {diagnostics.map((diagnostic, i) => (
+            <div key={i}>
+              {diagnostic.line !== null ? `Line ${diagnostic.line}:${diagnostic.column} ` : ''}
+              {diagnostic.message}
+            </div>
+          ))}
+        </div>
+      )}
+
       <div className="rounded border border-gray-600 bg-gray-800 p-4">
         <h3 className="text-sm font-medium text-gray-400 mb-2">Terminal</h3>
         <div
@@ -0,0 +1,265 @@
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+from lang.lexer import MASTER_PATTERN, SKIPPED, BroSyntaxError, Token
+from lang.parser import TokenStream, parse_statement
+
+# Token types a top-level statement can start with, where error recovery resumes
+STATEMENT_STARTS = frozenset(("PRINT", "VAR_DECL", "INPUT", "IF", "WHILE", "START", "END"))
+
+
+def lex(text):
+    """
+    Tokenize `text` like lang.lexer.tokenize, but skip characters nothing
+    matches instead of stopping. Returns (tokens, errors); each error is
+    (offset, line, column, character).
+    """
+    tokens = []
+    errors = []
+    match = MASTER_PATTERN.match
+    position = 0
+    length = len(text)
+    line_number = 1
+    line_start = 0
+    while position < length:
+        found = match(text, position)
+        if found is None:
+            errors.append((position, line_number, position - line_start + 1, text[position]))
+            position += 1
+            continue
+        token_type = found.lastgroup
+        end = found.end()
+        if token_type == "NEWLINE":
+            line_number += 1
+            line_start = end
+        elif token_type not in SKIPPED:
+            value = found.group()
+            tokens.append(Token(token_type, value, line_number, position - line_start + 1, position))
+            if token_type == "STRING" and "\n" in value:
+                line_number += value.count("\n")
+                line_start = position + value.rindex("\n") + 1
+        position = end
+    return tokens, errors
+
+
+class Segment:
+    """
+    One top-level item of a document: a statement, or the program's START or
+    END token, with the text from its first token up to the next item's.
+    Positions inside it are relative to where it starts, so a segment is
+    reused as is however much the text before it changes.
+    """
+    __slots__ = ("text", "newlines", "tail", "kind", "first_token", "last_token", "error", "open_quote")
+
+    def __init__(self, text, kind, first_token, last_token, error, open_quote=False):
+        self.text = text
+        self.newlines = text.count("\n")
+        self.tail = len(text) - text.rindex("\n") - 1 if self.newlines else len(text)  # characters after the last newline
+        self.kind = kind                # "start", "end", "statement", or None for text without tokens
+        self.first_token = first_token  # (value, line, column) of its first token, relative
+        self.last_token = last_token
+        self.error = error              # (line, column, message, unlexable character), relative, or None
+        self.open_quote = open_quote    # holds a '"' that no closing quote follows
+
+
+def relative(line, column, start_line, start_column):
+    """Position (line, column) relative to a segment starting at (start_line, start_column)."""
+    if line == start_line:
+        return 1, column - start_column + 1
+    return line - start_line + 1, column
+
+
+class Document:
+    """
+    Source text kept as Segments for live diagnostics. An edit re-lexes and
+    re-parses only the segments it touches, plus the one before it, and
+    pulls in following segments until a statement boundary lines up with
+    an old one again; everything past that point is reused untouched.
+    """
+
+    def __init__(self, text=""):
+        self.segments = []
+        self.version = 0
+        self.rebuild(0, 0, text, {})
+
+    @property
+    def text(self):
+        return "".join(segment.text for segment in self.segments)
+
+    def __len__(self):
+        return sum(len(segment.text) for segment in self.segments)
+
+    def edit(self, start, end, text):
+        """Replace the characters from offset `start` to `end` with `text`."""
+        starts = [0, *accumulate(len(segment.text) for segment in self.segments)]
+        length = starts[-1]
+        if not 0 <= start <= end <= length:
+            raise ValueError(f"Bro, that edit ({start}-{end}) is outside the {length} characters of code")
+        count = len(self.segments)
+        # The segment before the edit too: the edit may extend its last token or expression
+        first = max(bisect_right(starts, start) - 2, 0)
+        stop = min(bisect_right(starts, end), count)  # includes a segment starting right at `end`
+        if stop >= count - 1:
+            # Whether the last END is the last token changes how the statement before it parses
+            first = max(min(first, count - 3), 0)
+        for index in range(first):
+            if self.segments[index].open_quote:
+                first = index  # a quote the edit adds may close the string it opens
+                break
+        offset = starts[first]
+        shift = len(text) - (end - start)
+        # Old segments wholly after the edit, by where they start in the text being rebuilt
+        boundaries = {starts[old] - offset + shift: old for old in range(first, stop) if starts[old] >= end}
+        work = "".join(segment.text for segment in self.segments[first:stop])
+        work = work[:start - offset] + text + work[end - offset:]
+        self.rebuild(first, stop, work, boundaries)
+        self.version += 1
+
+    def rebuild(self, first, stop, text, boundaries):
+        """
+        Replace segments[first:stop] with segments read from `text`.
+        `boundaries` maps offsets in `text` to the unchanged old segments
+        starting there. Following segments are pulled into `text` until a
+        new segment starts exactly where an old one does, so the parse
+        before it saw the same tokens as last time and the rest can stay.
+        """
+        pull = 1
+        while True:
+            at_end = stop >= len(self.segments)
+            segments, starts, lex_errors = self.split(text, at_end)
+            # A '"' with no closing quote in `text` may still open a string that ends past it
+            limit = next((offset for offset, _, _, character in lex_errors if character == '"'), len(text))
+            for index in range(1, len(starts)):
+                old = boundaries.get(starts[index])
+                if old is not None and starts[index] <= limit:
+                    self.segments[first:old] = segments[:index]
+                    return
+            if at_end:
+                self.segments[first:stop] = segments
+                return
+            for segment in self.segments[stop:stop + pull]:
+                boundaries[len(text)] = stop
+                text += segment.text
+                stop += 1
+            pull *= 2
+
+    @staticmethod
+    def split(text, at_end):
+        """
+        Lex and parse `text` into Segments, one per top-level item. Returns
+        the segments, the offset in `text` each one starts at and the
+        lexer's errors. `at_end` says whether `text` runs to the end of the
+        document.
+        """
+        tokens, lex_errors = lex(text)
+        end = len(tokens)
+        if at_end and tokens and tokens[-1][0] == "END":
+            end -= 1  # like lang.parser.parse, the program's own END isn't part of its statements
+
+        items = []  # (first token index, stop token index, kind, error)
+        index = 0
+        while index < len(tokens):
+            token_type = tokens[index][0]
+            if token_type in ("START", "END"):
+                items.append((index, index + 1, token_type.lower(), None))
+                index += 1
+                continue
+            stream = TokenStream(tokens, index, end)
+            try:
+                parse_statement(stream)
+            except BroSyntaxError as e:
+                stop = recover(tokens, index + 1)
+                message = e.msg if e.lineno is None else e.msg.rsplit(" (line ", 1)[0]
+                error = (e.lineno, e.offset, message, None)
+                items.append((index, stop, "statement", error))
+                index = stop
+            else:
+                items.append((index, stream.position, "statement", None))
+                index = stream.position
+
+        if not items:
+            error = (*lex_errors[0][1:3], None, lex_errors[0][3]) if lex_errors else None
+            open_quote = any(character == '"' for _, _, _, character in lex_errors)
+            return [Segment(text, None, None, None, error, open_quote)], [0], lex_errors
+
+        starts = [0] + [tokens[first][4] for first, _, _, _ in items[1:]]
+        error_offsets = [offset for offset, _, _, _ in lex_errors]
+        segments = []
+        for number, (first, stop, kind, error) in enumerate(items):
+            start = starts[number]
+            start_line, start_column = (1, 1) if number == 0 else tokens[first][2:4]
+            segment_end = starts[number + 1] if number + 1 < len(items) else len(text)
+            skipped = lex_errors[bisect_left(error_offsets, start):bisect_left(error_offsets, segment_end)]
+            if skipped:
+                # A character the lexer skipped explains any parse error around it
+                error = (*skipped[0][1:3], None, skipped[0][3])
+            if error is not None and error[0] is not None:
+                error = (*relative(error[0], error[1], start_line, start_column), *error[2:])
+            head, last = tokens[first], tokens[stop - 1]
+            segments.append(Segment(
+                text[start:segment_end], kind,
+                (head[1], *relative(head[2], head[3], start_line, start_column)),
+                (last[1], *relative(last[2], last[3], start_line, start_column)),
+                error, any(character == '"' for _, _, _, character in skipped),
+            ))
+        return segments, starts, lex_errors
+
+    def diagnostics(self):
+        """Syntax errors as {'line', 'column', 'message'} dicts, in source order."""
+        found = []
+        line, column = 1, 1
+        items = [segment for segment in self.segments if segment.kind is not None]
+
+        def report(position, message, character=None):
+            if position is None or position[0] is None:
+                found.append({'line': None, 'column': None, 'message': message})
+                return
+            relative_line, relative_column = position
+            absolute_line = line + relative_line - 1
+            if character is not None:
+                message = f"Yo, what even is this: {character}? Line {absolute_line} is straight-up sus, bro!"
+            found.append({
+                'line': absolute_line,
+                'column': relative_column + column - 1 if relative_line == 1 else relative_column,
+                'message': message,
+            })
+
+        for segment in self.segments:
+            if segment.kind is not None:
+                if segment is items[0] and segment.kind != "start":
+                    report(segment.first_token[1:], "Bro, every program must start with 'yo bro'")
+                if segment is items[-1] and segment.kind != "end":
+                    report(segment.last_token[1:], "Bro, every program must end with 'peace out bro'")
+                if (segment.kind == "start" and segment is not items[0]) or \
+                        (segment.kind == "end" and segment is not items[-1]):
+                    report(segment.first_token[1:],
+                           f"Bro, unexpected token: {segment.first_token[0]} while parsing a statement")
+            if segment.error is not None:
+                report(segment.error[:2], *segment.error[2:])
+            if segment.newlines:
+                line += segment.newlines
+                column = segment.tail + 1
+            else:
+                column += segment.tail
+
+        if not items and not found:
+            report(None, "Bro, every program must start with 'yo bro'")
+        return found
+
+    def stats(self):
+        return {'version': self.version, 'length': len(self), 'segments': len(self.segments)}
+
+
+def recover(tokens, index):
+    """Index of the next token that can start a top-level statement, skipping over blocks."""
+    depth = 0
+    while index < len(tokens):
+        token_type = tokens[index][0]
+        if token_type == "LBRACE_BLOCK":
+            depth += 1
+        elif token_type == "RBRACE_BLOCK":
+            depth = max(depth - 1, 0)
+        elif depth == 0 and token_type in STATEMENT_STARTS:
+            return index
+        index += 1
+    return index
@@ -0,0 +1,298 @@
+"""
+Bro's list values and the built-in functions that work on them.
+
+A list is an Array: immutable, written `[1, 2, 3]` or made by range().
+Arithmetic and comparison operators between an Array and a plain value or
+another Array of the same length apply element by element, so
+`prices * 2` or `scores > 50` touch every element without a Bro loop.
+Since a comparison gives a list of bools, a list used as a condition is
+a TypeError rather than true or false.
+
+With NumPy installed, Arrays whose elements are all ints, all floats or
+all bools keep them in an ndarray and operators run vectorized. NumPy is
+only used where it gives exactly the result Python would: an operation
+that could overflow int64, lose precision converting ints to floats or
+divide by zero runs element by element instead, with Bro's own operators,
+so it gives the same value (or error) as without NumPy. Every other Array
+keeps a plain list and always runs element by element.
+
+Operations that touch every element charge them to the run's budget (see
+lang.budget.charge_elements) before doing the work, so a statement over a
+huge list counts for more than one step and can't outlast the time limit.
+"""
+import operator
+from functools import reduce
+
+try:
+    import numpy
+except ImportError:  # not installed; every Array then keeps a plain list
+    numpy = None
+
+from lang.budget import charge_elements
+from lang.parser import FUNCTIONS, OP_ADD, OP_SUB, OP_MUL, OP_DIV, OP_MOD, OP_GT, OP_LT, OP_GE, OP_LE, OP_EQ, OP_NE
+from lang.strings import StringBuilder
+
+# range() refuses to make lists longer than this, since one call could otherwise eat all memory
+MAX_LENGTH = 10_000_000
+
+INT64_LIMIT = 2 ** 63
+# Ints up to this size convert to floats exactly
+EXACT_FLOAT_LIMIT = 2 ** 53
+
+# NumPy's operators on whole arrays, by op code; int64 / int64 gives float64 like Python's '/'
+VECTORIZED_OPERATORS = (
+    operator.add, operator.sub, operator.mul, operator.truediv, operator.mod,
+    operator.gt, operator.lt, operator.ge, operator.le, operator.eq, operator.ne,
+)
+
+
+class Array:
+    __slots__ = ("items", "bound")
+
+    def __init__(self, items):
+        self.items = items  # an ndarray of int64, float64 or bool, or a list of any Bro values
+        self.bound = None   # largest absolute value of an int64 ndarray, once something needed it
+
+    def values(self):
+        """The elements as a list of plain Python values."""
+        items = self.items
+        return items if type(items) is list else items.tolist()
+
+    def get(self, position):
+        value = self.items[position]
+        return value if type(self.items) is list else value.item()
+
+    def largest(self):
+        """Largest absolute value in an int64 ndarray, as an exact Python int."""
+        if self.bound is None:
+            items = self.items
+            self.bound = max(int(items.max()), -int(items.min())) if len(items) else 0
+        return self.bound
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.values())
+
+    def __bool__(self):
+        # '[1, 2] == [3, 4]' is a list of bools, so as a condition it has no one answer
+        raise TypeError("Bro, a list can't be true or false; check its len() or one of its elements")
+
+    def __str__(self):
+        charge_elements(len(self.items))
+        return "[" + ", ".join(f'"{value}"' if isinstance(value, str) else str(value) for value in self.values()) + "]"
+
+    def __repr__(self):
+        return str(self)
+
+    # Comparisons give Arrays of bools, so an Array is no dict key
+    __hash__ = None
+
+    def elementwise(self, other, code, reflected=False):
+        """`self op other` (or `other op self` when `reflected`) element by element."""
+        if isinstance(other, Array) and len(other) != len(self):
+            raise ValueError(f"Bro, those lists aren't the same length: {len(self)} and {len(other)}")
+        charge_elements(len(self.items))
+        left, right = (other, self) if reflected else (self, other)
+        result = vectorized(code, left, right)
+        if result is not None:
+            return result
+        from lang.vm import BINARY_OPERATORS  # lang.vm imports this module, so not at the top
+        function = BINARY_OPERATORS[code]
+        left_values = left.values() if isinstance(left, Array) else [left] * len(self)
+        right_values = right.values() if isinstance(right, Array) else [right] * len(self)
+        return make_array(list(map(function, left_values, right_values)))
+
+    def __add__(self, other):
+        return self.elementwise(other, OP_ADD)
+
+    def __radd__(self, other):
+        return self.elementwise(other, OP_ADD, True)
+
+    def __sub__(self, other):
+        return self.elementwise(other, OP_SUB)
+
+    def __rsub__(self, other):
+        return self.elementwise(other, OP_SUB, True)
+
+    def __mul__(self, other):
+        return self.elementwise(other, OP_MUL)
+
+    def __rmul__(self, other):
+        return self.elementwise(other, OP_MUL, True)
+
+    def __truediv__(self, other):
+        return self.elementwise(other, OP_DIV)
+
+    def __rtruediv__(self, other):
+        return self.elementwise(other, OP_DIV, True)
+
+    def __mod__(self, other):
+        return self.elementwise(other, OP_MOD)
+
+    def __rmod__(self, other):
+        return self.elementwise(other, OP_MOD, True)
+
+    # Python reflects comparisons itself: 'x < array' calls array.__gt__(x)
+    def __gt__(self, other):
+        return self.elementwise(other, OP_GT)
+
+    def __lt__(self, other):
+        return self.elementwise(other, OP_LT)
+
+    def __ge__(self, other):
+        return self.elementwise(other, OP_GE)
+
+    def __le__(self, other):
+        return self.elementwise(other, OP_LE)
+
+    def __eq__(self, other):
+        return self.elementwise(other, OP_EQ)
+
+    def __ne__(self, other):
+        return self.elementwise(other, OP_NE)
+
+
+def numeric(value):
+    """
+    `value` as a NumPy operand with its largest absolute int value (None
+    for floats), or None when NumPy can't take it: a list-backed Array or a
+    value that isn't a number.
+    """
+    if isinstance(value, Array):
+        items = value.items
+        if type(items) is list:
+            return None
+        return items, value.largest() if items.dtype == numpy.int64 else None
+    kind = type(value)
+    if kind is int and -INT64_LIMIT < value < INT64_LIMIT:
+        return value, abs(value)
+    if kind is float or kind is bool:
+        return value, None
+    return None
+
+
+def vectorized(code, left, right):
+    """`left op right` on ndarrays, or None when NumPy wouldn't give exactly Python's result."""
+    if numpy is None:
+        return None
+    left, right = numeric(left), numeric(right)
+    if left is None or right is None:
+        return None
+    (a, a_bound), (b, b_bound) = left, right
+    if code <= OP_MOD:
+        # Python counts bools as ints in arithmetic: True + True is 2
+        if type(a) is bool or getattr(a, "dtype", None) == bool:
+            a, a_bound = numpy.asarray(a, numpy.int64), 1
+        if type(b) is bool or getattr(b, "dtype", None) == bool:
+            b, b_bound = numpy.asarray(b, numpy.int64), 1
+        if code in (OP_DIV, OP_MOD) and not numpy.all(b):
+            return None  # dividing by zero raises, element by element
+    if a_bound is not None and b_bound is not None:
+        # int64 wraps around where Python's ints just grow, and '/' divides them as floats
+        if code in (OP_ADD, OP_SUB) and a_bound + b_bound >= INT64_LIMIT:
+            return None
+        if code == OP_MUL and a_bound * b_bound >= INT64_LIMIT:
+            return None
+        if code == OP_DIV and max(a_bound, b_bound) >= EXACT_FLOAT_LIMIT:
+            return None
+    elif code > OP_MOD and max(a_bound or 0, b_bound or 0) >= EXACT_FLOAT_LIMIT:
+        return None  # Python compares an int with a float exactly; NumPy converts the int first
+    with numpy.errstate(all="ignore"):
+        return Array(VECTORIZED_OPERATORS[code](a, b))
+
+
+def make_array(values):
+    """An Array of the Bro values in list `values`, in an ndarray when NumPy can hold them exactly."""
+    values = [str(value) if type(value) is StringBuilder else value for value in values]
+    if numpy is not None and values:
+        kinds = set(map(type, values))
+        if len(kinds) == 1:
+            kind = kinds.pop()
+            try:
+                if kind is int:
+                    return Array(numpy.array(values, numpy.int64))
+                if kind is float:
+                    return Array(numpy.array(values, numpy.float64))
+                if kind is bool:
+                    return Array(numpy.array(values, bool))
+            except OverflowError:
+                pass  # ints beyond int64 stay exact in a list
+    return Array(values)
+
+
+def index(target, position):
+    """`target[position]` for an Array or a string; negative positions count from the end."""
+    if type(position) is not int:
+        raise TypeError(f"Bro, positions in a list are whole numbers, not {position}")
+    if isinstance(target, Array):
+        length = len(target)
+    elif isinstance(target, (str, StringBuilder)):
+        target = str(target)
+        length = len(target)
+    else:
+        raise TypeError(f"Bro, you can't index into {target}")
+    if not -length <= position < length:
+        raise IndexError(f"Bro, position {position} is out of range for something of length {length}")
+    return target.get(position) if type(target) is Array else target[position]
+
+
+def bro_len(value):
+    if isinstance(value, (Array, str, StringBuilder)):
+        return len(value)
+    raise TypeError(f"Bro, {value} doesn't have a length")
+
+
+def bro_range(*bounds):
+    """range(stop), range(start, stop) or range(start, stop, step) as an Array of ints."""
+    for bound in bounds:
+        if type(bound) is not int:
+            raise TypeError(f"Bro, range needs whole numbers, not {bound}")
+    if len(bounds) == 3 and bounds[2] == 0:
+        raise ValueError("Bro, range can't step by zero")
+    values = range(*bounds)
+    if len(values) > MAX_LENGTH:
+        raise ValueError(f"Bro, that range has {len(values)} values; lists top out at {MAX_LENGTH}")
+    charge_elements(len(values))
+    if numpy is not None and all(-INT64_LIMIT < bound < INT64_LIMIT for bound in bounds):
+        return Array(numpy.arange(values.start, values.stop, values.step, dtype=numpy.int64))
+    return Array(list(values))
+
+
+def reduction(name, value):
+    if not isinstance(value, Array):
+        raise TypeError(f"Bro, {name} needs a list, not {value}")
+    if name != "sum" and not len(value):
+        raise ValueError(f"Bro, you can't take the {name} of an empty list")
+    charge_elements(len(value.items))
+    return value.items if type(value.items) is not list else None
+
+
+def bro_sum(value):
+    """Elements added up left to right with Bro's '+'; 0 for an empty list."""
+    items = reduction("sum", value)
+    if items is not None:
+        if items.dtype == numpy.float64:
+            # A running total adds in the same order, and so rounds the same, as the loop below
+            return numpy.cumsum(items)[-1].item() if len(items) else 0
+        if items.dtype == numpy.int64 and value.largest() * len(items) < INT64_LIMIT:
+            return int(items.sum())
+    from lang.vm import bro_add  # lang.vm imports this module, so not at the top
+    values = value.values()
+    return reduce(bro_add, values) if values else 0
+
+
+def bro_min(value):
+    items = reduction("min", value)
+    return min(value.values()) if items is None else items.min().item()
+
+
+def bro_max(value):
+    items = reduction("max", value)
+    return max(value.values()) if items is None else items.max().item()
+
+
+# Indexed by function code, in the order of parser.FUNCTIONS
+BUILTIN_FUNCTIONS = (bro_len, bro_range, bro_sum, bro_min, bro_max)
+assert len(BUILTIN_FUNCTIONS) == len(FUNCTIONS)
@@ -0,0 +1,249 @@
+"""
+Compiled-program artifacts (.broc files) for the CLI, like CPython's __pycache__.
+
+A .broc file is a fixed header followed by the optimized AST, flattened
+into postorder instructions and serialized with marshal:
+
+    magic        4 bytes   b"BROC"
+    version      2 bytes   FORMAT_VERSION, bumped whenever the AST nodes or
+                           the optimizer change what a program compiles to
+    mtime        8 bytes   the source's mtime in nanoseconds
+    size         8 bytes   the source's size in bytes
+    sha256      32 bytes   hash of the source
+
+An artifact is used as is while the source's mtime and size match. When
+they don't, the source is hashed, and an artifact whose hash still matches
+(a touched or re-checked-out file) is used and re-stamped. Anything else
+is recompiled and rewritten.
+"""
+import hashlib
+import marshal
+import os
+import struct
+import tempfile
+
+from lang.parser import *
+
+MAGIC = b"BROC"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<4sHQQ32s")
+CACHE_DIRECTORY = "__brocache__"
+
+# Postorder instruction tags
+LITERAL, REFERENCE, BINARY, CONCAT, PRINT, DECLARE, IF, WHILE, PROGRAM, LIST, INDEX, CALL = range(12)
+
+
+def dump_program(program):
+    """
+    Flatten a Program into postorder instructions: each node comes after its
+    children, so load_program() rebuilds it with a stack and, like the
+    parser, never recurses however deeply expressions nest.
+    """
+    instructions = []
+    emit = instructions.append
+    pending = [(program, False)]
+    while pending:
+        node, children_done = pending.pop()
+        if isinstance(node, Literal):
+            emit((LITERAL, node.value))
+        elif isinstance(node, VariableReference):
+            emit((REFERENCE, node.name))
+        elif not children_done:
+            pending.append((node, True))
+            pending.extend((child, False) for child in reversed(children(node)))
+        elif isinstance(node, BinaryOperation):
+            emit((BINARY, node.op))
+        elif isinstance(node, Concat):
+            emit((CONCAT, len(node.parts)))
+        elif isinstance(node, ListLiteral):
+            emit((LIST, len(node.elements)))
+        elif isinstance(node, Index):
+            emit((INDEX,))
+        elif isinstance(node, Call):
+            emit((CALL, node.function, len(node.arguments)))
+        elif isinstance(node, PrintStatement):
+            emit((PRINT, node.line))
+        elif isinstance(node, VariableDeclaration):
+            emit((DECLARE, node.name, node.line))
+        elif isinstance(node, IfStatement):
+            else_count = -1 if node.else_body is None else len(node.else_body)
+            emit((IF, len(node.if_body), else_count, node.line))
+        elif isinstance(node, WhileLoop):
+            emit((WHILE, len(node.body), node.line))
+        elif isinstance(node, Program):
+            emit((PROGRAM, len(node.statements)))
+        else:
+            raise TypeError(f"Bro, can't save a {type(node).__name__} node")
+    return marshal.dumps(instructions)
+
+
+def children(node):
+    """Child nodes of `node`, in the order load_program() pops them back off in reverse."""
+    if isinstance(node, BinaryOperation):
+        return [node.left, node.right]
+    if isinstance(node, Concat):
+        return node.parts
+    if isinstance(node, ListLiteral):
+        return node.elements
+    if isinstance(node, Index):
+        return [node.target, node.index]
+    if isinstance(node, Call):
+        return node.arguments
+    if isinstance(node, PrintStatement):
+        return [node.expression]
+    if isinstance(node, VariableDeclaration):
+        return [node.value]
+    if isinstance(node, IfStatement):
+        return [node.condition, *node.if_body, *(node.else_body or ())]
+    if isinstance(node, WhileLoop):
+        return [node.condition, *node.body]
+    if isinstance(node, Program):
+        return node.statements
+    return []
+
+
+def take(stack, count):
+    """Pop the last `count` nodes off `stack`, in the order they were pushed."""
+    if not count:
+        return []
+    taken = stack[-count:]
+    del stack[-count:]
+    return taken
+
+
+def load_program(data):
+    """Rebuild the Program dump_program() flattened."""
+    stack = []
+    push = stack.append
+    for instruction in marshal.loads(data):
+        tag = instruction[0]
+        if tag == LITERAL:
+            push(Literal(instruction[1]))
+        elif tag == REFERENCE:
+            push(VariableReference(instruction[1]))
+        elif tag == BINARY:
+            right = stack.pop()
+            push(BinaryOperation(stack.pop(), OPERATORS[instruction[1]], right))
+        elif tag == CONCAT:
+            push(Concat(take(stack, instruction[1])))
+        elif tag == LIST:
+            push(ListLiteral(take(stack, instruction[1])))
+        elif tag == INDEX:
+            position = stack.pop()
+            push(Index(stack.pop(), position))
+        elif tag == CALL:
+            push(Call(FUNCTIONS[instruction[1]], take(stack, instruction[2])))
+        elif tag == PRINT:
+            push(PrintStatement(stack.pop(), instruction[1]))
+        elif tag == DECLARE:
+            push(VariableDeclaration(instruction[1], stack.pop(), instruction[2]))
+        elif tag == IF:
+            _, if_count, else_count, line = instruction
+            else_body = take(stack, else_count) if else_count >= 0 else None
+            if_body = take(stack, if_count)
+            push(IfStatement(stack.pop(), if_body, else_body, line))
+        elif tag == WHILE:
+            body = take(stack, instruction[1])
+            push(WhileLoop(stack.pop(), body, instruction[2]))
+        elif tag == PROGRAM:
+            push(Program(take(stack, instruction[1])))
+        else:
+            raise ValueError(f"Bro, unknown instruction in a .broc file: {tag}")
+    if len(stack) != 1 or not isinstance(stack[0], Program):
+        raise ValueError("Bro, that .broc file is broken")
+    return stack[0]
+
+
+def cache_path(source_path, cache_dir=None):
+    """
+    Where the artifact for `source_path` lives: __brocache__/<name>.broc next
+    to it, or, with `cache_dir`, a file in there named after the source's
+    absolute path so sources with the same name don't collide.
+    """
+    source_path = os.path.abspath(source_path)
+    name = os.path.splitext(os.path.basename(source_path))[0]
+    if cache_dir is None:
+        return os.path.join(os.path.dirname(source_path), CACHE_DIRECTORY, f"{name}.broc")
+    digest = hashlib.sha256(source_path.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{name}-{digest}.broc")
+
+
+def read_artifact(path, stat, read_source):
+    """
+    The Program saved at `path` if it is still valid for a source with
+    os.stat() result `stat`, else None. read_source() is only called when
+    the mtime or size changed and the hash has to decide.
+    """
+    try:
+        with open(path, "rb") as file:
+            header = file.read(HEADER.size)
+            if len(header) != HEADER.size:
+                return None
+            magic, version, mtime, size, digest = HEADER.unpack(header)
+            if magic != MAGIC or version != FORMAT_VERSION:
+                return None
+            if (mtime, size) != (stat.st_mtime_ns, stat.st_size):
+                if hashlib.sha256(read_source()).digest() != digest:
+                    return None
+                restamp = True
+            else:
+                restamp = False
+            program = load_program(file.read())
+    except (OSError, ValueError, EOFError, TypeError, IndexError):
+        return None
+    if restamp:
+        try:
+            with open(path, "r+b") as file:
+                file.write(HEADER.pack(MAGIC, FORMAT_VERSION, stat.st_mtime_ns, stat.st_size, digest))
+        except OSError:
+            pass
+    return program
+
+
+def write_artifact(path, stat, source, program):
+    """Save `program` for `source` at `path`. Returns False if it couldn't be written, e.g. a read-only directory."""
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, stat.st_mtime_ns, stat.st_size, hashlib.sha256(source).digest())
+    try:
+        data = dump_program(program)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Write a temporary file and rename it, so a concurrent run never reads half an artifact
+        descriptor, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(header)
+                file.write(data)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+    except (OSError, ValueError):
+        return False
+    return True
+
+
+def load_or_compile(source_path, compile_source, cache_dir=None):
+    """
+    The compiled Program for the file at `source_path`, from its .broc
+    artifact when that is still valid. Otherwise the source is read and
+    compile_source(code) is called, and its result saved for next time.
+    """
+    stat = os.stat(source_path)
+    source = None
+
+    def read_source():
+        nonlocal source
+        if source is None:
+            with open(source_path, "rb") as file:
+                source = file.read()
+        return source
+
+    path = cache_path(source_path, cache_dir)
+    program = read_artifact(path, stat, read_source)
+    if program is not None:
+        return program
+    # Universal newlines, as reading the file in text mode would give
+    code = read_source().decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+    program = compile_source(code)
+    write_artifact(path, stat, read_source(), program)
+    return program
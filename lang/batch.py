@@ -0,0 +1,116 @@
+"""
+Run many Bro programs at once for `bro_lang.py`, across a WorkerPool.
+
+Arguments can be files, directories (every .bro file under them) or glob
+patterns. A program that uses 'bro ask' gets its answers from a fixture
+next to it: `name.in` for `name.bro`, one answer per line.
+"""
+import glob
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Seconds past a file's --timeout before its worker process is killed
+HARD_TIMEOUT_GRACE = 1
+
+
+def expand_paths(arguments):
+    """The .bro files `arguments` name, in order and without repeats."""
+    paths = []
+    for argument in arguments:
+        if glob.has_magic(argument):
+            matches = sorted(glob.glob(argument, recursive=True))
+            if not matches:
+                raise FileNotFoundError(f"Bro, nothing matches {argument}")
+            for match in matches:
+                paths.extend(find_programs(match) if os.path.isdir(match) else [match])
+        elif os.path.isdir(argument):
+            paths.extend(find_programs(argument))
+        elif os.path.exists(argument):
+            paths.append(argument)
+        else:
+            raise FileNotFoundError(f"Bro, there's no file called {argument}")
+    return list(dict.fromkeys(os.path.normpath(path) for path in paths))
+
+
+def find_programs(directory):
+    found = []
+    for root, directories, files in os.walk(directory):
+        directories[:] = sorted(name for name in directories if not name.startswith((".", "__")))
+        found.extend(os.path.join(root, name) for name in sorted(files) if name.endswith(".bro"))
+    return found
+
+
+def fixture_path(path):
+    return os.path.splitext(path)[0] + ".in"
+
+
+def read_inputs(path):
+    """Answers for 'bro ask' from the program's fixture, or none if it has no fixture."""
+    try:
+        with open(fixture_path(path), 'r') as file:
+            return file.read().splitlines()
+    except FileNotFoundError:
+        return []
+
+
+def run_file(pool, path, timeout, budget):
+    """Run one file in `pool`; returns its entry for the summary."""
+    started = time.perf_counter()
+    entry = {'file': path}
+    try:
+        with open(path, 'r') as file:
+            code = file.read()
+        inputs = read_inputs(path)
+    except (OSError, UnicodeDecodeError) as e:
+        entry.update(status="error", output="", error=f"Bro, couldn't read it: {e}", seconds=0.0)
+        return entry
+    result = pool.run(code, inputs, timeout=timeout and timeout + HARD_TIMEOUT_GRACE, budget=budget)
+    if result['success']:
+        entry.update(status="ok", output=result['output'])
+    else:
+        if result.get('timed_out') or result.get('budget_exceeded') == "time":
+            status = "timeout"
+        elif result.get('budget_exceeded'):
+            status = "budget"
+        else:
+            status = "error"
+        entry.update(status=status, output="", error=result['output'])
+        if 'error_type' in result:
+            entry['error_type'] = result['error_type']
+    entry['inputs'] = len(inputs)
+    entry['seconds'] = time.perf_counter() - started
+    if 'timings' in result:
+        entry['timings'] = result['timings']
+    return entry
+
+
+def run_files(paths, jobs=None, engine="tree", timeout=None, budget=None):
+    """
+    Run every file in `paths` on `jobs` worker processes (default: one per
+    core), each under `budget` and killed `HARD_TIMEOUT_GRACE` seconds past
+    `timeout`. Returns a summary with one entry per file, in `paths` order.
+    """
+    from lang.workers import WorkerPool
+
+    started = time.perf_counter()
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(paths) or 1))
+    pool = WorkerPool(size=jobs, timeout=None, cpu_time=timeout and timeout + HARD_TIMEOUT_GRACE, engine=engine)
+    try:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(lambda path: run_file(pool, path, timeout, budget), paths))
+    finally:
+        pool.close()
+    counts = {}
+    for entry in results:
+        counts[entry['status']] = counts.get(entry['status'], 0) + 1
+    return {
+        'files': len(results),
+        'passed': counts.get("ok", 0),
+        'failed': len(results) - counts.get("ok", 0),
+        'statuses': counts,
+        'jobs': jobs,
+        'engine': engine,
+        'seconds': time.perf_counter() - started,
+        'results': results,
+    }
@@ -1,25 +1,189 @@
+import argparse
+import os
 import sys
-from lexer import tokenize
-from parser import parse
-from interpreter import Interpreter
+
+# Make the `lang` package importable when run as `python lang/bro_lang.py`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lang.options import ENGINES, SORT_KEYS
+from lang.budget import DEFAULT_MAX_OUTPUT, DEFAULT_MAX_STEPS
+from lang.daemon import DEFAULT_SOCKET, connect, serve
+
+def limit(value):
+    """Parse a limit flag; 0 means no limit."""
+    number = float(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError("Bro, limits can't be negative")
+    return number or None
+
+def compile_source(code):
+    from lang.lexer import tokenize
+    from lang.parser import parse
+    from lang.optimizer import optimize
+    return optimize(parse(tokenize(code)))
+
+def print_profile(profile, code, args):
+    """Write the --profile report to stderr, out of the way of the program's own output."""
+    if args.profile_format == "json":
+        report = profile.report_json(code, args.profile_sort, args.profile_limit)
+    else:
+        report = profile.report_text(code, args.profile_sort, args.profile_limit)
+    print(report, file=sys.stderr)
 
 def main():
     """
     Entry point for executing the Bro language interpreter.
     """
-    if len(sys.argv) != 2:
-        print("Usage: python bro_lang.py <filename>")
+    parser = argparse.ArgumentParser(description="Run a Bro program.")
+    parser.add_argument("files", nargs="*", metavar="file",
+                        help="a program to run; several files, directories or globs run them all in parallel")
+    parser.add_argument("--engine", choices=ENGINES, default="tree")
+    parser.add_argument("--max-steps", type=limit, default=DEFAULT_MAX_STEPS,
+                        help=f"statements and loop iterations to allow, 0 for no limit (default {DEFAULT_MAX_STEPS})")
+    parser.add_argument("--timeout", type=limit, default=None,
+                        help="seconds the program may run, 0 for no limit (default: no limit)")
+    parser.add_argument("--max-output", type=limit, default=DEFAULT_MAX_OUTPUT,
+                        help=f"characters the program may print, 0 for no limit (default {DEFAULT_MAX_OUTPUT})")
+    parser.add_argument("--profile", action="store_true",
+                        help="time every statement (with the tree engine) and print a report to stderr")
+    parser.add_argument("--profile-format", choices=("text", "json"), default="text")
+    parser.add_argument("--profile-sort", choices=SORT_KEYS, default="self")
+    parser.add_argument("--profile-limit", type=int, default=None, help="only report the N hottest statements")
+    parser.add_argument("--stream", action="store_true",
+                        help="run each statement as soon as it is read, in bounded memory, for huge programs "
+                             "('-' reads the program from stdin)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="don't read or write the compiled program in __brocache__")
+    parser.add_argument("--cache-dir", default=os.environ.get("BRO_CACHE_DIR"),
+                        help="keep compiled programs here instead of next to each source (default: $BRO_CACHE_DIR)")
+    parser.add_argument("--serve", action="store_true",
+                        help="stay running and run programs for --connect clients on --socket")
+    parser.add_argument("--connect", action="store_true",
+                        help="run the program on the --serve daemon at --socket instead of starting up here")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help=f"Unix socket of the daemon (default {DEFAULT_SOCKET})")
+    parser.add_argument("--send-source", action="store_true",
+                        help="with --connect, send the program's source instead of its path")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="worker processes for running many files (default: one per core)")
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.socket, compile_source)
+        return
+    if not args.files:
+        parser.error("Bro, which file should I run?")
+    if len(args.files) > 1 or args.jobs or os.path.isdir(args.files[0]) or \
+            any(character in args.files[0] for character in "*?["):
+        if args.connect or args.profile:
+            parser.error("Bro, --connect and --profile run one file at a time")
+        sys.exit(run_batch(args))
+    args.filename = args.files[0]
+    if args.stream:
+        if args.connect or args.profile:
+            parser.error("Bro, --stream doesn't go with --connect or --profile")
+        run_streaming(args)
+    elif args.connect:
+        if args.profile:
+            parser.error("Bro, --profile only works on programs run here, not with --connect")
+        run_remote(args)
+    else:
+        run_local(args)
+
+def run_remote(args):
+    """Run the file on the --serve daemon, streaming its output."""
+    request = {
+        'engine': args.engine,
+        'max_steps': args.max_steps and int(args.max_steps),
+        'timeout': args.timeout,
+        'max_output': args.max_output and int(args.max_output),
+        'no_cache': args.no_cache,
+        'cache_dir': args.cache_dir and os.path.abspath(args.cache_dir),
+    }
+    try:
+        if args.send_source:
+            with open(args.filename, 'r') as file:
+                request['source'] = file.read()
+        else:
+            request['path'] = os.path.abspath(args.filename)
+        result = connect(args.socket, request)
+    except Exception as e:
+        print(f"Error: {e}")
         return
+    if not result['success']:
+        print(f"Error: {result['error']}")
+
+def run_batch(args):
+    """Run every file in a worker pool and print the JSON summary; returns the exit status."""
+    import json
+    from lang.batch import expand_paths, run_files
+    from lang.budget import ExecutionBudget
+
+    try:
+        paths = expand_paths(args.files)
+    except FileNotFoundError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    budget = ExecutionBudget(
+        max_steps=args.max_steps and int(args.max_steps),
+        timeout=args.timeout,
+        max_output=args.max_output and int(args.max_output),
+    )
+    summary = run_files(paths, args.jobs, args.engine, args.timeout, budget)
+    print(json.dumps(summary, indent=2))
+    print(f"{summary['passed']} of {summary['files']} files ran cleanly in {summary['seconds']:.2f}s "
+          f"on {summary['jobs']} workers", file=sys.stderr)
+    return 1 if summary['failed'] else 0
+
+def run_streaming(args):
+    """Run the file statement by statement as it is read, printing output as it comes."""
+    from lang.interpreter import Interpreter
+    from lang.budget import ExecutionBudget
+    from lang.stream import run_stream
+
+    budget = ExecutionBudget(
+        max_steps=args.max_steps and int(args.max_steps),
+        timeout=args.timeout,
+        max_output=args.max_output and int(args.max_output),
+    )
+    try:
+        interpreter = Interpreter(args.engine, budget)
+        interpreter.set_callbacks(None, print)
+        if args.filename == "-":
+            run_stream(sys.stdin, interpreter)
+        else:
+            with open(args.filename, 'r') as file:
+                run_stream(file, interpreter)
+    except Exception as e:
+        print(f"Error: {e}")
+
+def run_local(args):
+    from lang.interpreter import Interpreter
+    from lang.budget import ExecutionBudget
+    from lang.profiler import ProfilingInterpreter
+    from lang.artifact import load_or_compile
 
-    filename = sys.argv[1]
+    budget = ExecutionBudget(
+        max_steps=args.max_steps and int(args.max_steps),
+        timeout=args.timeout,
+        max_output=args.max_output and int(args.max_output),
+    )
     try:
-        with open(filename, 'r') as file:
-            code = file.read()
-            tokens = tokenize(code)
-            ast = parse(tokens)
-            interpreter = Interpreter()
+        if args.no_cache:
+            with open(args.filename, 'r') as file:
+                ast = compile_source(file.read())
+        else:
+            ast = load_or_compile(args.filename, compile_source, args.cache_dir)
+        if args.profile:
+            interpreter = ProfilingInterpreter(budget)
+        else:
+            interpreter = Interpreter(args.engine, budget)
+        try:
             output = interpreter.visit(ast)
             print(output)
+        finally:
+            if args.profile:
+                with open(args.filename, 'r') as file:
+                    print_profile(interpreter.profile, file.read(), args)
     except Exception as e:
         print(f"Error: {e}")
 
@@ -0,0 +1,128 @@
+import threading
+import time
+
+# Defaults for runs that don't ask for their own limits
+DEFAULT_MAX_STEPS = 10_000_000
+DEFAULT_MAX_OUTPUT = 1024 * 1024  # characters
+
+# Engines only report steps back every this many steps, which is when limits are checked
+CHECK_INTERVAL = 1000
+
+# List operations count a step per this many elements they touch
+ELEMENTS_PER_STEP = 10
+
+# The budget of the run on each thread, which lang.arrays charges for list work
+active = threading.local()
+
+
+def charge_elements(count):
+    """Charge list work over `count` elements to the budget of the run on this thread, if any."""
+    budget = getattr(active, "budget", None)
+    if budget is not None:
+        budget.charge_elements(count)
+
+
+class BudgetExceeded(RuntimeError):
+    """A run went over one of its limits; `kind` is "steps", "time" or "output"."""
+
+    def __init__(self, kind, message):
+        super().__init__(message)
+        self.kind = kind
+
+
+class ExecutionBudget:
+    """
+    Limits for one run of a program: executed steps, wall-clock seconds and
+    characters of output. None switches a limit off.
+
+    A step is one executed statement or one while loop iteration. Engines
+    count steps down from an allowance in a local and only call checkpoint()
+    once it runs out, so the limits cost a subtraction per block of code.
+    List operations, where one statement can touch millions of elements,
+    also count ELEMENTS_PER_STEP elements as a step and check the limits
+    straight away, through charge_elements().
+    """
+
+    def __init__(self, max_steps=DEFAULT_MAX_STEPS, timeout=None, max_output=DEFAULT_MAX_OUTPUT):
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.max_output = max_output
+        self.start()
+
+    def start(self):
+        """Reset the counters and the deadline for a new run on this thread."""
+        self.steps = 0
+        self.elements = 0  # elements of list work not yet counted as a step
+        self.output_size = 0
+        self.exceeded = None
+        self.started = time.monotonic()
+        self.deadline = self.started + self.timeout if self.timeout else None
+        self.allowance = self.grant()
+        self.activate()
+
+    def activate(self):
+        """Make this the budget list work on this thread is charged to, e.g. when a paused run resumes."""
+        active.budget = self
+
+    def grant(self):
+        if self.max_steps is None:
+            return CHECK_INTERVAL
+        return min(CHECK_INTERVAL, self.max_steps - self.steps)
+
+    def checkpoint(self, left):
+        """
+        Called by an engine whose step countdown went below zero, with what is
+        left of it. Checks every limit and returns the next allowance.
+        """
+        self.steps += self.allowance - left
+        self.allowance = left  # so an engine settling after a failed check adds nothing twice
+        self.check()
+        self.allowance = self.grant()
+        return self.allowance
+
+    def charge_elements(self, count):
+        """Count list work over `count` elements, checking the limits as soon as it makes a step."""
+        steps, self.elements = divmod(self.elements + count, ELEMENTS_PER_STEP)
+        if steps:
+            self.steps += steps
+            self.check()
+
+    def check(self):
+        if self.max_steps is not None and self.steps > self.max_steps:
+            self.steps = self.max_steps
+            self.fail("steps", f"Bro, your program ran for more than {self.max_steps} steps, chill")
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self.fail("time", f"Bro, your program ran out of time ({self.timeout}s)")
+
+    def settle(self, left):
+        """
+        Record the steps of a finished run without checking the limits.
+        Engines also settle when a run fails, so its stats count its steps.
+        """
+        self.steps += self.allowance - left
+        self.allowance = left
+
+    def charge_output(self, text):
+        self.output_size += len(text) + 1  # and the newline it is joined with
+        if self.max_output is not None and self.output_size > self.max_output:
+            self.fail("output", f"Bro, your program printed more than {self.max_output} characters")
+
+    def extend(self, seconds):
+        """Push the deadline back, e.g. by the time spent waiting for input."""
+        if self.deadline is not None:
+            self.deadline += seconds
+
+    def fail(self, kind, message):
+        self.exceeded = kind
+        raise BudgetExceeded(kind, message)
+
+    def stats(self):
+        return {
+            'steps': self.steps,
+            'elapsed': round(time.monotonic() - self.started, 3),
+            'output_size': self.output_size,
+            'max_steps': self.max_steps,
+            'timeout': self.timeout,
+            'max_output': self.max_output,
+            'exceeded': self.exceeded,
+        }
@@ -0,0 +1,171 @@
+import hashlib
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+def normalize_source(code):
+    """
+    Canonical form of submitted source: Windows line endings become '\n' and
+    trailing whitespace is dropped. Neither changes the line a token sits on.
+    """
+    return code.replace("\r\n", "\n").rstrip()
+
+
+def source_key(code):
+    """Cache key for already-normalized source."""
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+
+def result_key(code, context):
+    """ResultCache key for running `code`; `context` is a tuple of everything else the result depends on."""
+    return source_key(f"{context!r}\n{normalize_source(code)}")
+
+
+class ProgramCache:
+    """
+    Thread-safe LRU cache of compiled programs keyed by a hash of their
+    normalized source.
+
+    Bounded by entry count and by the total size of the cached sources,
+    which is a cheap stand-in for the size of their ASTs. Least recently
+    used entries are evicted first.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (program, size)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = Lock()
+
+    def get_or_compile(self, code, compile_source):
+        """
+        Return the compiled program for `code`, calling compile_source() with
+        the normalized source on a miss. Compile errors propagate and are
+        not cached.
+        """
+        code = normalize_source(code)
+        key = source_key(code)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # Compile outside the lock so one slow program doesn't stall every request
+        program = compile_source(code)
+        self.put(key, program, len(code))
+        return program
+
+    def put(self, key, program, size):
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (program, size)
+            self.total_bytes += size
+            while self.entries and (len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes):
+                evicted_key, (evicted, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache of {'success', 'output'} results of runs that
+    come out the same every time: programs that never ask for input, run on
+    the same engine version under the same budget. Keys come from
+    result_key(). Only successful runs are kept, since a failure may be a
+    timeout that depended on how busy the server was.
+
+    Bounded by entry count and by the total size of the cached outputs,
+    least recently used first. An entry older than `ttl` seconds is
+    dropped when it is next looked up.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=16 * 1024 * 1024, ttl=300):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (result, size, expiry)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.lock = Lock()
+
+    def get(self, key):
+        """The cached result for `key`, or None."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[2] <= time.monotonic():
+                del self.entries[key]
+                self.total_bytes -= entry[1]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[0])
+
+    def put(self, key, result):
+        """Keep `result` for `key` if it is a successful run."""
+        if not result.get('success'):
+            return
+        result = {'success': True, 'output': result['output']}
+        size = len(result['output'])
+        if size > self.max_bytes:
+            return  # it would only push everything else out and then itself
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (result, size, time.monotonic() + self.ttl)
+            self.total_bytes += size
+            while self.entries and (len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes):
+                evicted_key, (evicted, evicted_size, expiry) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
@@ -0,0 +1,270 @@
+from array import array
+
+from lang.parser import *
+from lang.resolver import resolve
+
+# Opcodes. Every instruction is an (opcode, argument) pair in CodeObject.code,
+# except the tests below, which take a second pair.
+LOAD_CONST = 0      # push constants[arg]
+LOAD_NAME = 1       # push the variable in frame slot arg
+STORE_NAME = 2      # pop into frame slot arg
+BINARY_OP = 3       # pop right, pop left, push BINARY_OPERATORS[arg](left, right); arg is the node's op code
+BINARY_OP_STORE = 4 # like BINARY_OP, then store into frame slot arg >> OPERATOR_BITS instead of pushing
+JUMP = 5            # jump to arg
+STEP = 6            # count arg executed steps against the run's ExecutionBudget
+PRINT = 7           # pop and print
+INPUT = 8           # read input into frame slot arg
+# Superinstructions for binary operations on constants and variables. The argument
+# packs the operator index in the low bits, the right operand's index above it and,
+# for NAME_OP_*, the left variable's index above that.
+BINARY_OP_CONST = 9   # left from the stack, right is a constant
+BINARY_OP_NAME = 10   # left from the stack, right is a variable
+NAME_OP_CONST = 11    # left is a variable, right is a constant
+NAME_OP_NAME = 12     # both sides are variables
+CONCAT = 13           # pop arg values and push them joined as strings
+BUILD_LIST = 14       # pop arg values and push them as a list
+INDEX = 15            # pop the index, pop the list or string, push the element
+CALL = 16             # pop arg >> OPERATOR_BITS arguments, push FUNCTIONS[arg & OPERATOR_MASK] called on them
+NAME_OP_CONST_UPDATE = 17  # 'x = x op constant': NAME_OP_CONST stored back into the left variable
+# Tests end if and while statements and are followed by a (target, steps) pair.
+# BRANCH jumps to target when its condition is falsy and otherwise charges the
+# if body's steps; LOOP sits at the bottom of a while loop and, when its
+# condition holds, charges the iteration's steps and jumps back to the body.
+# The fused forms compute a NAME_OP_CONST or NAME_OP_NAME condition themselves.
+BRANCH = 18                # condition popped from the stack
+LOOP = 19
+NAME_OP_CONST_BRANCH = 20
+NAME_OP_NAME_BRANCH = 21
+NAME_OP_CONST_LOOP = 22
+NAME_OP_NAME_LOOP = 23
+TESTS = frozenset((BRANCH, LOOP, NAME_OP_CONST_BRANCH, NAME_OP_NAME_BRANCH, NAME_OP_CONST_LOOP, NAME_OP_NAME_LOOP))
+OPERATOR_BITS = 4
+OPERATOR_MASK = (1 << OPERATOR_BITS) - 1
+OPERAND_MASK = (1 << 28) - 1
+LEFT_SHIFT = OPERATOR_BITS + 28
+
+OPCODE_NAMES = (
+    "LOAD_CONST", "LOAD_NAME", "STORE_NAME", "BINARY_OP", "BINARY_OP_STORE",
+    "JUMP", "STEP", "PRINT", "INPUT",
+    "BINARY_OP_CONST", "BINARY_OP_NAME", "NAME_OP_CONST", "NAME_OP_NAME", "CONCAT",
+    "BUILD_LIST", "INDEX", "CALL", "NAME_OP_CONST_UPDATE",
+    "BRANCH", "LOOP", "NAME_OP_CONST_BRANCH", "NAME_OP_NAME_BRANCH", "NAME_OP_CONST_LOOP", "NAME_OP_NAME_LOOP",
+)
+
+
+class CodeObject:
+    """A compiled Bro program: flat instruction array plus constant and name tables."""
+
+    def __init__(self, code, constants, names):
+        self.code = code              # array of opcode/argument pairs
+        self.constants = constants    # literal values, referenced by LOAD_CONST
+        self.names = names            # variable name of each frame slot, for errors and listings
+
+    def disassemble(self):
+        """Human-readable listing of the instructions, handy when debugging the compiler."""
+        lines = []
+        pc = 0
+        while pc < len(self.code):
+            opcode, argument = self.code[pc], self.code[pc + 1]
+            if opcode == LOAD_CONST:
+                detail = repr(self.constants[argument])
+            elif opcode in (LOAD_NAME, STORE_NAME, INPUT):
+                detail = self.names[argument]
+            elif opcode == BINARY_OP:
+                detail = OPERATORS[argument]
+            elif opcode == BINARY_OP_STORE:
+                detail = f"{OPERATORS[argument & OPERATOR_MASK]} -> {self.names[argument >> OPERATOR_BITS]}"
+            elif opcode == BINARY_OP_CONST:
+                detail = f"{OPERATORS[argument & OPERATOR_MASK]} {self.constants[argument >> OPERATOR_BITS]!r}"
+            elif opcode == BINARY_OP_NAME:
+                detail = f"{OPERATORS[argument & OPERATOR_MASK]} {self.names[argument >> OPERATOR_BITS]}"
+            elif opcode in (BRANCH, LOOP):
+                detail = "if" if opcode == BRANCH else "while"
+            elif opcode in (NAME_OP_CONST, NAME_OP_NAME, NAME_OP_CONST_UPDATE) or opcode in TESTS:
+                right = (argument >> OPERATOR_BITS) & OPERAND_MASK
+                constant = opcode in (NAME_OP_CONST, NAME_OP_CONST_UPDATE, NAME_OP_CONST_BRANCH, NAME_OP_CONST_LOOP)
+                right = repr(self.constants[right]) if constant else self.names[right]
+                detail = f"{self.names[argument >> LEFT_SHIFT]} {OPERATORS[argument & OPERATOR_MASK]} {right}"
+            elif opcode == CALL:
+                detail = f"{FUNCTIONS[argument & OPERATOR_MASK]} ({argument >> OPERATOR_BITS} arguments)"
+            else:
+                detail = str(argument)
+            if opcode in TESTS:
+                detail = f"{detail} -> {self.code[pc + 2]}, {self.code[pc + 3]} steps"
+                lines.append(f"{pc:>6} {OPCODE_NAMES[opcode]:<20} {detail}")
+                pc += 4
+                continue
+            lines.append(f"{pc:>6} {OPCODE_NAMES[opcode]:<20} {detail}")
+            pc += 2
+        return "\n".join(lines)
+
+
+class Compiler:
+    """Lowers a parsed Program into a CodeObject for lang.vm."""
+
+    def __init__(self):
+        self.code = array("q")
+        self.constants = []
+        self.constant_index = {}
+
+    def compile(self, program):
+        # Variables are addressed by the frame slots lang.resolver assigns
+        resolve(program)
+        self.compile_block(program.statements)
+        return CodeObject(self.code, self.constants, program.slot_names)
+
+    def emit(self, opcode, argument=0):
+        """Append an instruction and return its position so jumps can be patched."""
+        position = len(self.code)
+        self.code.append(opcode)
+        self.code.append(argument)
+        return position
+
+    def patch(self, position, target):
+        self.code[position + 1] = target
+
+    def patch_test(self, position, target):
+        self.code[position + 2] = target
+
+    def constant(self, value):
+        # Key on the type too, so 1, 1.0 and True stay distinct constants
+        key = (type(value), value)
+        index = self.constant_index.get(key)
+        if index is None:
+            index = self.constant_index[key] = len(self.constants)
+            self.constants.append(value)
+        return index
+
+    def compile_block(self, statements, steps=0):
+        """Compile statements, charging the budget for them (plus `steps`) on entry."""
+        if statements or steps:
+            self.emit(STEP, len(statements) + steps)
+        for statement in statements:
+            self.compile_statement(statement)
+
+    def compile_statement(self, node):
+        if isinstance(node, PrintStatement):
+            self.compile_expression(node.expression)
+            self.emit(PRINT)
+
+        elif isinstance(node, VariableDeclaration):
+            value = node.value
+            if isinstance(value, Literal) and value.value == "INPUT":
+                self.emit(INPUT, node.slot)
+            elif (isinstance(value, BinaryOperation) and isinstance(value.left, VariableReference)
+                    and value.left.slot == node.slot and isinstance(value.right, Literal)):
+                operand = self.constant(value.right.value)
+                self.emit(NAME_OP_CONST_UPDATE, (node.slot << LEFT_SHIFT) | (operand << OPERATOR_BITS) | value.op)
+            else:
+                self.compile_expression(value)
+                if self.code[-2] == BINARY_OP:
+                    self.code[-2] = BINARY_OP_STORE
+                    self.code[-1] |= node.slot << OPERATOR_BITS
+                else:
+                    self.emit(STORE_NAME, node.slot)
+
+        elif isinstance(node, WhileLoop):
+            # The test sits at the bottom, so an iteration runs one instruction of loop overhead
+            entry = self.emit(JUMP)
+            body = len(self.code)
+            for statement in node.body:
+                self.compile_statement(statement)
+            self.patch(entry, len(self.code))
+            self.compile_test(node.condition, LOOP, body, len(node.body) + 1)  # the iteration is a step too
+
+        elif isinstance(node, IfStatement):
+            else_jump = self.compile_test(node.condition, BRANCH, 0, len(node.if_body))
+            for statement in node.if_body:
+                self.compile_statement(statement)
+            if node.else_body:
+                end_jump = self.emit(JUMP)
+                self.patch_test(else_jump, len(self.code))
+                self.compile_block(node.else_body)
+                self.patch(end_jump, len(self.code))
+            else:
+                self.patch_test(else_jump, len(self.code))
+
+        else:
+            raise TypeError(f"Bro, I don't know how to compile this: {node}")
+
+    def compile_test(self, condition, opcode, target, steps):
+        """Emit a BRANCH or LOOP test of `condition`, fused with it where possible; returns its position."""
+        left, right = getattr(condition, "left", None), getattr(condition, "right", None)
+        if isinstance(condition, BinaryOperation) and isinstance(left, VariableReference) and \
+                isinstance(right, (Literal, VariableReference)):
+            if isinstance(right, Literal):
+                opcode, operand = (NAME_OP_CONST_BRANCH if opcode == BRANCH else NAME_OP_CONST_LOOP), self.constant(right.value)
+            else:
+                opcode, operand = (NAME_OP_NAME_BRANCH if opcode == BRANCH else NAME_OP_NAME_LOOP), right.slot
+            position = self.emit(opcode, (left.slot << LEFT_SHIFT) | (operand << OPERATOR_BITS) | condition.op)
+        else:
+            self.compile_expression(condition)
+            position = self.emit(opcode)
+        self.emit(target, steps)
+        return position
+
+    def compile_expression(self, node):
+        # Post-order walk with an explicit stack so deep trees can't blow the recursion limit
+        pending = [(node, False)]
+        while pending:
+            node, operands_done = pending.pop()
+            if isinstance(node, Literal):
+                self.emit(LOAD_CONST, self.constant(node.value))
+            elif isinstance(node, VariableReference):
+                self.emit(LOAD_NAME, node.slot)
+            elif isinstance(node, BinaryOperation):
+                operator = node.op
+                left, right = node.left, node.right
+                if operands_done:
+                    self.emit(BINARY_OP, operator)
+                elif isinstance(left, VariableReference) and isinstance(right, (Literal, VariableReference)):
+                    if isinstance(right, Literal):
+                        opcode, operand = NAME_OP_CONST, self.constant(right.value)
+                    else:
+                        opcode, operand = NAME_OP_NAME, right.slot
+                    self.emit(opcode, (left.slot << LEFT_SHIFT) | (operand << OPERATOR_BITS) | operator)
+                elif isinstance(right, Literal):
+                    pending.append((BINARY_OP_CONST, (self.constant(right.value) << OPERATOR_BITS) | operator))
+                    pending.append((left, False))
+                elif isinstance(right, VariableReference):
+                    pending.append((BINARY_OP_NAME, (right.slot << OPERATOR_BITS) | operator))
+                    pending.append((left, False))
+                else:
+                    pending.append((node, True))
+                    pending.append((right, False))
+                    pending.append((left, False))
+            elif isinstance(node, Concat):
+                if operands_done:
+                    self.emit(CONCAT, len(node.parts))
+                else:
+                    pending.append((node, True))
+                    pending.extend((part, False) for part in reversed(node.parts))
+            elif isinstance(node, ListLiteral):
+                if operands_done:
+                    self.emit(BUILD_LIST, len(node.elements))
+                else:
+                    pending.append((node, True))
+                    pending.extend((element, False) for element in reversed(node.elements))
+            elif isinstance(node, Index):
+                if operands_done:
+                    self.emit(INDEX)
+                else:
+                    pending.append((node, True))
+                    pending.append((node.index, False))
+                    pending.append((node.target, False))
+            elif isinstance(node, Call):
+                if operands_done:
+                    self.emit(CALL, (len(node.arguments) << OPERATOR_BITS) | node.function)
+                else:
+                    pending.append((node, True))
+                    pending.extend((argument, False) for argument in reversed(node.arguments))
+            elif isinstance(node, int):
+                # A fused instruction queued above, emitted once its left operand is on the stack
+                self.emit(node, operands_done)
+            else:
+                raise TypeError(f"Bro, I don't know how to evaluate this: {node}")
+
+
+def compile_program(program):
+    """Compile a parsed Program into bytecode."""
+    return Compiler().compile(program)
@@ -0,0 +1,166 @@
+"""
+A warm process that runs Bro programs for `bro_lang.py --connect` clients.
+
+`bro_lang.py --serve` listens on a Unix socket with lang already imported.
+Every connection is one run, in a child forked from the warm server, so
+runs go in parallel, can't disturb each other and never pay for startup.
+
+The protocol is JSON, one object per line. The client sends the request:
+
+    {"path": "/abs/file.bro"} or {"source": "yo bro ..."},
+    plus optional "engine", "max_steps", "timeout" and "max_output"
+
+and the server answers with events until the run ends:
+
+    {"event": "output", "line": "..."}   a line the program printed
+    {"event": "input"}                   'bro ask' wants a line; the client
+                                         replies {"input": "..."}, or
+                                         {"input": null} when it has none
+    {"event": "done", "success": true}   or with "error": "..."
+
+Only the client half is imported by `--connect`, and it needs nothing but
+the standard library, so a client starts about as fast as Python does.
+"""
+import json
+import os
+import socket
+import sys
+
+DEFAULT_SOCKET = os.environ.get("BRO_SOCKET") or os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR") or "/tmp", f"bro-{os.getuid() if hasattr(os, 'getuid') else 'user'}.sock"
+)
+
+
+def send(file, **message):
+    file.write(json.dumps(message).encode("utf-8") + b"\n")
+    file.flush()
+
+
+def receive(file):
+    line = file.readline()
+    return json.loads(line) if line else None
+
+
+def connect(socket_path, request, output=sys.stdout, read_line=sys.stdin.readline):
+    """
+    Run `request` on the daemon at `socket_path`, writing the program's
+    output as it arrives and answering its input requests with read_line().
+    Returns the 'done' event.
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+    except OSError:
+        client.close()
+        raise ConnectionError(f"Bro, nothing is serving on {socket_path}; start it with --serve") from None
+    with client, client.makefile("rwb") as file:
+        send(file, **request)
+        while True:
+            event = receive(file)
+            if event is None:
+                return {'event': 'done', 'success': False, 'error': "Bro, the daemon hung up on us"}
+            if event['event'] == 'output':
+                output.write(event['line'] + "\n")
+                output.flush()
+            elif event['event'] == 'input':
+                line = read_line()
+                send(file, input=line.rstrip("\n") if line else None)
+            elif event['event'] == 'done':
+                return event
+
+
+def run_request(request, reader, writer, compile_source):
+    """Run one client's request in this (forked) process, sending events to `writer`."""
+    from lang.artifact import load_or_compile
+    from lang.budget import DEFAULT_MAX_OUTPUT, DEFAULT_MAX_STEPS, ExecutionBudget
+    from lang.interpreter import Interpreter
+
+    def read_input():
+        send(writer, event='input')
+        reply = receive(reader)
+        if reply is None or reply.get('input') is None:
+            raise RuntimeError("Bro, you ran out of input")
+        return reply['input']
+
+    try:
+        budget = ExecutionBudget(
+            max_steps=request.get('max_steps', DEFAULT_MAX_STEPS),
+            timeout=request.get('timeout'),
+            max_output=request.get('max_output', DEFAULT_MAX_OUTPUT),
+        )
+        interpreter = Interpreter(request.get('engine', "tree"), budget)
+        interpreter.set_callbacks(read_input, lambda line: send(writer, event='output', line=line))
+        if 'source' in request:
+            program = compile_source(request['source'])
+        elif request.get('no_cache'):
+            with open(request['path'], 'r') as source:
+                program = compile_source(source.read())
+        else:
+            program = load_or_compile(request['path'], compile_source, request.get('cache_dir'))
+        interpreter.visit(program)
+    except Exception as e:
+        send(writer, event='done', success=False, error=str(e))
+    else:
+        send(writer, event='done', success=True)
+
+
+def serve(socket_path, compile_source, max_children=None):
+    """Serve runs on `socket_path` until interrupted, `max_children` at a time."""
+    import socketserver
+
+    # Bind the daemon's imports, compile_source's included, before the first fork, so children start warm
+    import lang.artifact, lang.interpreter, lang.lexer, lang.optimizer, lang.parser  # noqa: F401
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            try:
+                request = receive(self.rfile)
+            except ValueError:
+                request = None
+            if not isinstance(request, dict) or not ('path' in request or 'source' in request):
+                send(self.wfile, event='done', success=False, error="Bro, send a path or some source")
+                return
+            try:
+                run_request(request, self.rfile, self.wfile, compile_source)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the client left; nobody to tell
+
+    mixin = socketserver.ForkingMixIn if hasattr(os, "fork") else socketserver.ThreadingMixIn
+
+    class Server(mixin, socketserver.UnixStreamServer):
+        daemon_threads = True
+        block_on_close = False
+
+    if max_children:
+        Server.max_children = max_children
+
+    remove_stale_socket(socket_path)
+    # Only this user may connect: whoever can, can run code as us
+    umask = os.umask(0o077)
+    try:
+        server = Server(socket_path, Handler)
+    finally:
+        os.umask(umask)
+    print(f"Bro is serving on {socket_path}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
+
+
+def remove_stale_socket(socket_path):
+    """Remove a socket file left by a daemon that died, refusing to steal a live one."""
+    if not os.path.exists(socket_path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except OSError:
+        os.unlink(socket_path)
+    else:
+        raise RuntimeError(f"Bro, something is already serving on {socket_path}")
+    finally:
+        probe.close()
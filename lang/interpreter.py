@@ -1,73 +1,140 @@
+import time
+
 from lang.parser import *
+from lang.budget import ExecutionBudget
+from lang.options import ENGINES
+from lang.resolver import UNDEFINED, resolve
+from lang.compiler import compile_program
+from lang.vm import VirtualMachine
+from lang.transpiler import PythonRunner, compile_to_python
+from lang.strings import BUILD_THRESHOLD, StringBuilder, concatenate
+from lang.arrays import Array, BUILTIN_FUNCTIONS, index, make_array
+from lang.quicken import (
+    INT_OPERATORS, GenericOperation, IntNameConstant, IntNameName, IntOperation, StringConcat, quicken,
+)
+
+# Bumped whenever a change to the language or the engines changes what some program
+# prints, so results cached for an older version (lang.cache.ResultCache) aren't served
+ENGINE_VERSION = 1
 
 class Interpreter:
-    def __init__(self):
-        self.variables = {}  # Stores variable values
+    def __init__(self, engine="tree", budget=None):
+        if engine not in ENGINES:
+            raise ValueError(f"Bro, unknown engine: {engine}")
+        self.engine = engine  # "tree" walks the AST, "vm" runs bytecode, "python" runs transpiled Python
+        self.slot_names = []  # Variable name of each frame slot
+        self.frame = []       # Variable values by slot, UNDEFINED until assigned
         self.output = []     # Stores output for print statements
         self.debug_mode = False  # Add debug mode flag
         self.input_callback = None  # Callback for getting input
         self.output_callback = None  # Callback for sending output
+        self.budget = budget or ExecutionBudget()  # Step, time and output limits of each run
+        self.steps_left = 0  # Tree walker's countdown to the budget's next checkpoint
 
     def reset(self):
         """Reset interpreter state for a new execution."""
-        self.variables = {}
+        self.slot_names = []
+        self.frame = []
         self.output = []
 
+    @property
+    def variables(self):
+        """Variable values by name, read from the frame."""
+        return {name: value for name, value in zip(self.slot_names, self.frame) if value is not UNDEFINED}
+
+    def load_frame(self, program):
+        """Resolve the program's variable slots and lay out a frame for them, keeping values already set."""
+        previous = self.variables
+        resolve(program)
+        self.slot_names = program.slot_names
+        self.frame = [previous.get(name, UNDEFINED) for name in self.slot_names]
+
     def set_callbacks(self, input_callback=None, output_callback=None):
         """Set callbacks for input and output."""
         self.input_callback = input_callback
         self.output_callback = output_callback
 
+    def emit(self, value):
+        """Record a line of program output and pass it to the output callback."""
+        self.budget.charge_output(value)
+        self.output.append(value)
+        if self.output_callback:
+            self.output_callback(value)
+
+    def read_input(self, name):
+        """Read a value for `name`; digit strings become ints."""
+        started = time.monotonic()
+        if self.input_callback:
+            user_input = self.input_callback()
+        else:
+            user_input = input(f"Bro, enter a value for {name}: ")
+        self.budget.extend(time.monotonic() - started)  # waiting on the user isn't run time
+        return self.convert_input(user_input)
+
+    @staticmethod
+    def convert_input(user_input):
+        """Digit strings become ints; anything else stays as typed."""
+        try:
+            return int(user_input) if user_input.isdigit() else user_input
+        except ValueError:
+            return user_input
+
+    def start(self, program):
+        """
+        Run `program` until its first 'bro ask' without blocking for input,
+        and return a Continuation to resume it. Suspendable runs always use
+        the VM, whose state is just a program counter and a stack.
+        """
+        self.load_frame(program)
+        self.budget.start()
+        return Continuation(self, VirtualMachine(self).execute(compile_program(program))).advance()
+
     def visit(self, node):
         if isinstance(node, Program):
+            self.load_frame(node)
+            self.budget.start()
+            if self.engine == "vm":
+                return VirtualMachine(self).run(compile_program(node))
+            if self.engine == "python":
+                try:
+                    function = compile_to_python(node)
+                except (RecursionError, MemoryError, SyntaxError):
+                    # Nested too deeply for CPython's compiler; the VM compiles iteratively
+                    return VirtualMachine(self).run(compile_program(node))
+                return PythonRunner(self).run(function)
             if self.debug_mode:
                 print("\n=== Starting Program Execution ===\n")
-            for statement in node.statements:
-                if self.debug_mode:
-                    print("Current Variables:", self.variables)
-                    print("Executing:", self._get_statement_description(statement))
-                self.visit(statement)
-                if self.debug_mode:
-                    print("Output:", self.output[-1] if self.output else "No output")
-                    print("-" * 50)
+            self.steps_left = self.budget.allowance
+            try:
+                self.charge(len(node.statements))
+                for statement in node.statements:
+                    if self.debug_mode:
+                        print("Current Variables:", self.variables)
+                        print("Executing:", self._get_statement_description(statement))
+                    self.visit(statement)
+                    if self.debug_mode:
+                        print("Output:", self.output[-1] if self.output else "No output")
+                        print("-" * 50)
+            finally:
+                self.budget.settle(self.steps_left)
             if self.debug_mode:
                 print("\n=== Program Execution Completed ===\n")
             return "\n".join(self.output)
 
         elif isinstance(node, PrintStatement):
-            value = str(self.evaluate(node.expression))
-            self.output.append(value)
-            if self.output_callback:
-                self.output_callback(value)
+            self.emit(str(self.evaluate(node.expression)))
 
         elif isinstance(node, VariableDeclaration):
             if isinstance(node.value, Literal) and node.value.value == "INPUT":
-                if self.input_callback:
-                    user_input = self.input_callback()
-                    try:
-                        self.variables[node.name] = int(user_input) if user_input.isdigit() else user_input
-                    except ValueError:
-                        self.variables[node.name] = user_input
-                else:
-                    user_input = input(f"Bro, enter a value for {node.name}: ")
-                    try:
-                        self.variables[node.name] = int(user_input) if user_input.isdigit() else user_input
-                    except ValueError:
-                        self.variables[node.name] = user_input
+                self.frame[node.slot] = self.read_input(node.name)
             else:
-                self.variables[node.name] = self.evaluate(node.value)
+                self.frame[node.slot] = self.evaluate(node.value)
 
         elif isinstance(node, WhileLoop):
-            max_iterations = 1000  # Safety limit
             iteration_count = 0
+            steps = len(node.body) + 1  # the iteration and its statements
             while self.evaluate(node.condition):
-                if iteration_count >= max_iterations:
-                    raise RuntimeError("Bro, your while loop exceeded the maximum number of iterations!")
-                if iteration_count >= 10:
-                    self.output.append("Bro, I ain’t doing allat")
-                    if self.output_callback:
-                        self.output_callback("Bro, I ain’t doing allat")
-                    break  # Stop the loop after 10 iterations
+                self.charge(steps)  # runaway loops end when the budget runs out
                 if self.debug_mode:
                     print(f"While Loop Iteration {iteration_count + 1}")
                 iteration_count += 1
@@ -79,54 +146,111 @@ class Interpreter:
             if self.debug_mode:
                 print(f"IF condition evaluated to: {condition_result}")
             if condition_result:
+                self.charge(len(node.if_body))
                 for statement in node.if_body:
                     self.visit(statement)
             elif node.else_body:
+                self.charge(len(node.else_body))
                 for statement in node.else_body:
                     self.visit(statement)
 
+    def charge(self, steps):
+        """Count executed steps against the budget, checking it when the allowance runs out."""
+        self.steps_left -= steps
+        if self.steps_left < 0:
+            self.steps_left = self.budget.checkpoint(self.steps_left)
+
     def evaluate(self, node):
         if isinstance(node, Literal):
             return node.value
 
         elif isinstance(node, VariableReference):
-            if node.name not in self.variables:
+            value = self.frame[node.slot]
+            if value is UNDEFINED:
                 raise NameError(f"Bro, variable '{node.name}' is not defined")
-            return self.variables[node.name]
+            return value
 
         elif isinstance(node, BinaryOperation):
+            # Quickened nodes try their specialized path first; see lang.quicken
+            kind = node.__class__
+            if kind is IntNameConstant:
+                left_value = self.frame[node.left.slot]
+                if type(left_value) is int:
+                    return INT_OPERATORS[node.op](left_value, node.right.value)
+                node.__class__ = kind = GenericOperation
+            elif kind is IntNameName:
+                left_value = self.frame[node.left.slot]
+                right_value = self.frame[node.right.slot]
+                if type(left_value) is int and type(right_value) is int:
+                    return INT_OPERATORS[node.op](left_value, right_value)
+                node.__class__ = kind = GenericOperation
+
             left_value = self.evaluate(node.left)
             right_value = self.evaluate(node.right)
 
-            if node.operator == "+":
-                if isinstance(left_value, str) or isinstance(right_value, str):
-                    return str(left_value) + str(right_value)
+            if kind is IntOperation:
+                if type(left_value) is int and type(right_value) is int:
+                    return INT_OPERATORS[node.op](left_value, right_value)
+                node.__class__ = GenericOperation
+            elif kind is StringConcat:
+                left_type, right_type = type(left_value), type(right_value)
+                if left_type is str and len(left_value) < BUILD_THRESHOLD:
+                    return left_value + (right_value if right_type is str else str(right_value))
+                if left_type is str or left_type is StringBuilder or right_type is str or right_type is StringBuilder:
+                    return concatenate(left_value, right_value if right_type is str else str(right_value))
+                node.__class__ = GenericOperation
+            elif kind is BinaryOperation:
+                quicken(node, left_value, right_value)
+
+            op = node.op
+            if op == OP_ADD:
+                if isinstance(left_value, (str, StringBuilder)) or isinstance(right_value, (str, StringBuilder)):
+                    return concatenate(left_value, str(right_value))
                 return left_value + right_value
-            elif node.operator == "-":
+            elif op == OP_SUB:
                 return left_value - right_value
-            elif node.operator == "*":
+            elif op == OP_MUL:
                 return left_value * right_value
-            elif node.operator == "/":
-                if right_value == 0:
+            elif op == OP_DIV:
+                if type(right_value) is not Array and right_value == 0:
                     raise ZeroDivisionError("Bro, you can't divide by zero!")
                 return left_value / right_value
-            elif node.operator == ">":
+            elif op == OP_GT:
                 return left_value > right_value
-            elif node.operator == "<":
+            elif op == OP_LT:
                 return left_value < right_value
-            elif node.operator == ">=":
+            elif op == OP_GE:
                 return left_value >= right_value
-            elif node.operator == "<=":
+            elif op == OP_LE:
                 return left_value <= right_value
-            elif node.operator == "==":
+            elif op == OP_EQ:
                 return left_value == right_value
-            elif node.operator == "!=":
+            elif op == OP_NE:
                 return left_value != right_value
-            elif node.operator == "%":
+            elif op == OP_MOD:
                 return left_value % right_value
             else:
                 raise SyntaxError(f"Bro, unsupported operator: {node.operator}")
 
+        elif isinstance(node, Concat):
+            parts = node.parts
+            first = parts[0]
+            if isinstance(first, VariableReference):
+                # 'report = report + "x" + i' appends to a long report instead of copying it
+                value = self.frame[first.slot]
+                if type(value) is StringBuilder or (type(value) is str and len(value) >= BUILD_THRESHOLD):
+                    return concatenate(value, *[str(self.evaluate(part)) for part in parts[1:]])
+            return "".join([str(self.evaluate(part)) for part in parts])
+
+        elif isinstance(node, ListLiteral):
+            return make_array([self.evaluate(element) for element in node.elements])
+
+        elif isinstance(node, Index):
+            return index(self.evaluate(node.target), self.evaluate(node.index))
+
+        elif isinstance(node, Call):
+            return BUILTIN_FUNCTIONS[node.function](*[self.evaluate(argument) for argument in node.arguments])
+
         raise TypeError(f"Bro, I don't know how to evaluate this: {node}")
 
     def _get_statement_description(self, statement, node):
@@ -142,6 +266,52 @@ class Interpreter:
             return "IF Statement"
         return "Unknown Statement"  # Fixed typo: 'node' to 'statement'
 
+class Continuation:
+    """
+    A run started with Interpreter.start(), paused at a 'bro ask'.
+
+    `waiting_for` names the variable the program wants, and resume(value)
+    carries on to the next 'bro ask' or the end. While it waits the run is
+    nothing but this object, so no thread is parked on it.
+    """
+
+    def __init__(self, interpreter, execution):
+        self.interpreter = interpreter
+        self.execution = execution  # the VM's generator
+        self.waiting_for = None
+        self.done = False
+        self.output = None  # joined output once done
+        self.suspended_at = None
+
+    def advance(self, value=None):
+        try:
+            self.waiting_for = self.execution.send(value)
+        except StopIteration as stop:
+            self.waiting_for = None
+            self.done = True
+            self.output = stop.value
+        except BaseException:
+            self.waiting_for = None
+            self.done = True
+            raise
+        else:
+            self.suspended_at = time.monotonic()
+        return self
+
+    def resume(self, user_input):
+        """Answer the pending 'bro ask' and run on; errors from the program propagate."""
+        if self.waiting_for is None:
+            raise RuntimeError("Bro, this program isn't waiting for input")
+        self.interpreter.budget.extend(time.monotonic() - self.suspended_at)  # waiting on the user isn't run time
+        self.interpreter.budget.activate()  # the run may resume on another thread
+        return self.advance(self.interpreter.convert_input(user_input))
+
+    def close(self):
+        """Abandon the run."""
+        self.execution.close()
+        self.waiting_for = None
+        self.done = True
+
 if __name__ == "__main__":
     from lexer import tokenize
     from parser import parse
@@ -1,4 +1,8 @@
 import re
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+from itertools import chain
 
 TOKENS = [
     ("START", r"yo bro|wassup fam|let’s roll gang"),
@@ -15,6 +19,9 @@ TOKENS = [
     ("OPERATOR", r"[+\-*/%=<>!]=?|=="),
     ("LPAREN", r"\("),
     ("RPAREN", r"\)"),
+    ("LBRACKET", r"\["),
+    ("RBRACKET", r"\]"),
+    ("COMMA", r","),
     ("LBRACE_BLOCK", r"\{"),
     ("RBRACE_BLOCK", r"\}"),
     ("NEWLINE", r"\n"),
@@ -22,31 +29,212 @@ TOKENS = [
     ("COMMENT", r"#.*"),
 ]
 
+# Token type ids used by TokenBuffer, in TOKENS order
+TOKEN_TYPES = tuple(name for name, pattern in TOKENS)
+TOKEN_TYPE_IDS = {name: type_id for type_id, name in enumerate(TOKEN_TYPES)}
+
+# Whitespace and comments never reach the parser
+SKIPPED = frozenset(("NEWLINE", "WHITESPACE", "COMMENT"))
+
+# One alternation tried in TOKENS order, so the first pattern that matches wins
+# exactly like the old pattern-by-pattern loop did
+MASTER_PATTERN = re.compile("|".join(f"(?P<{name}>{pattern})" for name, pattern in TOKENS))
+
+# Text every INPUT token contains, so most programs are ruled out without lexing them
+INPUT_TEXT = re.compile(dict(TOKENS)["INPUT"])
+
+
+class BroSyntaxError(SyntaxError):
+    """A SyntaxError in Bro source, with `lineno`/`offset` pointing into it."""
+
+    def __init__(self, message, line=None, column=None):
+        super().__init__(message)
+        self.lineno = line
+        self.offset = column
+
+    def __str__(self):
+        return self.msg
+
+
+class Token(namedtuple("Token", ("type", "value", "line", "column", "offset"))):
+    """A lexed token with its 1-based line/column and offset into the source."""
+    __slots__ = ()
+
+
+def iter_tokens(code):
+    """
+    Lazily yields tokens from source code, skipping whitespace and comments.
+    """
+    match = MASTER_PATTERN.match
+    position = 0
+    length = len(code)
+    line_number = 1
+    line_start = 0
+    while position < length:
+        found = match(code, position)
+        if found is None:
+            raise BroSyntaxError(
+                f"Yo, what even is this: {code[position]}? Line {line_number} is straight-up sus, bro!",
+                line_number, position - line_start + 1,
+            )
+        token_type = found.lastgroup
+        end = found.end()
+        if token_type == "NEWLINE":
+            line_number += 1
+            line_start = end
+        elif token_type not in SKIPPED:
+            value = found.group()
+            yield Token(token_type, value, line_number, position - line_start + 1, position)
+            if token_type == "STRING" and "\n" in value:
+                # Strings may span lines; keep positions of later tokens honest
+                line_number += value.count("\n")
+                line_start = position + value.rindex("\n") + 1
+        position = end
+
+
+def asks_for_input(code):
+    """
+    Whether `code` has an input statement, from its tokens alone. Source
+    that doesn't lex counts as not asking; compiling it reports the error.
+    """
+    if INPUT_TEXT.search(code) is None:
+        return False  # the common case, without lexing
+    try:
+        return any(token.type == "INPUT" for token in iter_tokens(code))
+    except BroSyntaxError:
+        return False
+
+
+def iter_line_tokens(lines):
+    """
+    Like iter_tokens, for source arriving a piece at a time, e.g. the lines
+    of an open file. Only the unlexed rest of the current line is held, plus
+    the lines of a string that is still open. Lines, columns and offsets
+    count from the start of the whole source.
+    """
+    match = MASTER_PATTERN.match
+    pending = ""  # text read but not lexed yet
+    base = 0  # offset of pending[0] in the whole source
+    line_number = 1
+    line_start = 0
+    for piece in chain(lines, (None,)):
+        at_end = piece is None
+        if not at_end:
+            pending += piece
+        # Only a STRING can run past a newline, so whatever starts before the last one is complete
+        limit = len(pending) if at_end else pending.rfind("\n") + 1
+        position = 0
+        while position < limit:
+            found = match(pending, position)
+            if found is None:
+                if pending[position] == '"' and not at_end:
+                    break  # the string may close in a later piece
+                raise BroSyntaxError(
+                    f"Yo, what even is this: {pending[position]}? Line {line_number} is straight-up sus, bro!",
+                    line_number, base + position - line_start + 1,
+                )
+            token_type = found.lastgroup
+            end = found.end()
+            if token_type == "NEWLINE":
+                line_number += 1
+                line_start = base + end
+            elif token_type not in SKIPPED:
+                value = found.group()
+                yield Token(token_type, value, line_number, base + position - line_start + 1, base + position)
+                if token_type == "STRING" and "\n" in value:
+                    line_number += value.count("\n")
+                    line_start = base + position + value.rindex("\n") + 1
+            position = end
+        pending = pending[position:]
+        base += position
+
+
 def tokenize(code):
     """
     Converts source code into a list of tokens.
     """
-    tokens = []
-    line_number = 1
-    while code:
-        matched = False
-        for token_type, pattern in TOKENS:
-            regex = re.compile(pattern)
-            match = regex.match(code)
-            if match:
-                matched = True
-                value = match.group(0)
-                if token_type == "NEWLINE":
-                    line_number += 1
-                elif token_type in ["WHITESPACE", "COMMENT"]:
-                    pass  # Skip whitespace and comments
-                else:
-                    tokens.append((token_type, value))
-                code = code[len(value):]
-                break
-        if not matched:
-            raise SyntaxError(f"Yo, what even is this: {code[0]}? Line {line_number} is straight-up sus, bro!")
-    return tokens
+    return list(iter_tokens(code))
+
+
+class TokenBuffer:
+    """
+    Struct-of-arrays token storage: a type id and start/end offsets per token
+    plus the offset where every line starts. A token's value, line and column
+    are only sliced or computed from the source when it is looked at, so a
+    buffer costs 9 bytes per token instead of a tuple and a substring each.
+
+    Indexing returns a Token, so a buffer can stand in for a token list.
+    """
+    __slots__ = ("source", "types", "starts", "ends", "line_starts")
+
+    def __init__(self, source):
+        self.source = source
+        self.types = array("B")
+        self.starts = array("I")
+        self.ends = array("I")
+        self.line_starts = array("I", [0])
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.types)
+        start = self.starts[index]
+        line = bisect_right(self.line_starts, start)
+        return Token(
+            TOKEN_TYPES[self.types[index]], self.source[start:self.ends[index]],
+            line, start - self.line_starts[line - 1] + 1, start,
+        )
+
+    def __iter__(self):
+        for index in range(len(self.types)):
+            yield self[index]
+
+    def __repr__(self):
+        return f"<TokenBuffer of {len(self.types)} tokens>"
+
+    def type_of(self, index):
+        """Token type at `index` without building the Token."""
+        return TOKEN_TYPES[self.types[index]]
+
+
+def tokenize_buffer(code):
+    """
+    Converts source code into a TokenBuffer.
+    """
+    buffer = TokenBuffer(code)
+    add_type = buffer.types.append
+    add_start = buffer.starts.append
+    add_end = buffer.ends.append
+    add_line = buffer.line_starts.append
+    type_ids = TOKEN_TYPE_IDS
+    match = MASTER_PATTERN.match
+    position = 0
+    length = len(code)
+    while position < length:
+        found = match(code, position)
+        if found is None:
+            line_number = len(buffer.line_starts)
+            raise BroSyntaxError(
+                f"Yo, what even is this: {code[position]}? Line {line_number} is straight-up sus, bro!",
+                line_number, position - buffer.line_starts[-1] + 1,
+            )
+        token_type = found.lastgroup
+        end = found.end()
+        if token_type == "NEWLINE":
+            add_line(end)
+        elif token_type not in SKIPPED:
+            add_type(type_ids[token_type])
+            add_start(position)
+            add_end(end)
+            if token_type == "STRING":
+                newline = code.find("\n", position, end)
+                while newline != -1:
+                    add_line(newline + 1)
+                    newline = code.find("\n", newline + 1, end)
+        position = end
+    return buffer
 
 if __name__ == "__main__":
     code = '''
@@ -0,0 +1,145 @@
+import math
+import time
+from bisect import bisect_left
+from threading import Lock
+
+# Upper bounds, in seconds, of the default histogram buckets
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{escape(str(value))}"' for name, value in labels.items())
+    return "{" + pairs + "}"
+
+
+def escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A number that only goes up."""
+
+    type = "counter"
+
+    def __init__(self, name, help, labels=None):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.value = 0
+        self.lock = Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def samples(self):
+        yield self.name, self.labels, self.value
+
+
+class Histogram:
+    """Counts observations into cumulative buckets, Prometheus style."""
+
+    type = "histogram"
+
+    def __init__(self, name, help, labels=None, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.lock = Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        """Context manager that observes the seconds its block took."""
+        return Timer(self)
+
+    def samples(self):
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            yield self.name + "_bucket", dict(self.labels, le=format_value(bound)), cumulative
+        yield self.name + "_sum", self.labels, total
+        yield self.name + "_count", self.labels, cumulative
+
+
+class Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+class Registry:
+    """
+    Holds metrics and renders them in the Prometheus text exposition format.
+
+    Besides counters and histograms updated as things happen, collectors
+    are called on every render() for values that are cheaper to read than
+    to track, like cache sizes. A collector returns (name, type, help,
+    labels, value) tuples.
+    """
+
+    def __init__(self):
+        self.metrics = {}  # (name, label values) -> metric
+        self.collectors = []
+        self.lock = Lock()
+
+    def register(self, metric):
+        key = (metric.name, tuple(sorted(metric.labels.items())))
+        with self.lock:
+            existing = self.metrics.get(key)
+            if existing is not None:
+                return existing
+            self.metrics[key] = metric
+            return metric
+
+    def counter(self, name, help, **labels):
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS, **labels):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def render(self):
+        families = {}  # name -> (type, help, samples), in registration order
+        with self.lock:
+            metrics = list(self.metrics.values())
+        for metric in metrics:
+            family = families.setdefault(metric.name, (metric.type, metric.help, []))
+            family[2].extend(metric.samples())
+        for collector in self.collectors:
+            for name, type, help, labels, value in collector():
+                families.setdefault(name, (type, help, []))[2].append((name, labels or {}, value))
+
+        lines = []
+        for name, (type, help, samples) in families.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {type}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
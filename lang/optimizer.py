@@ -0,0 +1,204 @@
+from lang.parser import *
+from lang.vm import BINARY_OPERATORS
+
+# Passes in the order they are applied to each node
+PASSES = ("fold_constants", "eliminate_dead_branches", "fuse_concat")
+
+# Folding never builds string literals longer than this, so '"x" * 100000000' stays a runtime cost
+MAX_FOLDED_STRING = 4096
+
+
+class Optimizer:
+    """
+    Rewrites a parsed Program into an equivalent, cheaper one.
+
+    Passes (each can be switched off with a keyword argument):
+      fold_constants          - evaluate BinaryOperations whose operands are literals
+      eliminate_dead_branches - inline or drop if/while statements with literal conditions
+      fuse_concat             - turn chains of string '+' into one n-ary Concat node
+
+    The input tree is left untouched; counts of what changed are kept in `stats`.
+    """
+
+    def __init__(self, fold_constants=True, eliminate_dead_branches=True, fuse_concat=True):
+        self.fold_constants = fold_constants
+        self.eliminate_dead_branches = eliminate_dead_branches
+        self.fuse_concat = fuse_concat
+        self.stats = {"constants_folded": 0, "branches_eliminated": 0, "concats_fused": 0}
+
+    def optimize(self, program):
+        return Program(self.block(program.statements))
+
+    def block(self, statements):
+        optimized = []
+        for statement in statements:
+            optimized.extend(self.statement(statement))
+        return optimized
+
+    def statement(self, node):
+        """Optimize one statement; returns the list of statements that replace it."""
+        if isinstance(node, PrintStatement):
+            return [PrintStatement(self.expression(node.expression), node.line)]
+
+        elif isinstance(node, VariableDeclaration):
+            if isinstance(node.value, Literal) and node.value.value == "INPUT":
+                return [VariableDeclaration(node.name, node.value, node.line)]
+            value = self.expression(node.value)
+            if isinstance(value, Literal) and value.value == "INPUT":
+                # A literal "INPUT" value reads as an input statement, so keep it computed
+                value = Optimizer(fold_constants=False).expression(node.value)
+            return [VariableDeclaration(node.name, value, node.line)]
+
+        elif isinstance(node, IfStatement):
+            condition = self.expression(node.condition)
+            if self.eliminate_dead_branches and isinstance(condition, Literal):
+                # Bro has no block scope, so the surviving branch can be spliced in place
+                self.stats["branches_eliminated"] += 1
+                if condition.value:
+                    return self.block(node.if_body)
+                return self.block(node.else_body or [])
+            else_body = self.block(node.else_body) if node.else_body else None
+            return [IfStatement(condition, self.block(node.if_body), else_body, node.line)]
+
+        elif isinstance(node, WhileLoop):
+            condition = self.expression(node.condition)
+            if self.eliminate_dead_branches and isinstance(condition, Literal) and not condition.value:
+                self.stats["branches_eliminated"] += 1
+                return []
+            return [WhileLoop(condition, self.block(node.body), node.line)]
+
+        return [node]
+
+    def expression(self, node):
+        # Post-order rebuild with an explicit stack, like the compiler, so deep trees are safe
+        pending = [(node, False)]
+        results = []
+        while pending:
+            node, operands_done = pending.pop()
+            if isinstance(node, BinaryOperation):
+                if operands_done:
+                    right = results.pop()
+                    left = results.pop()
+                    results.append(self.binary_operation(node, left, right))
+                else:
+                    pending.append((node, True))
+                    pending.append((node.right, False))
+                    pending.append((node.left, False))
+            elif isinstance(node, Concat):
+                if operands_done:
+                    parts = results[-len(node.parts):]
+                    del results[-len(node.parts):]
+                    results.append(self.concat(parts))
+                else:
+                    pending.append((node, True))
+                    pending.extend((part, False) for part in reversed(node.parts))
+            elif isinstance(node, (ListLiteral, Index, Call)):
+                children = expression_children(node)
+                if operands_done:
+                    rebuilt = results[len(results) - len(children):]
+                    del results[len(results) - len(children):]
+                    results.append(rebuild(node, rebuilt))
+                else:
+                    pending.append((node, True))
+                    pending.extend((child, False) for child in reversed(children))
+            elif isinstance(node, VariableReference):
+                # Fresh nodes, so resolving slots for the result never touches the input tree
+                results.append(VariableReference(node.name))
+            else:
+                results.append(node)
+        return results[0]
+
+    def binary_operation(self, node, left, right):
+        if self.fold_constants and isinstance(left, Literal) and isinstance(right, Literal):
+            folded = self.fold(node.op, left.value, right.value)
+            if folded is not None:
+                return folded
+
+        if self.fuse_concat and node.op == OP_ADD and (is_string(left) or is_string(right)):
+            # Once either side is a string every '+' in the chain concatenates
+            self.stats["concats_fused"] += 1
+            return self.concat(parts_of(left) + parts_of(right))
+
+        if left is node.left and right is node.right:
+            return node
+        return BinaryOperation(left, node.operator, right)
+
+    def concat(self, parts):
+        if self.fold_constants:
+            merged = []
+            for part in parts:
+                if isinstance(part, Literal) and merged and isinstance(merged[-1], Literal):
+                    text = str(merged[-1].value) + str(part.value)
+                    if len(text) <= MAX_FOLDED_STRING:
+                        self.stats["constants_folded"] += 1
+                        merged[-1] = Literal(text)
+                        continue
+                merged.append(part)
+            parts = merged
+            if len(parts) == 1 and isinstance(parts[0], Literal) and isinstance(parts[0].value, str):
+                return parts[0]
+        return Concat(parts)
+
+    def fold(self, op, left, right):
+        """Literal for `left op right`, or None when it must stay a runtime operation."""
+        if not fits_folded_string(op, left, right):
+            return None
+        try:
+            value = BINARY_OPERATORS[op](left, right)
+        except Exception:
+            # Division by zero and type errors have to surface when the program runs
+            return None
+        self.stats["constants_folded"] += 1
+        return Literal(value)
+
+
+def fits_folded_string(op, left, right):
+    """
+    Whether `left op right` can be folded without building a string longer
+    than MAX_FOLDED_STRING, decided before the string is built.
+    """
+    if op == OP_ADD:
+        if isinstance(left, str) or isinstance(right, str):
+            return len(str(left)) + len(str(right)) <= MAX_FOLDED_STRING
+    elif op == OP_MUL:
+        if isinstance(left, str) and isinstance(right, int):
+            return len(left) * right <= MAX_FOLDED_STRING
+        if isinstance(right, str) and isinstance(left, int):
+            return len(right) * left <= MAX_FOLDED_STRING
+    elif op == OP_MOD and isinstance(left, str):
+        return False  # '%' formats strings, and a width like "%0100000000d" can be any size
+    return True
+
+
+def is_string(node):
+    """Whether the expression is known to produce a string without running it."""
+    if isinstance(node, Literal):
+        return isinstance(node.value, str)
+    return isinstance(node, Concat)
+
+
+def parts_of(node):
+    return node.parts if isinstance(node, Concat) else [node]
+
+
+def expression_children(node):
+    """Operand expressions of a ListLiteral, Index or Call."""
+    if isinstance(node, ListLiteral):
+        return node.elements
+    if isinstance(node, Index):
+        return [node.target, node.index]
+    return node.arguments
+
+
+def rebuild(node, children):
+    """A copy of ListLiteral, Index or Call `node` over optimized `children`."""
+    if isinstance(node, ListLiteral):
+        return ListLiteral(children)
+    if isinstance(node, Index):
+        return Index(*children)
+    return Call(node.name, children)
+
+
+def optimize(program, **passes):
+    """Run the optimizer over a Program; keyword arguments switch individual passes."""
+    return Optimizer(**passes).optimize(program)
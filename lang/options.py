@@ -0,0 +1,11 @@
+"""
+Choices the command line offers, kept out of the modules that implement
+them so that bro_lang.py can build its argument parser, and `--connect`
+can run, without importing the engines.
+"""
+
+# Execution engines an Interpreter can run a Program with
+ENGINES = ("tree", "vm", "python")
+
+# Columns a profile report can be sorted by, hottest first
+SORT_KEYS = ("self", "total", "hits", "line")
@@ -1,207 +1,507 @@
+from collections import deque
+from itertools import islice
+
+from lang.lexer import BroSyntaxError, TokenBuffer
+
+# Binary operators. Nodes store an operator's index here as their `op` code,
+# so engines compare small ints instead of strings.
+OPERATORS = ("+", "-", "*", "/", "%", ">", "<", ">=", "<=", "==", "!=")
+OPERATOR_CODES = {operator: code for code, operator in enumerate(OPERATORS)}
+OP_ADD, OP_SUB, OP_MUL, OP_DIV, OP_MOD, OP_GT, OP_LT, OP_GE, OP_LE, OP_EQ, OP_NE = range(len(OPERATORS))
+
+# Built-in functions, implemented by lang.arrays. Call nodes store a function's
+# index here as their `function` code, like operators.
+FUNCTIONS = ("len", "range", "sum", "min", "max")
+FUNCTION_CODES = {name: code for code, name in enumerate(FUNCTIONS)}
+# Fewest and most arguments each function takes
+FUNCTION_ARITY = ((1, 1), (1, 3), (1, 1), (1, 1), (1, 1))
+
+# Every node declares __slots__: large programs hold hundreds of thousands of
+# nodes and a per-instance __dict__ would more than double their size.
 class ASTNode:
-    pass
+    __slots__ = ()
 
 class Program(ASTNode):
+    __slots__ = ("statements", "slot_names")
+
     def __init__(self, statements):
         self.statements = statements
+        self.slot_names = None  # variable name per frame slot, set by lang.resolver
 
+# Statements record the source line they start on, for error reports and lang.profiler
 class PrintStatement(ASTNode):
-    def __init__(self, expression):
+    __slots__ = ("expression", "line")
+
+    def __init__(self, expression, line=None):
         self.expression = expression
+        self.line = line
 
 class VariableDeclaration(ASTNode):
-    def __init__(self, name, value):
+    __slots__ = ("name", "value", "slot", "line")
+
+    def __init__(self, name, value, line=None):
         self.name = name
         self.value = value
+        self.slot = None  # frame slot, set by lang.resolver
+        self.line = line
 
 class IfStatement(ASTNode):
-    def __init__(self, condition, if_body, else_body=None):
+    __slots__ = ("condition", "if_body", "else_body", "line")
+
+    def __init__(self, condition, if_body, else_body=None, line=None):
         self.condition = condition
         self.if_body = if_body
         self.else_body = else_body
+        self.line = line
 
 class WhileLoop(ASTNode):
-    def __init__(self, condition, body):
+    __slots__ = ("condition", "body", "line")
+
+    def __init__(self, condition, body, line=None):
         self.condition = condition
         self.body = body
+        self.line = line
 
 class BinaryOperation(ASTNode):
+    __slots__ = ("left", "op", "right")
+
     def __init__(self, left, operator, right):
+        code = OPERATOR_CODES.get(operator)
+        if code is None:
+            raise SyntaxError(f"Bro, unsupported operator: {operator}")
         self.left = left
-        self.operator = operator
+        self.op = code
         self.right = right
 
+    @property
+    def operator(self):
+        return OPERATORS[self.op]
+
+class Concat(ASTNode):
+    """String concatenation of several parts; built by lang.optimizer from '+' chains."""
+    __slots__ = ("parts",)
+
+    def __init__(self, parts):
+        self.parts = parts
+
+class ListLiteral(ASTNode):
+    """A list written out, like '[1, 2, x]'."""
+    __slots__ = ("elements",)
+
+    def __init__(self, elements):
+        self.elements = elements
+
+class Index(ASTNode):
+    """'target[index]', an element of a list or a character of a string."""
+    __slots__ = ("target", "index")
+
+    def __init__(self, target, index):
+        self.target = target
+        self.index = index
+
+class Call(ASTNode):
+    __slots__ = ("function", "arguments")
+
+    def __init__(self, name, arguments):
+        code = FUNCTION_CODES.get(name)
+        if code is None:
+            raise SyntaxError(f"Bro, there's no function called {name}")
+        self.function = code
+        self.arguments = arguments
+
+    @property
+    def name(self):
+        return FUNCTIONS[self.function]
+
 class Literal(ASTNode):
+    __slots__ = ("value",)
+
     def __init__(self, value):
         self.value = value
 
 class VariableReference(ASTNode):
+    __slots__ = ("name", "slot")
+
     def __init__(self, name):
         self.name = name
+        self.slot = None  # frame slot, set by lang.resolver
 
-def parse_expression(tokens):
-    """Parse an expression (supports binary operations and parentheses)."""
-    if not tokens:
-        raise SyntaxError("Bro, unexpected end of input while parsing an expression")
-
-    token_type, token_value = tokens.pop(0)
-    # print(f"Parsing expression: {token_type}, {token_value}")  # Debugging log
-
-    # Handle literals (numbers or strings)
-    if token_type == "NUMBER":
-        left = Literal(int(token_value))
-    elif token_type == "STRING":
-        left = Literal(token_value.strip('"'))
-    elif token_type == "IDENTIFIER":
-        left = VariableReference(token_value)
-    elif token_type == "LBRACE":  # Handle opening parenthesis '('
-        left = parse_expression(tokens)  # Recursively parse the inner expression
-        if not tokens or tokens[0][0] != "RBRACE":  # Ensure closing parenthesis ')'
-            raise SyntaxError("Bro, you forgot to close your parentheses!")
-        tokens.pop(0)  # Consume the closing parenthesis ')'
-    else:
-        raise SyntaxError(f"Bro, unexpected token in expression: {token_value}")
-
-    # Handle binary operations like +, -, *, /, %
-    while tokens and tokens[0][0] == "OPERATOR":
-        operator_token_type, operator_value = tokens.pop(0)
-        right = parse_expression(tokens)
-        left = BinaryOperation(left, operator_value, right)
+# Binding power of each binary operator; higher binds tighter, all are left-associative
+BINDING_POWER = {
+    "==": 1, "!=": 1, "<": 1, ">": 1, "<=": 1, ">=": 1,
+    "+": 2, "-": 2,
+    "*": 3, "/": 3, "%": 3,
+}
 
-    return left
 
-def parse_parentheses(tokens):
+def syntax_error(message, token=None):
+    """Build a BroSyntaxError pointing at `token` when we know where it is."""
+    line = getattr(token, "line", None)
+    if line is None:
+        return BroSyntaxError(message)
+    return BroSyntaxError(f"{message} (line {line}, column {token.column})", line, token.column)
+
+
+class TokenStream:
+    """Index-based cursor over a token list or TokenBuffer, so consuming a token is O(1)."""
+
+    def __init__(self, tokens, start=0, end=None):
+        self.tokens = tokens
+        self.position = start
+        self.end = len(tokens) if end is None else end
+        if isinstance(tokens, TokenBuffer):
+            self.type_of = tokens.type_of
+        else:
+            self.type_of = lambda index: tokens[index][0]
+
+    def at_end(self):
+        return self.position >= self.end
+
+    def peek(self):
+        if self.position < self.end:
+            return self.tokens[self.position]
+        return None
+
+    def peek_type(self):
+        if self.position < self.end:
+            return self.type_of(self.position)
+        return None
+
+    def last(self):
+        """The most recently consumed token, used to place end-of-input errors."""
+        if self.position > 0:
+            return self.tokens[min(self.position, self.end) - 1]
+        return None
+
+    def advance(self, message="Bro, unexpected end of input while parsing a statement"):
+        if self.position >= self.end:
+            raise syntax_error(message, self.last())
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+
+class LazyTokenStream:
+    """
+    TokenStream over a token iterator, for parsing a program while it is
+    still being lexed. It holds the last consumed token and two of
+    lookahead, enough to hide a final END the way TokenStream's `end` does.
+    """
+
+    def __init__(self, tokens):
+        self.tokens = iter(tokens)
+        self.ahead = deque(islice(self.tokens, 2))
+        self.previous = None
+
+    def at_end(self):
+        ahead = self.ahead
+        return not ahead or (len(ahead) == 1 and ahead[0][0] == "END")
+
+    def peek(self):
+        if self.at_end():
+            return None
+        return self.ahead[0]
+
+    def peek_type(self):
+        if self.at_end():
+            return None
+        return self.ahead[0][0]
+
+    def last(self):
+        return self.previous
+
+    def advance(self, message="Bro, unexpected end of input while parsing a statement"):
+        if self.at_end():
+            raise syntax_error(message, self.previous)
+        self.previous = self.ahead.popleft()
+        token = next(self.tokens, None)
+        if token is not None:
+            self.ahead.append(token)
+        return self.previous
+
+
+def _reduce(operands, operators):
+    """Pop one operator and its two operands into a BinaryOperation."""
+    operator = operators.pop()[0]
+    right = operands.pop()
+    operands[-1] = BinaryOperation(operands[-1], operator, right)
+
+
+# Groups parse_expression opens, by the token that closes them
+CLOSERS = {"paren": "RPAREN", "call": "RPAREN", "list": "RBRACKET", "index": "RBRACKET"}
+
+
+def _close_group(operands, operators, groups):
+    """Reduce the innermost group down to its opener and replace its contents with the node it makes."""
+    while operators[-1][0] is not None:
+        _reduce(operands, operators)
+    operators.pop()
+    kind, opener, base = groups.pop()
+    if kind == "list":
+        elements = operands[base:]
+        del operands[base:]
+        operands.append(ListLiteral(elements))
+    elif kind == "call":
+        arguments = operands[base:]
+        del operands[base:]
+        name = opener[1]
+        fewest, most = FUNCTION_ARITY[FUNCTION_CODES[name]]
+        if not fewest <= len(arguments) <= most:
+            expected = fewest if fewest == most else f"{fewest} to {most}"
+            plural = "s" if most > 1 else ""
+            raise syntax_error(f"Bro, {name} takes {expected} argument{plural}, not {len(arguments)}", opener)
+        operands.append(Call(name, arguments))
+    elif kind == "index":
+        position = operands.pop()
+        operands[-1] = Index(operands[-1], position)
+    # A parenthesised group's value is already on top of the operands
+
+
+def parse_expression(stream):
+    """
+    Parse an expression: binary operations, parentheses, lists, indexing
+    and calls to built-in functions.
+
+    Operator precedence is resolved with explicit operand/operator stacks
+    rather than recursion, and brackets and argument lists open groups on
+    the same stacks, so long chains and deep nesting cannot overflow the
+    Python stack.
+    """
+    operands = []
+    operators = []  # (operator, token); operator is None where a group opens
+    groups = []     # (kind, opening token, len(operands) when it opened) per open group
+
+    while True:
+        # Operand position: any number of '(', '[' or 'name(' openers, then a literal or name
+        token = stream.advance("Bro, unexpected end of input while parsing an expression")
+        while True:
+            token_type = token[0]
+            if token_type == "LPAREN":
+                kind = "paren"
+            elif token_type == "LBRACKET":
+                kind = "list"
+            elif token_type == "IDENTIFIER" and stream.peek_type() == "LPAREN":
+                if token[1] not in FUNCTION_CODES:
+                    raise syntax_error(f"Bro, there's no function called {token[1]}", token)
+                stream.advance()  # the call's '('
+                kind = "call"
+            else:
+                break
+            operators.append((None, token))
+            groups.append((kind, token, len(operands)))
+            if kind != "paren" and stream.peek_type() == CLOSERS[kind]:
+                token = None  # '[]' or 'name()', closed straight away below
+                break
+            token = stream.advance("Bro, unexpected end of input while parsing an expression")
+
+        if token is not None:
+            token_value = token[1]
+            if token_type == "NUMBER":
+                operands.append(Literal(int(token_value)))
+            elif token_type == "STRING":
+                operands.append(Literal(token_value.strip('"')))
+            elif token_type == "IDENTIFIER":
+                operands.append(VariableReference(token_value))
+            else:
+                raise syntax_error(f"Bro, unexpected token in expression: {token_value}", token)
+
+        # Operator position: close any finished groups, then look for an index, a comma or an operator
+        while groups and stream.peek_type() == CLOSERS[groups[-1][0]]:
+            stream.advance()
+            _close_group(operands, operators, groups)
+
+        token = stream.peek()
+        if token is None:
+            break
+        token_type = token[0]
+        if token_type == "LBRACKET":
+            # '[' after a value indexes it, binding tighter than any operator
+            stream.advance()
+            operators.append((None, token))
+            groups.append(("index", token, len(operands)))
+            continue
+        if token_type == "COMMA" and groups and groups[-1][0] in ("list", "call"):
+            stream.advance()
+            while operators[-1][0] is not None:
+                _reduce(operands, operators)
+            continue
+        if token_type != "OPERATOR" or token[1] == "=":
+            break
+        operator = token[1]
+        power = BINDING_POWER.get(operator)
+        if power is None:
+            raise syntax_error(f"Bro, unsupported operator: {operator}", token)
+        while operators and operators[-1][0] is not None and BINDING_POWER[operators[-1][0]] >= power:
+            _reduce(operands, operators)
+        operators.append((operator, token))
+        stream.advance()
+
+    if groups:
+        kind, opener, base = groups[-1]
+        if CLOSERS[kind] == "RPAREN":
+            raise syntax_error("Bro, you forgot to close your parentheses!", opener)
+        raise syntax_error("Bro, you forgot to close your brackets!", opener)
+    while operators:
+        _reduce(operands, operators)
+    return operands[0]
+
+def parse_parentheses(stream):
     """Parse an expression enclosed in parentheses."""
-    if not tokens or tokens[0][0] != "LPAREN":
-        raise SyntaxError("Bro, expected '(' to start an expression")
+    if stream.peek_type() != "LPAREN":
+        raise syntax_error("Bro, expected '(' to start an expression", stream.peek() or stream.last())
     
-    tokens.pop(0)  # Remove '('
+    stream.advance()  # Remove '('
     
-    expression = parse_expression(tokens)
+    expression = parse_expression(stream)
     
-    if not tokens or tokens[0][0] != "RPAREN":
-        raise SyntaxError("Bro, expected ')' to end an expression")
+    if stream.peek_type() != "RPAREN":
+        raise syntax_error("Bro, expected ')' to end an expression", stream.peek() or stream.last())
     
-    tokens.pop(0)  # Remove ')'
+    stream.advance()  # Remove ')'
     
     return expression
 
-def parse_block(tokens):
+def parse_block(stream):
     """Parse a block of statements enclosed in `{}`."""
-    if not tokens or tokens[0][0] != "LBRACE_BLOCK":
-        raise SyntaxError("Bro, expected '{' to start a block")
+    if stream.peek_type() != "LBRACE_BLOCK":
+        raise syntax_error("Bro, expected '{' to start a block", stream.peek() or stream.last())
     
-    tokens.pop(0)  # Remove '{'
+    stream.advance()  # Remove '{'
     
     statements = []
     
-    while tokens and tokens[0][0] != "RBRACE_BLOCK":
-        statements.append(parse_statement(tokens))
+    while not stream.at_end() and stream.peek_type() != "RBRACE_BLOCK":
+        statements.append(parse_statement(stream))
     
-    if not tokens or tokens[0][0] != "RBRACE_BLOCK":
-        raise SyntaxError("Bro, expected '}' to end a block")
+    if stream.peek_type() != "RBRACE_BLOCK":
+        raise syntax_error("Bro, expected '}' to end a block", stream.last())
     
-    tokens.pop(0)  # Remove '}'
+    stream.advance()  # Remove '}'
     
     return statements
 
 
-def parse_statement(tokens):
+def parse_variable_name(stream):
+    """Consume the identifier naming a variable."""
+    token = stream.advance()
+    if token[0] != "IDENTIFIER":
+        raise syntax_error(f"Bro, invalid variable name: {token[1]}", token)
+    return token[1]
+
+
+def parse_statement(stream):
     """Parse a single statement."""
-    if not tokens:
-        raise SyntaxError("Bro, unexpected end of input while parsing a statement")
+    token = stream.peek()
+    if token is None:
+        raise syntax_error("Bro, unexpected end of input while parsing a statement", stream.last())
 
-    token_type, token_value = tokens[0]
-    # print(f"Parsing statement: {token_type}, {token_value}")  # Debugging log
+    token_type, token_value, line = token[0], token[1], token[2]
 
     if token_type == "PRINT":
-        tokens.pop(0)
-        expression = parse_expression(tokens)
-        return PrintStatement(expression)
+        stream.advance()
+        expression = parse_expression(stream)
+        return PrintStatement(expression, line)
     
     elif token_type == "VAR_DECL":
-        tokens.pop(0)
+        stream.advance()
         
-        var_name_token_type, var_name_value = tokens.pop(0)
-        if var_name_token_type != "IDENTIFIER":
-            raise SyntaxError(f"Bro, invalid variable name: {var_name_value}")
+        var_name_value = parse_variable_name(stream)
         
-        equals_token_type, equals_value = tokens.pop(0)
-        if equals_value != "=":
-            raise SyntaxError("Bro, use '=' to assign values")
+        equals_token = stream.advance()
+        if equals_token[1] != "=":
+            raise syntax_error("Bro, use '=' to assign values", equals_token)
         
-        value_expression = parse_expression(tokens)
-        return VariableDeclaration(var_name_value, value_expression)
+        value_expression = parse_expression(stream)
+        return VariableDeclaration(var_name_value, value_expression, line)
 
     elif token_type == "IF":
-        tokens.pop(0)  # Remove 'bro if'
+        stream.advance()  # Remove 'bro if'
         
-        condition = parse_expression(tokens)
+        condition = parse_expression(stream)
         
-        if_body = parse_block(tokens)
+        if_body = parse_block(stream)
         
         else_body = None
-        if tokens and tokens[0][0] == "ELSE":
-            tokens.pop(0)  # Remove 'bro else'
-            else_body = parse_block(tokens)
+        if stream.peek_type() == "ELSE":
+            stream.advance()  # Remove 'bro else'
+            else_body = parse_block(stream)
         
-        return IfStatement(condition, if_body, else_body)
+        return IfStatement(condition, if_body, else_body, line)
 
     elif token_type == "WHILE":
-        tokens.pop(0)  # Remove 'keep going bro'
+        stream.advance()  # Remove 'keep going bro'
         
-        condition = parse_expression(tokens)
+        condition = parse_expression(stream)
         
-        body_statements = parse_block(tokens)
+        body_statements = parse_block(stream)
         
-        return WhileLoop(condition, body_statements)
+        return WhileLoop(condition, body_statements, line)
     
     elif token_type == "INPUT":
-        tokens.pop(0)  # Remove 'bro ask'
-        var_name_token_type, var_name_value = tokens.pop(0)
-        if var_name_token_type != "IDENTIFIER":
-            raise SyntaxError(f"Bro, invalid variable name: {var_name_value}")
-        return VariableDeclaration(var_name_value, Literal("INPUT"))
+        stream.advance()  # Remove 'bro ask'
+        var_name_value = parse_variable_name(stream)
+        return VariableDeclaration(var_name_value, Literal("INPUT"), line)
 
     elif token_type == "IDENTIFIER":
         # Handle variable assignment (e.g., x = x - 1)
-        var_name_token_type, var_name_value = tokens.pop(0)
+        stream.advance()
         
-        if not tokens or tokens[0][1] != "=":
-            raise SyntaxError(f"Bro, unexpected token: {var_name_value} while parsing a statement")
+        next_token = stream.peek()
+        if next_token is None or next_token[1] != "=":
+            raise syntax_error(f"Bro, unexpected token: {token_value} while parsing a statement", token)
         
-        tokens.pop(0)  # Remove '='
-        value_expression = parse_expression(tokens)
+        stream.advance()  # Remove '='
+        value_expression = parse_expression(stream)
         
-        return VariableDeclaration(var_name_value, value_expression)
+        return VariableDeclaration(token_value, value_expression, line)
 
     else:
-        raise SyntaxError(f"Bro, unexpected token: {token_value} while parsing a statement")
+        raise syntax_error(f"Bro, unexpected token: {token_value} while parsing a statement", token)
 
 
 
 def parse(tokens):
     """Parse the entire program."""
+    if not isinstance(tokens, (list, TokenBuffer)):
+        tokens = list(tokens)
+
     if not tokens or tokens[0][0] != "START":
-        raise SyntaxError("Bro, every program must start with 'yo bro'")
+        raise syntax_error("Bro, every program must start with 'yo bro'", tokens[0] if tokens else None)
     
     if tokens[-1][0] != "END":
-        raise SyntaxError("Bro, every program must end with 'peace out bro'")
+        raise syntax_error("Bro, every program must end with 'peace out bro'", tokens[-1])
     
-    # Remove START and END tokens
-    tokens.pop(0)  # Remove 'START'
-    tokens.pop()   # Remove 'END'
+    # Walk everything between the START and END tokens
+    stream = TokenStream(tokens, 1, len(tokens) - 1)
 
     statements = []
     
-    while tokens:
-        statements.append(parse_statement(tokens))
+    while not stream.at_end():
+        statements.append(parse_statement(stream))
     
     return Program(statements)
 
+def iter_statements(tokens):
+    """
+    Parse a program from a token iterator one top-level statement at a
+    time, yielding each as soon as it is complete. Syntax errors surface
+    when the parse reaches them, after the statements before them.
+    """
+    stream = LazyTokenStream(tokens)
+    ahead = stream.ahead
+    if not ahead or ahead[0][0] != "START":
+        raise syntax_error("Bro, every program must start with 'yo bro'", ahead[0] if ahead else None)
+    stream.advance()
+
+    while not stream.at_end():
+        yield parse_statement(stream)
+
+    if not stream.ahead:
+        raise syntax_error("Bro, every program must end with 'peace out bro'", stream.last())
+
 # Testing the parser with if-else and while loops
 if __name__ == "__main__":
-    from lexer import tokenize
+    from lang.lexer import tokenize
 
     code = '''
 yo bro
@@ -0,0 +1,149 @@
+import json
+import time
+
+from lang.parser import *
+from lang.interpreter import Interpreter
+from lang.options import SORT_KEYS
+
+STATEMENT_KINDS = {
+    PrintStatement: "print",
+    VariableDeclaration: "assign",
+    IfStatement: "if",
+    WhileLoop: "while",
+}
+
+
+class StatementStats:
+    __slots__ = ("line", "kind", "hits", "total", "self_time", "iterations")
+
+    def __init__(self, line, kind):
+        self.line = line
+        self.kind = kind
+        self.hits = 0
+        self.total = 0.0      # seconds in the statement, including nested statements
+        self.self_time = 0.0  # seconds in the statement itself
+        self.iterations = 0   # loop iterations, for while statements
+
+
+class Profile:
+    """Per-statement hit counts, times and loop iterations from a ProfilingInterpreter run."""
+
+    def __init__(self):
+        self.statements = {}  # id(node) -> StatementStats
+        self.total_time = 0.0
+
+    def stats_for(self, node):
+        stats = self.statements.get(id(node))
+        if stats is None:
+            stats = self.statements[id(node)] = StatementStats(node.line, STATEMENT_KINDS.get(type(node), "?"))
+        return stats
+
+    def rows(self, sort="self", limit=None):
+        """Statement stats sorted hottest first (or by line), at most `limit` of them."""
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Bro, can't sort a profile by {sort}")
+        rows = list(self.statements.values())
+        if sort == "line":
+            rows.sort(key=lambda stats: (stats.line or 0, stats.kind))
+        else:
+            attribute = {"self": "self_time", "total": "total", "hits": "hits"}[sort]
+            rows.sort(key=lambda stats: getattr(stats, attribute), reverse=True)
+        return rows[:limit] if limit else rows
+
+    def to_dict(self, source=None, sort="self", limit=None):
+        source_lines = source.splitlines() if source is not None else None
+        return {
+            'total_time': self.total_time,
+            'statements': [
+                {
+                    'line': stats.line,
+                    'kind': stats.kind,
+                    'source': line_text(source_lines, stats.line),
+                    'hits': stats.hits,
+                    'iterations': stats.iterations if stats.kind == "while" else None,
+                    'total_time': stats.total,
+                    'self_time': stats.self_time,
+                }
+                for stats in self.rows(sort, limit)
+            ],
+        }
+
+    def report_json(self, source=None, sort="self", limit=None):
+        return json.dumps(self.to_dict(source, sort, limit), indent=2)
+
+    def report_text(self, source=None, sort="self", limit=None):
+        source_lines = source.splitlines() if source is not None else None
+        total_hits = sum(stats.hits for stats in self.statements.values())
+        lines = [
+            f"Profile: {total_hits} statements run in {self.total_time * 1000:.3f} ms",
+            "",
+            f"{'line':>6} {'hits':>10} {'loops':>10} {'total ms':>11} {'self ms':>11} {'self %':>7}  statement",
+        ]
+        for stats in self.rows(sort, limit):
+            share = stats.self_time / self.total_time * 100 if self.total_time else 0.0
+            iterations = str(stats.iterations) if stats.kind == "while" else "-"
+            text = line_text(source_lines, stats.line) or stats.kind
+            lines.append(
+                f"{stats.line or '?':>6} {stats.hits:>10} {iterations:>10} {stats.total * 1000:>11.3f} "
+                f"{stats.self_time * 1000:>11.3f} {share:>6.1f}%  {text}"
+            )
+        return "\n".join(lines)
+
+
+def line_text(source_lines, line):
+    if source_lines is None or not line or line > len(source_lines):
+        return None
+    return source_lines[line - 1].strip()
+
+
+class ProfilingInterpreter(Interpreter):
+    """
+    A tree-walking Interpreter that times every statement it runs into
+    `profile`. Much slower than a plain run, so only used when asked for.
+    """
+
+    def __init__(self, budget=None):
+        super().__init__("tree", budget)
+        self.profile = Profile()
+        self.nested_time = 0.0  # time spent in statements nested in the one running now
+
+    def visit(self, node):
+        if isinstance(node, Program):
+            started = time.perf_counter()
+            try:
+                return super().visit(node)
+            finally:
+                self.profile.total_time += time.perf_counter() - started
+
+        stats = self.profile.stats_for(node)
+        outer_nested_time = self.nested_time
+        self.nested_time = 0.0
+        started = time.perf_counter()
+        try:
+            if isinstance(node, WhileLoop):
+                self.run_loop(node, stats)
+            else:
+                super().visit(node)
+        finally:
+            elapsed = time.perf_counter() - started
+            stats.hits += 1
+            stats.total += elapsed
+            stats.self_time += elapsed - self.nested_time
+            self.nested_time = outer_nested_time + elapsed
+
+    def run_loop(self, node, stats):
+        # Interpreter.visit's while loop, counting iterations as it goes
+        steps = len(node.body) + 1
+        while self.evaluate(node.condition):
+            self.charge(steps)
+            stats.iterations += 1
+            for statement in node.body:
+                self.visit(statement)
+
+
+def profile_program(program, source=None, budget=None, input_callback=None, output_callback=None):
+    """Run `program` under the profiler; returns (output, Profile)."""
+    interpreter = ProfilingInterpreter(budget)
+    interpreter.set_callbacks(input_callback, output_callback)
+    output = interpreter.visit(program)
+    return output, interpreter.profile
@@ -0,0 +1,68 @@
+"""
+Quickening for the tree walker: BinaryOperation nodes specialize themselves
+to the operands they see.
+
+The first time Interpreter.evaluate() runs a BinaryOperation it swaps the
+node's class, in place, for a variant that assumes the same next time:
+
+    IntNameConstant  variable op int literal, both ints   (i < 100, i + 1)
+    IntNameName      variable op variable, both ints      (total + i)
+    IntOperation     any other operation on two ints
+    StringConcat     '+' with a string (or lang.strings builder) on a side
+
+The first two read the variable straight from the frame instead of
+evaluating their operands, like the VM's NAME_OP_CONST and NAME_OP_NAME
+superinstructions. Every variant checks its guard with `type() is` tests
+and skips the generic operator dispatch. When a guard fails, the node
+becomes a GenericOperation for good, so a node whose types keep changing
+doesn't flip back and forth.
+
+The variants are subclasses with no slots of their own, so the tree keeps
+its shape and every other pass (resolver, optimizer, compiler, VM, .broc
+artifacts) still sees plain BinaryOperations.
+"""
+from lang.parser import BinaryOperation, Literal, VariableReference, OP_ADD
+from lang.vm import INT_OPERATORS
+from lang.strings import StringBuilder
+
+STRING_TYPES = (str, StringBuilder)
+
+
+class QuickenedOperation(BinaryOperation):
+    __slots__ = ()
+
+
+class IntNameConstant(QuickenedOperation):
+    __slots__ = ()
+
+
+class IntNameName(QuickenedOperation):
+    __slots__ = ()
+
+
+class IntOperation(QuickenedOperation):
+    __slots__ = ()
+
+
+class StringConcat(QuickenedOperation):
+    __slots__ = ()
+
+
+class GenericOperation(QuickenedOperation):
+    """An operation whose operands changed type; always takes the generic path."""
+    __slots__ = ()
+
+
+def quicken(node, left, right):
+    """Specialize `node`, a plain BinaryOperation, for operand values like `left` and `right`."""
+    if type(left) is int and type(right) is int:
+        if isinstance(node.left, VariableReference) and isinstance(node.right, Literal):
+            node.__class__ = IntNameConstant
+        elif isinstance(node.left, VariableReference) and isinstance(node.right, VariableReference):
+            node.__class__ = IntNameName
+        else:
+            node.__class__ = IntOperation
+    elif node.op == OP_ADD and (type(left) in STRING_TYPES or type(right) in STRING_TYPES):
+        node.__class__ = StringConcat
+    else:
+        node.__class__ = GenericOperation
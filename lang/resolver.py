@@ -0,0 +1,82 @@
+from lang.parser import *
+
+
+class Undefined:
+    """Marks a frame slot whose variable has not been assigned yet."""
+    __slots__ = ()
+
+    def __repr__(self):
+        return "UNDEFINED"
+
+UNDEFINED = Undefined()
+
+
+class Resolver:
+    """
+    Gives every variable name in a program a fixed slot index, recorded on
+    its VariableDeclaration and VariableReference nodes. Engines then keep
+    variables in a list frame indexed by slot instead of a name dict.
+    """
+
+    def __init__(self, names=None):
+        self.names = names if names is not None else []
+        self.slots = {name: slot for slot, name in enumerate(self.names)}
+
+    def slot(self, name):
+        slot = self.slots.get(name)
+        if slot is None:
+            slot = self.slots[name] = len(self.names)
+            self.names.append(name)
+        return slot
+
+    def resolve(self, program):
+        for statement in program.statements:
+            self.resolve_statement(statement)
+        program.slot_names = self.names
+        return program
+
+    def resolve_block(self, statements):
+        for statement in statements:
+            self.resolve_statement(statement)
+
+    def resolve_statement(self, node):
+        if isinstance(node, PrintStatement):
+            self.resolve_expression(node.expression)
+        elif isinstance(node, VariableDeclaration):
+            # Resolve the value first so 'x = x + 1' numbers names in reading order
+            self.resolve_expression(node.value)
+            node.slot = self.slot(node.name)
+        elif isinstance(node, IfStatement):
+            self.resolve_expression(node.condition)
+            self.resolve_block(node.if_body)
+            if node.else_body:
+                self.resolve_block(node.else_body)
+        elif isinstance(node, WhileLoop):
+            self.resolve_expression(node.condition)
+            self.resolve_block(node.body)
+
+    def resolve_expression(self, node):
+        pending = [node]
+        while pending:
+            node = pending.pop()
+            if isinstance(node, VariableReference):
+                node.slot = self.slot(node.name)
+            elif isinstance(node, BinaryOperation):
+                pending.append(node.right)
+                pending.append(node.left)
+            elif isinstance(node, Concat):
+                pending.extend(reversed(node.parts))
+            elif isinstance(node, ListLiteral):
+                pending.extend(reversed(node.elements))
+            elif isinstance(node, Index):
+                pending.append(node.index)
+                pending.append(node.target)
+            elif isinstance(node, Call):
+                pending.extend(reversed(node.arguments))
+
+
+def resolve(program):
+    """Assign variable slots for a Program once; later calls reuse them."""
+    if program.slot_names is None:
+        Resolver().resolve(program)
+    return program
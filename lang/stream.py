@@ -0,0 +1,89 @@
+"""
+Streaming execution, for generated programs too big to hold in memory.
+
+run_stream() lexes the source a line at a time, parses one top-level
+statement at a time and runs each as soon as it is complete, then drops
+it. Memory is bounded by the largest top-level statement instead of the
+whole program, and output starts before the rest of the file is read.
+"""
+from collections import deque
+
+from lang.lexer import iter_line_tokens
+from lang.parser import *
+from lang.optimizer import Optimizer
+from lang.resolver import UNDEFINED, Resolver
+from lang.compiler import compile_program
+from lang.vm import VirtualMachine
+
+# The tree walker's evaluate() recurses once per level of an expression; statements
+# nested deeper than this run on the VM, which compiles and evaluates iteratively
+MAX_TREE_DEPTH = 200
+
+
+def too_deep(statement, limit=MAX_TREE_DEPTH):
+    """Whether any expression in `statement`, including its blocks, nests more than `limit` deep."""
+    pending = [(statement, 0)]
+    while pending:
+        node, depth = pending.pop()
+        if depth > limit:
+            return True
+        if isinstance(node, BinaryOperation):
+            pending.append((node.left, depth + 1))
+            pending.append((node.right, depth + 1))
+        elif isinstance(node, Concat):
+            pending.extend((part, depth + 1) for part in node.parts)
+        elif isinstance(node, ListLiteral):
+            pending.extend((element, depth + 1) for element in node.elements)
+        elif isinstance(node, Index):
+            pending.append((node.target, depth + 1))
+            pending.append((node.index, depth + 1))
+        elif isinstance(node, Call):
+            pending.extend((argument, depth + 1) for argument in node.arguments)
+        elif isinstance(node, PrintStatement):
+            pending.append((node.expression, 0))
+        elif isinstance(node, VariableDeclaration):
+            pending.append((node.value, 0))
+        elif isinstance(node, IfStatement):
+            pending.append((node.condition, 0))
+            pending.extend((child, 0) for child in node.if_body)
+            pending.extend((child, 0) for child in node.else_body or ())
+        elif isinstance(node, WhileLoop):
+            pending.append((node.condition, 0))
+            pending.extend((child, 0) for child in node.body)
+    return False
+
+
+def run_stream(lines, interpreter):
+    """
+    Run the program whose source `lines` yields (e.g. an open file) on
+    `interpreter`, statement by statement. Output is not kept: it only goes
+    to the interpreter's output callback. Returns the number of top-level
+    statements run.
+    """
+    if interpreter.engine not in ("tree", "vm"):
+        raise ValueError(f"Bro, streaming runs on the tree or vm engine, not {interpreter.engine}")
+    resolver = Resolver()
+    optimizer = Optimizer()
+    interpreter.slot_names = resolver.names
+    interpreter.frame = frame = []
+    interpreter.output = deque(maxlen=0)
+    budget = interpreter.budget
+    budget.start()
+    count = 0
+    for parsed in iter_statements(iter_line_tokens(lines)):
+        for statement in optimizer.statement(parsed):
+            resolver.resolve_statement(statement)
+            frame.extend([UNDEFINED] * (len(resolver.names) - len(frame)))
+            if interpreter.engine == "vm" or too_deep(statement):
+                program = Program([statement])
+                program.slot_names = resolver.names
+                VirtualMachine(interpreter).run(compile_program(program))
+            else:
+                interpreter.steps_left = budget.allowance
+                try:
+                    interpreter.charge(1)
+                    interpreter.visit(statement)
+                finally:
+                    budget.settle(interpreter.steps_left)
+            count += 1
+    return count
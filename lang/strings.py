@@ -0,0 +1,115 @@
+"""
+Amortized O(1) string building for the tree walker.
+
+A loop like `report = report + line` copies the whole report on every '+'
+when strings are plain str. Once a string is BUILD_THRESHOLD characters
+long, '+' returns a StringBuilder instead: a view of the first `count`
+parts of an append-only list shared with the strings it was built from.
+Appending to the newest view pushes onto the shared list, with no copying;
+appending to an older view (after `t = s`, say) copies its own parts first.
+Either way every earlier value keeps reading exactly what it did.
+
+The parts are joined once the string is used as anything but the left
+side of a '+': printed, compared, multiplied, or passed to str(). Every
+other operator is handed to that joined str, so results and error
+messages are the same as for a plain string.
+"""
+
+# Strings shorter than this are cheaper to copy than to build
+BUILD_THRESHOLD = 32 * 1024
+
+
+class StringBuilder:
+    __slots__ = ("parts", "count", "length", "text")
+
+    def __init__(self, parts, length):
+        self.parts = parts         # append-only list of str, shared with other builders
+        self.count = len(parts)    # how many of them make up this string
+        self.length = length
+        self.text = None           # the joined string, once something needed it
+
+    def extend(self, texts):
+        """This string followed by `texts`, as a new StringBuilder."""
+        parts = self.parts
+        if len(parts) != self.count:
+            parts = parts[:self.count]  # a later string already grew the shared list
+        parts.extend(texts)
+        return StringBuilder(parts, self.length + sum(map(len, texts)))
+
+    def __str__(self):
+        if self.text is None:
+            parts = self.parts
+            self.text = "".join(parts if len(parts) == self.count else parts[:self.count])
+        return self.text
+
+    def __repr__(self):
+        return repr(str(self))
+
+    def __len__(self):
+        return self.length
+
+    def __bool__(self):
+        return self.length > 0
+
+    def __hash__(self):
+        return hash(str(self))
+
+    # '+' with a string on either side concatenates, as everywhere in Bro
+    def __add__(self, other):
+        return self.extend((other if type(other) is str else str(other),))
+
+    def __radd__(self, other):
+        return str(other) + str(self)
+
+    def __eq__(self, other):
+        return str(self) == other
+
+    def __ne__(self, other):
+        return str(self) != other
+
+    def __lt__(self, other):
+        return str(self) < other
+
+    def __le__(self, other):
+        return str(self) <= other
+
+    def __gt__(self, other):
+        return str(self) > other
+
+    def __ge__(self, other):
+        return str(self) >= other
+
+    def __sub__(self, other):
+        return str(self) - other
+
+    def __rsub__(self, other):
+        return other - str(self)
+
+    def __mul__(self, other):
+        return str(self) * other
+
+    def __rmul__(self, other):
+        return other * str(self)
+
+    def __truediv__(self, other):
+        return str(self) / other
+
+    def __rtruediv__(self, other):
+        return other / str(self)
+
+    def __mod__(self, other):
+        return str(self) % other
+
+    def __rmod__(self, other):
+        return other % str(self)
+
+
+def concatenate(left, *texts):
+    """Bro's `left + text + ...` for str `texts`, building instead of copying once `left` is long."""
+    if type(left) is StringBuilder:
+        return left.extend(texts)
+    if type(left) is not str:
+        left = str(left)
+    if len(left) < BUILD_THRESHOLD:
+        return left + texts[0] if len(texts) == 1 else "".join((left, *texts))
+    return StringBuilder([left, *texts], len(left) + sum(map(len, texts)))
@@ -0,0 +1,220 @@
+import math
+import re
+
+from lang.parser import *
+from lang.resolver import UNDEFINED
+from lang.vm import bro_add, bro_divide
+from lang.arrays import BUILTIN_FUNCTIONS, index, make_array
+
+# Bro variables become Python locals with this prefix, clear of the helpers' names
+VARIABLE_PREFIX = "bro_"
+UNDEFINED_VARIABLE = re.compile(r"'bro_(\w+)'")
+
+# Python precedence levels of the generated expressions; higher binds tighter
+COMPARISON, ADDITIVE, MULTIPLICATIVE, ATOM = 1, 2, 3, 4
+PRECEDENCE = {
+    ">": COMPARISON, "<": COMPARISON, ">=": COMPARISON, "<=": COMPARISON, "==": COMPARISON, "!=": COMPARISON,
+    "+": ADDITIVE, "-": ADDITIVE,
+    "*": MULTIPLICATIVE, "/": MULTIPLICATIVE, "%": MULTIPLICATIVE,
+}
+
+
+class Transpiler:
+    """
+    Translates a Program into the source of a Python function. Bro variables
+    become locals of that function, so CPython resolves them to fast slots.
+
+    Expressions carry a static kind ("int", "str", "bool" or None when unknown)
+    so '+' and '/' only go through the bro_add/bro_divide helpers when the
+    operand types can't be settled while translating.
+    """
+
+    def __init__(self):
+        self.lines = []
+
+    def transpile(self, program):
+        self.lines.append("def bro_main(_emit, _input, _add, _divide, _list, _index, _functions, _checkpoint, _steps_left):")
+        self.block(program.statements, 1)
+        self.lines.append("    return locals()")
+        return "\n".join(self.lines) + "\n"
+
+    def line(self, indent, text):
+        self.lines.append("    " * indent + text)
+
+    def block(self, statements, indent, steps=0):
+        """Emit statements, charging the budget for them (plus `steps`) on entry."""
+        steps += len(statements)
+        if steps:
+            self.line(indent, f"_steps_left -= {steps}")
+            self.line(indent, "if _steps_left < 0:")
+            self.line(indent + 1, "_steps_left = _checkpoint(_steps_left)")
+        else:
+            self.line(indent, "pass")
+        for statement in statements:
+            self.statement(statement, indent)
+
+    def statement(self, node, indent):
+        if isinstance(node, PrintStatement):
+            source, kind = self.expression(node.expression)
+            self.line(indent, f"_emit({source})" if kind == "str" else f"_emit(str({source}))")
+
+        elif isinstance(node, VariableDeclaration):
+            if isinstance(node.value, Literal) and node.value.value == "INPUT":
+                self.line(indent, f"{VARIABLE_PREFIX}{node.name} = _input({node.name!r})")
+            else:
+                source, kind = self.expression(node.value)
+                self.line(indent, f"{VARIABLE_PREFIX}{node.name} = {source}")
+
+        elif isinstance(node, WhileLoop):
+            condition, kind = self.expression(node.condition)
+            self.line(indent, f"while {condition}:")
+            self.block(node.body, indent + 1, steps=1)  # each iteration is a step of its own
+
+        elif isinstance(node, IfStatement):
+            condition, kind = self.expression(node.condition)
+            self.line(indent, f"if {condition}:")
+            self.block(node.if_body, indent + 1)
+            if node.else_body:
+                self.line(indent, "else:")
+                self.block(node.else_body, indent + 1)
+
+        else:
+            raise TypeError(f"Bro, I don't know how to compile this: {node}")
+
+    def expression(self, node):
+        """Return (python_source, kind) for an expression node."""
+        source, kind, precedence = self.operand(node)
+        return source, kind
+
+    def operand(self, node):
+        """
+        Return (python_source, kind, precedence). Parentheses are only added
+        where Python's precedence would otherwise regroup the operands, which
+        keeps long chains flat enough for CPython's parser.
+        """
+        if isinstance(node, Literal):
+            value = node.value
+            if isinstance(value, bool):
+                return repr(value), "bool", ATOM
+            if isinstance(value, int):
+                return repr(value), "int", ATOM
+            if isinstance(value, str):
+                return repr(value), "str", ATOM
+            if isinstance(value, float) and not math.isfinite(value):
+                # repr() gives a bare inf or nan, which Python reads as a name
+                return f"float('{value}')", None, ATOM
+            return repr(value), None, ATOM
+
+        elif isinstance(node, VariableReference):
+            return VARIABLE_PREFIX + node.name, None, ATOM
+
+        elif isinstance(node, BinaryOperation):
+            operator = node.operator
+            precedence = PRECEDENCE.get(operator)
+            if precedence is None:
+                raise SyntaxError(f"Bro, unsupported operator: {operator}")
+            left, left_kind, left_precedence = self.operand(node.left)
+            right, right_kind, right_precedence = self.operand(node.right)
+
+            if operator == "+":
+                if left_kind == "str" or right_kind == "str":
+                    left = left if left_kind == "str" else f"str({left})"
+                    right = right if right_kind == "str" else f"str({right})"
+                    left = group(left, left_precedence if left_kind == "str" else ATOM, ADDITIVE)
+                    right = group(right, right_precedence if right_kind == "str" else ATOM, ADDITIVE + 1)
+                    return f"{left} + {right}", "str", ADDITIVE
+                if left_kind != "int" or right_kind != "int":
+                    return f"_add({left}, {right})", None, ATOM
+                kind = "int"
+            elif operator == "/":
+                if not (isinstance(node.right, Literal) and right_kind == "int" and node.right.value != 0):
+                    return f"_divide({left}, {right})", None, ATOM
+                kind = None
+            elif precedence == COMPARISON:
+                # Python would chain 'a < b < c', so comparisons never nest bare
+                kind = "bool"
+            else:
+                kind = "int" if left_kind == "int" and right_kind == "int" else None
+
+            left = group(left, left_precedence, precedence + (precedence == COMPARISON))
+            right = group(right, right_precedence, precedence + 1)
+            return f"{left} {operator} {right}", kind, precedence
+
+        elif isinstance(node, Concat):
+            parts = []
+            for part in node.parts:
+                source, kind, precedence = self.operand(part)
+                parts.append(source if kind == "str" else f"str({source})")
+            return f"''.join(({', '.join(parts)},))", "str", ATOM
+
+        elif isinstance(node, ListLiteral):
+            elements = [self.expression(element)[0] for element in node.elements]
+            return f"_list([{', '.join(elements)}])", None, ATOM
+
+        elif isinstance(node, Index):
+            target, kind = self.expression(node.target)
+            position, kind = self.expression(node.index)
+            return f"_index({target}, {position})", None, ATOM
+
+        elif isinstance(node, Call):
+            arguments = [self.expression(argument)[0] for argument in node.arguments]
+            kind = "int" if node.name == "len" else None
+            return f"_functions[{node.function}]({', '.join(arguments)})", kind, ATOM
+
+        raise TypeError(f"Bro, I don't know how to evaluate this: {node}")
+
+
+def group(source, precedence, minimum):
+    """Parenthesise `source` when it binds looser than its position needs."""
+    return source if precedence >= minimum else f"({source})"
+
+
+def transpile(program):
+    """Translate a Program into Python source defining `bro_main`."""
+    return Transpiler().transpile(program)
+
+
+def compile_to_python(program):
+    """Compile a Program into a Python function via the transpiled source."""
+    namespace = {}
+    exec(compile(transpile(program), "<bro>", "exec"), namespace)
+    return namespace["bro_main"]
+
+
+def steps_left_at(error, function, default):
+    """The step countdown of `function`'s frame when it raised `error`, read from the traceback."""
+    traceback = error.__traceback__
+    while traceback is not None:
+        if traceback.tb_frame.f_code is function.__code__:
+            return traceback.tb_frame.f_locals.get("_steps_left", default)
+        traceback = traceback.tb_next
+    return default
+
+
+class PythonRunner:
+    """Runs a function from compile_to_python() against an Interpreter's state."""
+
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+
+    def run(self, function):
+        interpreter = self.interpreter
+        try:
+            budget = interpreter.budget
+            local_variables = function(
+                interpreter.emit, interpreter.read_input, bro_add, bro_divide, make_array, index, BUILTIN_FUNCTIONS,
+                budget.checkpoint, budget.allowance,
+            )
+        except BaseException as error:
+            budget.settle(steps_left_at(error, function, budget.allowance))
+            if not isinstance(error, NameError):
+                raise
+            # Reading a Bro variable before it is set surfaces as an unbound Python local
+            match = UNDEFINED_VARIABLE.search(str(error))
+            if match is None:
+                raise
+            raise NameError(f"Bro, variable '{match.group(1)}' is not defined") from None
+
+        budget.settle(local_variables["_steps_left"])
+        interpreter.frame = [local_variables.get(VARIABLE_PREFIX + name, UNDEFINED) for name in interpreter.slot_names]
+        return "\n".join(interpreter.output)
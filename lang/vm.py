@@ -0,0 +1,252 @@
+import operator
+
+from lang.resolver import UNDEFINED
+
+from lang.compiler import (
+    LOAD_CONST, LOAD_NAME, STORE_NAME, BINARY_OP, BINARY_OP_STORE, JUMP,
+    STEP, PRINT, INPUT, BINARY_OP_CONST, BINARY_OP_NAME,
+    NAME_OP_CONST, NAME_OP_NAME, OPERATOR_BITS, OPERATOR_MASK, OPERAND_MASK,
+    LEFT_SHIFT, CONCAT, BUILD_LIST, INDEX, CALL, NAME_OP_CONST_UPDATE,
+    BRANCH, LOOP, NAME_OP_CONST_BRANCH, NAME_OP_NAME_BRANCH, NAME_OP_CONST_LOOP, NAME_OP_NAME_LOOP,
+)
+from lang.parser import OPERATORS
+from lang.strings import BUILD_THRESHOLD, StringBuilder, concatenate
+from lang.arrays import Array, BUILTIN_FUNCTIONS, index, make_array
+
+
+def bro_add(left, right):
+    """'+' concatenates as soon as either side is a string."""
+    if isinstance(left, str) or isinstance(right, str):
+        return str(left) + str(right)
+    return left + right
+
+
+def bro_divide(left, right):
+    # A list divisor is checked element by element, by lang.arrays
+    if type(right) is not Array and right == 0:
+        raise ZeroDivisionError("Bro, you can't divide by zero!")
+    return left / right
+
+
+# Indexed by operator code, in the order of parser.OPERATORS
+BINARY_OPERATORS = (
+    bro_add, operator.sub, operator.mul, bro_divide, operator.mod,
+    operator.gt, operator.lt, operator.ge, operator.le, operator.eq, operator.ne,
+)
+assert len(BINARY_OPERATORS) == len(OPERATORS)
+
+
+def build_add(left, right):
+    """bro_add for running programs: long strings are built up by lang.strings instead of copied."""
+    if type(left) is StringBuilder or (type(left) is str and len(left) >= BUILD_THRESHOLD):
+        return concatenate(left, right if type(right) is str else str(right))
+    if isinstance(left, str) or isinstance(right, (str, StringBuilder)):
+        return str(left) + str(right)
+    return left + right
+
+
+# What the VM runs with; BINARY_OPERATORS stays plain for constant folding, whose results go into the AST
+RUNTIME_OPERATORS = (build_add,) + BINARY_OPERATORS[1:]
+# Operators on two ints, by op code: '+' can't meet a string there
+INT_OPERATORS = (operator.add,) + BINARY_OPERATORS[1:]
+
+
+class VirtualMachine:
+    """
+    Stack machine that runs a CodeObject against an Interpreter's state:
+    its variables, output list and input/output callbacks.
+    """
+
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+
+    def run(self, code_object):
+        """Run to completion, reading input through the interpreter; returns the joined output."""
+        execution = self.execute(code_object)
+        try:
+            name = next(execution)
+            while True:
+                name = execution.send(self.interpreter.read_input(name))
+        except StopIteration as stop:
+            return stop.value
+
+    def execute(self, code_object):
+        """
+        Generator that runs the program, yielding the variable name at every
+        INPUT and storing the value sent back. Returns the joined output.
+        """
+        interpreter = self.interpreter
+        frame = interpreter.frame  # laid out for this program by Interpreter.load_frame
+        output = interpreter.output
+        constants = code_object.constants
+        names = code_object.names
+        binary_operators = RUNTIME_OPERATORS
+        int_operators = INT_OPERATORS
+        budget = interpreter.budget
+        steps_left = budget.allowance
+
+        # A plain list indexes faster than the array it came from
+        code = code_object.code.tolist()
+        end = len(code)
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        pc = 0
+
+        try:
+            # Ordered by how often loops run each instruction, since dispatch tries them in turn
+            while pc < end:
+                opcode = code[pc]
+                argument = code[pc + 1]
+                pc += 2
+
+                # Operations on two ints skip the generic operators, whose '+' is a Python function
+                if opcode == NAME_OP_CONST:
+                    left = frame[argument >> LEFT_SHIFT]
+                    right = constants[(argument >> OPERATOR_BITS) & OPERAND_MASK]
+                    if type(left) is int and type(right) is int:
+                        push(int_operators[argument & OPERATOR_MASK](left, right))
+                    else:
+                        if left is UNDEFINED:
+                            raise NameError(f"Bro, variable '{names[argument >> LEFT_SHIFT]}' is not defined")
+                        push(binary_operators[argument & OPERATOR_MASK](left, right))
+                elif opcode == NAME_OP_CONST_UPDATE:
+                    slot = argument >> LEFT_SHIFT
+                    left = frame[slot]
+                    right = constants[(argument >> OPERATOR_BITS) & OPERAND_MASK]
+                    if type(left) is int and type(right) is int:
+                        frame[slot] = int_operators[argument & OPERATOR_MASK](left, right)
+                    else:
+                        if left is UNDEFINED:
+                            raise NameError(f"Bro, variable '{names[slot]}' is not defined")
+                        frame[slot] = binary_operators[argument & OPERATOR_MASK](left, right)
+                elif opcode == STORE_NAME:
+                    frame[argument] = pop()
+                elif opcode == LOAD_NAME:
+                    value = frame[argument]
+                    if value is UNDEFINED:
+                        raise NameError(f"Bro, variable '{names[argument]}' is not defined")
+                    push(value)
+                elif opcode == NAME_OP_CONST_LOOP or opcode == NAME_OP_CONST_BRANCH:
+                    left = frame[argument >> LEFT_SHIFT]
+                    right = constants[(argument >> OPERATOR_BITS) & OPERAND_MASK]
+                    if type(left) is int and type(right) is int:
+                        condition = int_operators[argument & OPERATOR_MASK](left, right)
+                    else:
+                        if left is UNDEFINED:
+                            raise NameError(f"Bro, variable '{names[argument >> LEFT_SHIFT]}' is not defined")
+                        condition = binary_operators[argument & OPERATOR_MASK](left, right)
+                    if condition:
+                        steps_left -= code[pc + 1]
+                        if steps_left < 0:
+                            steps_left = budget.checkpoint(steps_left)
+                        pc = code[pc] if opcode == NAME_OP_CONST_LOOP else pc + 2
+                    else:
+                        pc = pc + 2 if opcode == NAME_OP_CONST_LOOP else code[pc]
+                elif opcode == BINARY_OP_CONST:
+                    left = stack[-1]
+                    right = constants[argument >> OPERATOR_BITS]
+                    if type(left) is int and type(right) is int:
+                        stack[-1] = int_operators[argument & OPERATOR_MASK](left, right)
+                    else:
+                        stack[-1] = binary_operators[argument & OPERATOR_MASK](left, right)
+                elif opcode == BINARY_OP_STORE:
+                    right = pop()
+                    left = pop()
+                    if type(left) is int and type(right) is int:
+                        frame[argument >> OPERATOR_BITS] = int_operators[argument & OPERATOR_MASK](left, right)
+                    else:
+                        frame[argument >> OPERATOR_BITS] = binary_operators[argument & OPERATOR_MASK](left, right)
+                elif opcode == NAME_OP_NAME:
+                    left = frame[argument >> LEFT_SHIFT]
+                    right = frame[(argument >> OPERATOR_BITS) & OPERAND_MASK]
+                    if type(left) is int and type(right) is int:
+                        push(int_operators[argument & OPERATOR_MASK](left, right))
+                    else:
+                        if left is UNDEFINED:
+                            raise NameError(f"Bro, variable '{names[argument >> LEFT_SHIFT]}' is not defined")
+                        if right is UNDEFINED:
+                            raise NameError(f"Bro, variable '{names[(argument >> OPERATOR_BITS) & OPERAND_MASK]}' is not defined")
+                        push(binary_operators[argument & OPERATOR_MASK](left, right))
+                elif opcode == NAME_OP_NAME_LOOP or opcode == NAME_OP_NAME_BRANCH:
+                    left = frame[argument >> LEFT_SHIFT]
+                    right = frame[(argument >> OPERATOR_BITS) & OPERAND_MASK]
+                    if type(left) is int and type(right) is int:
+                        condition = int_operators[argument & OPERATOR_MASK](left, right)
+                    else:
+                        if left is UNDEFINED:
+                            raise NameError(f"Bro, variable '{names[argument >> LEFT_SHIFT]}' is not defined")
+                        if right is UNDEFINED:
+                            raise NameError(f"Bro, variable '{names[(argument >> OPERATOR_BITS) & OPERAND_MASK]}' is not defined")
+                        condition = binary_operators[argument & OPERATOR_MASK](left, right)
+                    if condition:
+                        steps_left -= code[pc + 1]
+                        if steps_left < 0:
+                            steps_left = budget.checkpoint(steps_left)
+                        pc = code[pc] if opcode == NAME_OP_NAME_LOOP else pc + 2
+                    else:
+                        pc = pc + 2 if opcode == NAME_OP_NAME_LOOP else code[pc]
+                elif opcode == LOOP or opcode == BRANCH:
+                    if pop():
+                        steps_left -= code[pc + 1]
+                        if steps_left < 0:
+                            steps_left = budget.checkpoint(steps_left)
+                        pc = code[pc] if opcode == LOOP else pc + 2
+                    else:
+                        pc = pc + 2 if opcode == LOOP else code[pc]
+                elif opcode == BINARY_OP_NAME:
+                    right = frame[argument >> OPERATOR_BITS]
+                    if right is UNDEFINED:
+                        raise NameError(f"Bro, variable '{names[argument >> OPERATOR_BITS]}' is not defined")
+                    left = stack[-1]
+                    if type(left) is int and type(right) is int:
+                        stack[-1] = int_operators[argument & OPERATOR_MASK](left, right)
+                    else:
+                        stack[-1] = binary_operators[argument & OPERATOR_MASK](left, right)
+                elif opcode == LOAD_CONST:
+                    push(constants[argument])
+                elif opcode == BINARY_OP:
+                    right = pop()
+                    left = stack[-1]
+                    if type(left) is int and type(right) is int:
+                        stack[-1] = int_operators[argument](left, right)
+                    else:
+                        stack[-1] = binary_operators[argument](left, right)
+                elif opcode == JUMP:
+                    pc = argument
+                elif opcode == STEP:
+                    steps_left -= argument
+                    if steps_left < 0:
+                        steps_left = budget.checkpoint(steps_left)
+                elif opcode == PRINT:
+                    interpreter.emit(str(pop()))
+                elif opcode == CONCAT:
+                    parts = stack[-argument:]
+                    del stack[-argument:]
+                    first = parts[0]
+                    if type(first) is StringBuilder or (type(first) is str and len(first) >= BUILD_THRESHOLD):
+                        push(concatenate(first, *map(str, parts[1:])))
+                    else:
+                        push("".join(map(str, parts)))
+                elif opcode == BUILD_LIST:
+                    if argument:
+                        elements = stack[-argument:]
+                        del stack[-argument:]
+                        push(make_array(elements))
+                    else:
+                        push(make_array([]))
+                elif opcode == INDEX:
+                    position = pop()
+                    stack[-1] = index(stack[-1], position)
+                elif opcode == CALL:
+                    count = argument >> OPERATOR_BITS
+                    arguments = stack[-count:]
+                    del stack[-count:]
+                    push(BUILTIN_FUNCTIONS[argument & OPERATOR_MASK](*arguments))
+                elif opcode == INPUT:
+                    frame[argument] = yield names[argument]
+                else:
+                    raise RuntimeError(f"Bro, unknown opcode: {opcode}")
+        finally:
+            budget.settle(steps_left)
+        return "\n".join(output)
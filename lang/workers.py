@@ -0,0 +1,280 @@
+import math
+import multiprocessing
+import os
+import time
+from queue import Queue
+from threading import Lock
+
+try:
+    import resource
+except ImportError:  # not on Windows; CPU budgets are then left to the wall-clock timeout
+    resource = None
+
+from lang.lexer import tokenize
+from lang.parser import parse
+from lang.optimizer import optimize
+from lang.resolver import resolve
+from lang.interpreter import Interpreter
+from lang.cache import ProgramCache
+from lang.budget import BudgetExceeded
+from lang.profiler import ProfilingInterpreter
+
+
+def compile_source(code, timings=None):
+    """Compile a program, recording 'lex' and 'parse' seconds in `timings` if given."""
+    started = time.perf_counter()
+    tokens = tokenize(code)
+    lexed = time.perf_counter()
+    program = resolve(optimize(parse(tokens)))
+    if timings is not None:
+        timings['lex'] = lexed - started
+        timings['parse'] = time.perf_counter() - lexed
+    return program
+
+
+def run_program(code, inputs=(), engine="tree", program_cache=None, budget=None, profile=False, output_callback=None):
+    """
+    Run a Bro program to completion, answering 'bro ask' from `inputs` and
+    passing each printed line to `output_callback` if given.
+    Returns a {'success', 'output'} result like the server's, plus
+    'budget_exceeded' and 'budget' when the run went over its ExecutionBudget,
+    'error_type' when it failed, and the seconds each phase took in 'timings'.
+    With `profile`, the run is timed statement by statement on the tree
+    engine and the report is returned in 'profile'.
+    """
+    timings = {}
+    remaining = iter(inputs)
+
+    def input_callback():
+        try:
+            return next(remaining)
+        except StopIteration:
+            raise RuntimeError("Bro, you ran out of input") from None
+
+    interpreter = ProfilingInterpreter(budget) if profile else Interpreter(engine, budget)
+    interpreter.set_callbacks(input_callback, output_callback)
+    try:
+        if program_cache is not None:
+            program = program_cache.get_or_compile(code, lambda source: compile_source(source, timings))
+        else:
+            program = compile_source(code, timings)
+        started = time.perf_counter()
+        try:
+            interpreter.visit(program)
+        finally:
+            timings['execute'] = time.perf_counter() - started
+    except Exception as e:
+        result = {
+            'success': False,
+            'output': f'Bro, there was an error: {str(e)}',
+            'error_type': type(e).__name__,
+            'timings': timings,
+        }
+        if isinstance(e, BudgetExceeded):
+            result['budget_exceeded'] = e.kind
+            result['budget'] = interpreter.budget.stats()
+    else:
+        result = {'success': True, 'output': '\n'.join(interpreter.output), 'timings': timings}
+    if profile:
+        result['profile'] = interpreter.profile.to_dict(code)
+    return result
+
+
+def limit_cpu(seconds):
+    """Let this process use `seconds` more CPU time before the kernel kills it (SIGXCPU)."""
+    if resource is None or not seconds:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    limit = math.ceil(usage.ru_utime + usage.ru_stime + seconds)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (limit, hard))
+
+
+class LineSender:
+    """
+    Sends a worker's printed lines to the parent as ('output', lines)
+    messages: the first line at once, then at most one message every
+    FLUSH_INTERVAL seconds, so a chatty program isn't one pipe write per line.
+    """
+
+    FLUSH_INTERVAL = 0.05
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.lines = []
+        self.flushed = 0
+
+    def __call__(self, line):
+        self.lines.append(line)
+        if time.monotonic() - self.flushed >= self.FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if self.lines:
+            self.connection.send(('output', self.lines))
+            self.lines = []
+        self.flushed = time.monotonic()
+
+
+def worker_main(connection, engine, cache_limits):
+    """
+    Worker process loop: receive (code, inputs, cpu_time, budget, profile)
+    jobs, stream the lines each one prints, then send ('result', result)
+    with the stats of the worker's ProgramCache (built with `cache_limits`)
+    in 'program_cache'.
+    """
+    program_cache = ProgramCache(**cache_limits)
+    while True:
+        try:
+            job = connection.recv()
+        except (EOFError, OSError):
+            return
+        if job is None:
+            return
+        code, inputs, cpu_time, budget, profile = job
+        limit_cpu(cpu_time)
+        sender = LineSender(connection)
+        result = run_program(code, inputs, engine, program_cache, budget, profile, sender)
+        sender.flush()
+        result['program_cache'] = program_cache.stats()
+        connection.send(('result', result))
+
+
+class Worker:
+    """One warm worker process and the parent's end of its pipe."""
+
+    def __init__(self, context, engine, cache_limits):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=worker_main, args=(child_connection, engine, cache_limits), daemon=True)
+        self.cache_stats = None  # its ProgramCache's stats as of its last job
+        self.process.start()
+        child_connection.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+    def stop(self):
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.connection.close()
+
+
+class WorkerPool:
+    """
+    A fixed pool of worker processes that already have `lang` imported.
+
+    Each job runs in one worker under a hard wall-clock `timeout` and a
+    `cpu_time` budget (seconds; defaults to the timeout). A worker that
+    blows either is killed and replaced, so a runaway program costs one
+    process restart and never a stuck server thread. Jobs beyond the pool
+    size wait for a free worker, so throughput scales with `size`, which
+    defaults to the number of cores.
+
+    Every worker keeps its own ProgramCache of up to `cache_entries`
+    programs and `cache_bytes` of source (ProgramCache's defaults if None);
+    stats() adds them up.
+    """
+
+    def __init__(self, size=None, timeout=5, cpu_time=None, engine="tree", cache_entries=None, cache_bytes=None):
+        self.size = size or os.cpu_count() or 1
+        self.timeout = timeout
+        self.cpu_time = cpu_time or timeout
+        self.engine = engine
+        self.cache_limits = {}
+        if cache_entries is not None:
+            self.cache_limits['max_entries'] = cache_entries
+        if cache_bytes is not None:
+            self.cache_limits['max_bytes'] = cache_bytes
+        self.context = self._context()
+        self.idle = Queue()
+        self.lock = Lock()
+        self.jobs = 0
+        self.restarts = 0
+        self.workers = []
+        # Cache counters of workers that were killed, so the pool's totals never go down
+        self.retired_cache = {'hits': 0, 'misses': 0, 'evictions': 0}
+        for _ in range(self.size):
+            worker = Worker(self.context, engine, self.cache_limits)
+            self.workers.append(worker)
+            self.idle.put(worker)
+
+    @staticmethod
+    def _context():
+        # Fork workers from a clean single-threaded server with lang preloaded,
+        # rather than from a threaded web server
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(["lang.workers"])
+            return context
+        return multiprocessing.get_context("spawn")
+
+    def run(self, code, inputs=(), timeout=None, budget=None, profile=False, output_callback=None):
+        """
+        Run `code` in a worker and return its {'success', 'output'} result,
+        passing each line to `output_callback` as the worker prints it.
+        A `budget` ends the run gracefully; `timeout` is the hard kill.
+        """
+        timeout = timeout or self.timeout
+        worker = self.idle.get()
+        with self.lock:
+            self.jobs += 1
+        try:
+            try:
+                worker.connection.send((code, list(inputs), self.cpu_time, budget, profile))
+                deadline = timeout and time.monotonic() + timeout
+                while True:
+                    wait = deadline and deadline - time.monotonic()
+                    if wait is not None and wait <= 0 or not worker.connection.poll(wait):
+                        break
+                    kind, message = worker.connection.recv()
+                    if kind == 'result':
+                        worker.cache_stats = message.pop('program_cache', None)
+                        return message
+                    if output_callback is not None:
+                        for line in message:
+                            output_callback(line)
+                error = f"Bro, your code took too long to run (over {timeout}s)"
+            except (EOFError, OSError):
+                # The kernel killed the worker for going over its CPU budget
+                error = "Bro, your code used too much CPU time"
+            worker.kill()
+            replacement = Worker(self.context, self.engine, self.cache_limits)
+            with self.lock:
+                self.restarts += 1
+                if worker.cache_stats is not None:
+                    for name in self.retired_cache:
+                        self.retired_cache[name] += worker.cache_stats[name]
+                self.workers[self.workers.index(worker)] = replacement
+            worker = replacement
+            return {'success': False, 'output': error, 'timed_out': True}
+        finally:
+            self.idle.put(worker)
+
+    def close(self):
+        for _ in range(self.size):
+            self.idle.get().stop()
+
+    def stats(self):
+        with self.lock:
+            cache = dict(self.retired_cache, entries=0, bytes=0)
+            for worker in self.workers:
+                if worker.cache_stats is not None:
+                    for name in cache:
+                        cache[name] += worker.cache_stats[name]
+            return {
+                'size': self.size,
+                'idle': self.idle.qsize(),
+                'jobs': self.jobs,
+                'restarts': self.restarts,
+                'program_cache': cache,
+            }
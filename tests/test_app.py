@@ -0,0 +1,93 @@
+"""The server's /run, /stream, /result and /input, running programs in-process."""
+import json
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("flask_cors")
+
+import app as server
+
+from tests.test_engines import program
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setitem(server.app.config, 'EXECUTION_BACKEND', 'thread')
+    server.result_cache.clear()
+    return server.app.test_client()
+
+
+def events(client, session_id):
+    """The (event, data) pairs /stream sends until the run is done or waits for input."""
+    response = client.get("/stream", query_string={"session_id": session_id}, buffered=False)
+    received = []
+    for chunk in response.response:
+        chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+        if chunk.startswith(":"):
+            continue
+        lines = dict(line.split(": ", 1) for line in chunk.strip().split("\n"))
+        received.append((lines["event"], json.loads(lines["data"])))
+        if lines["event"] in ("done", "input"):
+            break
+    response.close()
+    return received
+
+
+def run(client, code, **options):
+    reply = client.post("/run", json=dict(options, code=code)).get_json()
+    return reply["session_id"], events(client, reply["session_id"])
+
+
+def test_run_streams_output(client):
+    session_id, received = run(client, program("bro say 1\nbro say 2"))
+    assert received == [("output", {"line": "1"}), ("output", {"line": "2"}), ("done", {"success": True})]
+    result = client.get("/result", query_string={"session_id": session_id}).get_json()
+    assert result["output"] == "1\n2"
+
+
+def test_run_answers_before_the_program_ends(client):
+    code = program('bro say "go"\nbro this is i = 0\nkeep going bro i < 300000 { i = i + 1 }\nbro say i')
+    reply = client.post("/run", json={"code": code}).get_json()
+    assert "300000" not in reply["output"]
+    received = events(client, reply["session_id"])
+    assert received == [("output", {"line": "go"}), ("output", {"line": "300000"}), ("done", {"success": True})]
+
+
+def test_errors_end_the_stream(client):
+    session_id, received = run(client, program("bro say 1\nbro say y"))
+    assert received[0] == ("output", {"line": "1"})
+    event, data = received[-1]
+    assert event == "done" and not data["success"]
+    assert "variable 'y' is not defined" in data["error"]
+
+
+def test_limits_from_the_request(client):
+    code = program("bro this is i = 0\nkeep going bro 1 < 2 { i = i + 1 }")
+    session_id, received = run(client, code, limits={"max_steps": 500})
+    event, data = received[-1]
+    assert data["budget_exceeded"] == "steps"
+    assert data["budget"]["steps"] == 500
+
+
+def test_second_run_is_cached(client):
+    code = program("bro say 1 + 1")
+    run(client, code)
+    session_id, received = run(client, code)
+    assert received == [("output", {"line": "2"}), ("done", {"success": True, "cached": True})]
+    session_id, received = run(client, code, cache=False)
+    assert "cached" not in received[-1][1]
+
+
+def test_input(client):
+    session_id, received = run(client, program('bro ask n\nbro say n * 2'))
+    assert received == [("input", {})]
+    reply = client.post("/input", json={"session_id": session_id, "input": "21"}).get_json()
+    assert reply["success"]
+    result = client.get("/result", query_string={"session_id": session_id}).get_json()
+    assert result["output"] == "42"
+    assert not result["waiting_for_input"]
+
+
+def test_unknown_session(client):
+    assert client.get("/result", query_string={"session_id": "nope"}).status_code == 404
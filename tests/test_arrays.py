@@ -0,0 +1,122 @@
+"""Array semantics, the same with NumPy as with plain lists."""
+import pytest
+
+import lang.arrays
+from lang.arrays import Array, bro_len, bro_max, bro_min, bro_range, bro_sum, index, make_array
+from lang.budget import BudgetExceeded, ExecutionBudget
+
+
+@pytest.fixture(params=["numpy", "lists"], autouse=True)
+def backing(request, monkeypatch):
+    """Run every test with NumPy, when installed, and with plain lists."""
+    if request.param == "numpy":
+        if lang.arrays.numpy is None:
+            pytest.skip("NumPy is not installed")
+    else:
+        monkeypatch.setattr(lang.arrays, "numpy", None)
+    return request.param
+
+
+@pytest.fixture(autouse=True)
+def unlimited():
+    """List work is charged to the last budget started on this thread, so start one without limits."""
+    return ExecutionBudget(max_steps=None)
+
+
+def test_bool_raises():
+    with pytest.raises(TypeError):
+        bool(make_array([1, 2]))
+    with pytest.raises(TypeError):
+        bool(make_array([]))
+    with pytest.raises(TypeError):
+        if make_array([1]) == make_array([1]):
+            pass
+
+
+def test_str():
+    assert str(make_array([1, 2, 3])) == "[1, 2, 3]"
+    assert str(make_array([1, "a", 2.5, True])) == '[1, "a", 2.5, True]'
+    assert str(make_array([])) == "[]"
+
+
+def test_elementwise_operators():
+    numbers = make_array([1, 2, 3])
+    assert (numbers + 1).values() == [2, 3, 4]
+    assert (10 - numbers).values() == [9, 8, 7]
+    assert (numbers * numbers).values() == [1, 4, 9]
+    assert (numbers / 2).values() == [0.5, 1.0, 1.5]
+    assert (numbers % 2).values() == [1, 0, 1]
+    assert (numbers > 1).values() == [False, True, True]
+    assert (numbers == make_array([1, 0, 3])).values() == [True, False, True]
+    assert ("n" + numbers).values() == ["n1", "n2", "n3"]
+
+
+def test_elementwise_keeps_python_semantics():
+    big = make_array([2 ** 62, 2 ** 62])
+    assert (big * 4).values() == [2 ** 64, 2 ** 64]
+    assert (make_array([2 ** 53 + 1]) == 2.0 ** 53).values() == [False]
+    with pytest.raises(ZeroDivisionError):
+        make_array([1, 2]) / 0
+    with pytest.raises(ZeroDivisionError):
+        make_array([1, 2]) % make_array([1, 0])
+
+
+def test_lengths_must_match():
+    with pytest.raises(ValueError):
+        make_array([1, 2]) + make_array([1, 2, 3])
+
+
+def test_arrays_are_not_hashable():
+    with pytest.raises(TypeError):
+        hash(make_array([1]))
+
+
+def test_index():
+    numbers = make_array([5, 6, 7])
+    assert index(numbers, 0) == 5
+    assert index(numbers, -1) == 7
+    assert type(index(numbers, 1)) is int
+    assert index("bro", 1) == "r"
+    with pytest.raises(IndexError):
+        index(numbers, 3)
+    with pytest.raises(TypeError):
+        index(numbers, 1.0)
+    with pytest.raises(TypeError):
+        index(5, 0)
+
+
+def test_builtins():
+    numbers = bro_range(1, 11)
+    assert bro_len(numbers) == 10
+    assert bro_sum(numbers) == 55
+    assert bro_min(numbers) == 1
+    assert bro_max(numbers) == 10
+    assert bro_sum(make_array([])) == 0
+    assert bro_sum(make_array(["a", 1])) == "a1"
+    assert bro_sum(make_array([0.1, 0.2, 0.3])) == 0.1 + 0.2 + 0.3
+    assert bro_range(10, 0, -3).values() == [10, 7, 4, 1]
+    with pytest.raises(ValueError):
+        bro_min(make_array([]))
+    with pytest.raises(ValueError):
+        bro_range(0, 10, 0)
+    with pytest.raises(TypeError):
+        bro_range(1.5)
+    with pytest.raises(TypeError):
+        bro_sum(5)
+
+
+def test_range_is_bounded():
+    with pytest.raises(ValueError):
+        bro_range(lang.arrays.MAX_LENGTH + 1)
+
+
+def test_list_work_is_charged_to_the_budget():
+    budget = ExecutionBudget(max_steps=100)
+    with pytest.raises(BudgetExceeded):
+        bro_sum(bro_range(10000))
+    assert budget.stats()['steps'] == 100
+
+
+def test_make_array_is_an_array():
+    assert isinstance(make_array([1, 2]), Array)
+    assert make_array([1, "a"]).values() == [1, "a"]
@@ -0,0 +1,115 @@
+""".broc artifacts: round trips, the version stamp and when a saved program is reused."""
+import os
+
+import pytest
+
+from lang.artifact import (
+    FORMAT_VERSION, HEADER, MAGIC, cache_path, dump_program, load_or_compile, load_program,
+)
+from lang.interpreter import Interpreter
+from lang.lexer import tokenize
+from lang.optimizer import optimize
+from lang.parser import parse
+
+from tests.test_engines import PROGRAMS, program
+
+SOURCE = program('bro this is x = 6\nbro if x > 5 { bro say "big " + x } bro else { bro say [x, x * 2] }')
+
+
+def compile_source(code):
+    return optimize(parse(tokenize(code)))
+
+
+class CountingCompiler:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, code):
+        self.calls += 1
+        return compile_source(code)
+
+
+@pytest.fixture
+def source_file(tmp_path):
+    path = tmp_path / "show.bro"
+    path.write_text(SOURCE)
+    return str(path)
+
+
+@pytest.mark.parametrize("name", sorted(PROGRAMS))
+def test_round_trip(name):
+    data = dump_program(compile_source(PROGRAMS[name]))
+    assert dump_program(load_program(data)) == data
+
+
+def test_deep_expression_round_trip():
+    ast = compile_source(program("bro this is x = 1\nbro say " + " + ".join(["x"] * 5000)))
+    loaded = load_program(dump_program(ast))
+    assert Interpreter("vm").visit(loaded) == "5000"
+
+
+def test_reused_while_unchanged(source_file):
+    compiler = CountingCompiler()
+    first = load_or_compile(source_file, compiler)
+    second = load_or_compile(source_file, compiler)
+    assert compiler.calls == 1
+    assert os.path.exists(cache_path(source_file))
+    assert Interpreter().visit(second) == Interpreter().visit(first) == "big 6"
+
+
+def test_touched_source_is_restamped(source_file):
+    compiler = CountingCompiler()
+    load_or_compile(source_file, compiler)
+    stat = os.stat(source_file)
+    os.utime(source_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    load_or_compile(source_file, compiler)
+    assert compiler.calls == 1
+    with open(cache_path(source_file), "rb") as file:
+        mtime = HEADER.unpack(file.read(HEADER.size))[2]
+    assert mtime == os.stat(source_file).st_mtime_ns
+
+
+def test_edited_source_is_recompiled(source_file):
+    compiler = CountingCompiler()
+    load_or_compile(source_file, compiler)
+    with open(source_file, "w") as file:
+        file.write(SOURCE.replace("6", "4"))
+    assert Interpreter().visit(load_or_compile(source_file, compiler)) == "[4, 8]"
+    assert compiler.calls == 2
+
+
+def test_other_format_version_is_recompiled(source_file):
+    compiler = CountingCompiler()
+    load_or_compile(source_file, compiler)
+    path = cache_path(source_file)
+    with open(path, "r+b") as file:
+        magic, version, mtime, size, digest = HEADER.unpack(file.read(HEADER.size))
+        assert (magic, version) == (MAGIC, FORMAT_VERSION)
+        file.seek(0)
+        file.write(HEADER.pack(magic, FORMAT_VERSION - 1, mtime, size, digest))
+    load_or_compile(source_file, compiler)
+    assert compiler.calls == 2
+    with open(path, "rb") as file:
+        assert HEADER.unpack(file.read(HEADER.size))[1] == FORMAT_VERSION
+
+
+def test_broken_artifact_is_recompiled(source_file):
+    compiler = CountingCompiler()
+    load_or_compile(source_file, compiler)
+    path = cache_path(source_file)
+    with open(path, "r+b") as file:
+        file.truncate(HEADER.size + 3)
+    assert Interpreter().visit(load_or_compile(source_file, compiler)) == "big 6"
+    assert compiler.calls == 2
+
+
+def test_cache_dir_keeps_same_names_apart(tmp_path):
+    first = tmp_path / "a" / "show.bro"
+    second = tmp_path / "b" / "show.bro"
+    for path in (first, second):
+        path.parent.mkdir()
+        path.write_text(SOURCE)
+    cache_dir = str(tmp_path / "cache")
+    assert cache_path(str(first), cache_dir) != cache_path(str(second), cache_dir)
+    load_or_compile(str(first), compile_source, cache_dir)
+    assert os.path.exists(cache_path(str(first), cache_dir))
@@ -0,0 +1,91 @@
+"""Step, time and output limits, enforced the same way by every engine."""
+import pytest
+
+from lang.budget import BudgetExceeded, ExecutionBudget
+from lang.interpreter import Interpreter
+from lang.lexer import tokenize
+from lang.optimizer import optimize
+from lang.options import ENGINES
+from lang.parser import parse
+
+from tests.test_engines import program
+
+FOREVER = program("bro this is i = 0\nkeep going bro 1 < 2 { i = i + 1 }")
+CHATTY = program('bro this is i = 0\nkeep going bro i < 100000 {\n    bro say "spam spam spam"\n    i = i + 1\n}')
+COUNTING = program("bro this is i = 0\nkeep going bro i < 500 { i = i + 1 }\nbro say i")
+
+
+def run(source, engine, budget):
+    interpreter = Interpreter(engine, budget)
+    return interpreter.visit(optimize(parse(tokenize(source))))
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_step_limit(engine):
+    budget = ExecutionBudget(max_steps=1234)
+    with pytest.raises(BudgetExceeded) as caught:
+        run(FOREVER, engine, budget)
+    assert caught.value.kind == "steps"
+    assert budget.stats()['steps'] == 1234
+    assert budget.stats()['exceeded'] == "steps"
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_time_limit(engine):
+    budget = ExecutionBudget(max_steps=None, timeout=0.05)
+    with pytest.raises(BudgetExceeded) as caught:
+        run(FOREVER, engine, budget)
+    assert caught.value.kind == "time"
+    stats = budget.stats()
+    assert stats['elapsed'] >= 0.05
+    assert stats['steps'] > 0
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_output_limit(engine):
+    budget = ExecutionBudget(max_output=1000)
+    with pytest.raises(BudgetExceeded) as caught:
+        run(CHATTY, engine, budget)
+    assert caught.value.kind == "output"
+    stats = budget.stats()
+    assert 1000 < stats['output_size'] <= 1000 + len("spam spam spam") + 1
+    assert stats['steps'] > 0
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_steps_counted_alike(engine):
+    budget = ExecutionBudget()
+    assert run(COUNTING, engine, budget) == "500"
+    reference = ExecutionBudget()
+    run(COUNTING, "tree", reference)
+    assert budget.stats()['steps'] == reference.stats()['steps']
+    assert budget.stats()['exceeded'] is None
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_failed_run_counts_its_steps(engine):
+    budget = ExecutionBudget()
+    source = program("bro this is i = 0\nkeep going bro i < 50 { i = i + 1 }\nbro say 1 / 0")
+    with pytest.raises(ZeroDivisionError):
+        run(source, engine, budget)
+    assert budget.stats()['steps'] > 50
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_list_work_is_charged(engine):
+    budget = ExecutionBudget(max_steps=1000)
+    with pytest.raises(BudgetExceeded) as caught:
+        run(program("bro say sum(range(1000000))"), engine, budget)
+    assert caught.value.kind == "steps"
+
+
+def test_no_limits():
+    budget = ExecutionBudget(max_steps=None, timeout=None, max_output=None)
+    assert run(COUNTING, "tree", budget) == "500"
+
+
+def test_extend_pushes_the_deadline_back():
+    budget = ExecutionBudget(timeout=1)
+    deadline = budget.deadline
+    budget.extend(2)
+    assert budget.deadline == deadline + 2
@@ -0,0 +1,118 @@
+"""Program and result cache keys, hits, misses and evictions."""
+import pytest
+
+from lang.cache import ProgramCache, ResultCache, normalize_source, result_key, source_key
+from lang.lexer import tokenize
+from lang.parser import parse
+
+from tests.test_engines import program
+
+SOURCE = program("bro say 1")
+CONTEXT = ("tree", 1, 1000, 5, 1000)
+
+
+def test_normalized_sources_share_a_key():
+    assert normalize_source(SOURCE.replace("\n", "\r\n") + "  \n\n") == SOURCE
+    assert result_key(SOURCE.replace("\n", "\r\n") + "\n", CONTEXT) == result_key(SOURCE, CONTEXT)
+
+
+def test_result_key_depends_on_code_and_context():
+    keys = {
+        result_key(SOURCE, CONTEXT),
+        result_key(program("bro say 2"), CONTEXT),
+        result_key(SOURCE, ("vm",) + CONTEXT[1:]),
+        result_key(SOURCE, CONTEXT[:2] + (999,) + CONTEXT[3:]),
+    }
+    assert len(keys) == 4
+    assert result_key(SOURCE, CONTEXT) != source_key(normalize_source(SOURCE))
+
+
+class CountingCompiler:
+    def __init__(self):
+        self.sources = []
+
+    def __call__(self, code):
+        self.sources.append(code)
+        return parse(tokenize(code))
+
+
+def test_program_cache_hits():
+    cache = ProgramCache()
+    compiler = CountingCompiler()
+    first = cache.get_or_compile(SOURCE, compiler)
+    assert cache.get_or_compile(SOURCE + "\r\n", compiler) is first
+    assert compiler.sources == [SOURCE]
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries'], stats['bytes']) == (1, 1, 1, len(SOURCE))
+
+
+def test_program_cache_does_not_keep_errors():
+    cache = ProgramCache()
+    broken = program("bro say (1")
+    for _ in range(2):
+        with pytest.raises(SyntaxError):
+            cache.get_or_compile(broken, CountingCompiler())
+    assert cache.stats()['entries'] == 0
+    assert cache.stats()['misses'] == 2
+
+
+def test_program_cache_evicts_least_recently_used():
+    cache = ProgramCache(max_entries=2)
+    compiler = CountingCompiler()
+    sources = [program(f"bro say {number}") for number in range(3)]
+    cache.get_or_compile(sources[0], compiler)
+    cache.get_or_compile(sources[1], compiler)
+    cache.get_or_compile(sources[0], compiler)
+    cache.get_or_compile(sources[2], compiler)
+    assert cache.stats()['evictions'] == 1
+    cache.get_or_compile(sources[0], compiler)
+    assert len(compiler.sources) == 3
+    cache.get_or_compile(sources[1], compiler)
+    assert len(compiler.sources) == 4
+
+
+def test_program_cache_is_bounded_by_bytes():
+    cache = ProgramCache(max_bytes=len(SOURCE) * 2)
+    for number in range(5):
+        cache.get_or_compile(program(f"bro say {number}"), CountingCompiler())
+    assert cache.stats()['entries'] == 2
+    assert cache.stats()['bytes'] <= len(SOURCE) * 2
+
+
+def test_result_cache_hits_return_copies():
+    cache = ResultCache()
+    key = result_key(SOURCE, CONTEXT)
+    assert cache.get(key) is None
+    cache.put(key, {'success': True, 'output': '1', 'timings': {}})
+    result = cache.get(key)
+    assert result == {'success': True, 'output': '1'}
+    result['output'] = 'changed'
+    assert cache.get(key)['output'] == '1'
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (2, 1)
+
+
+def test_result_cache_keeps_only_successes():
+    cache = ResultCache()
+    cache.put("failed", {'success': False, 'output': 'Bro, there was an error: nope'})
+    assert cache.get("failed") is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_result_cache_expires_entries():
+    cache = ResultCache(ttl=0)
+    cache.put("key", {'success': True, 'output': '1'})
+    assert cache.get("key") is None
+    assert cache.stats()['expirations'] == 1
+    assert cache.stats()['bytes'] == 0
+
+
+def test_result_cache_skips_outputs_larger_than_itself():
+    cache = ResultCache(max_bytes=10)
+    cache.put("big", {'success': True, 'output': 'x' * 11})
+    assert cache.get("big") is None
+    cache.put("a", {'success': True, 'output': 'x' * 6})
+    cache.put("b", {'success': True, 'output': 'y' * 6})
+    assert cache.get("a") is None
+    assert cache.get("b") == {'success': True, 'output': 'y' * 6}
+    assert cache.stats()['evictions'] == 1
@@ -0,0 +1,108 @@
+"""
+Every engine, with and without the optimizer, has to print the same output
+or fail with the same error as the tree walker on the unoptimized AST.
+"""
+import glob
+import os
+
+import pytest
+
+from lang.interpreter import Interpreter
+from lang.lexer import tokenize
+from lang.optimizer import optimize
+from lang.options import ENGINES
+from lang.parser import parse
+
+EXAMPLES = sorted(glob.glob(os.path.join(os.path.dirname(os.path.dirname(__file__)), "examples", "*.bro")))
+
+# Answers to 'bro ask', in order
+INPUTS = ("21", "7")
+
+
+def program(body):
+    return f"yo bro\n{body}\npeace out bro"
+
+
+PROGRAMS = {
+    "subtraction": program("bro say 10 - 3 - 2"),
+    "precedence": program('bro say "x" + 2 * 3\nbro say (2 + 3) * 4 >= 20'),
+    "division": program("bro say 7 / 2\nbro say 8 / 2"),
+    "divide_by_zero": program("bro say 1 / 0"),
+    "undefined": program("bro say y"),
+    "bad_operands": program('bro say 5 - "a"'),
+    "concat": program('bro say "a" + "b" + 3\nbro say 1 + 2 + "x" + 1 + 2'),
+    "folded_concat": program('bro this is x = "IN" + "PUT"\nbro say x + x * 2'),
+    "counting": program("bro this is i = 0\nkeep going bro i < 50 { i = i + 1 }\nbro say i"),
+    "loop_output": program('bro this is i = 0\nkeep going bro i < 5 { i = i + 1\nbro say "i=" + i }'),
+    "loop_never_runs": program("keep going bro 1 > 2 { bro say 1 }\nbro say 2"),
+    "if_else": program('bro if 1 > 2 { bro say "a" } bro else { bro say "b" }\nbro if 3 > 2 { bro say "c" }'),
+    "nested": program(
+        "bro this is i = 0\nbro this is total = 0\n"
+        "keep going bro i < 20 {\n"
+        "    bro if i % 3 == 0 { total = total + i } bro else { bro if i % 3 == 1 { total = total - 1 } }\n"
+        "    i = i + 1\n"
+        "}\nbro say total"
+    ),
+    "conditional_declaration": program("bro if 0 { bro this is y = 2 }\nbro say y"),
+    "string_builder": program(
+        'bro this is s = ""\nbro this is i = 0\nkeep going bro i < 3000 { s = s + i\ni = i + 1 }\nbro say len(s)'
+    ),
+    "input": program('bro ask n\nbro say n * 2\nbro ask s\nbro say s + "!"'),
+    "lists": program(
+        "bro this is xs = [3, 1, 2]\nbro say xs\nbro say xs * 2\nbro say xs + [1, 1, 1]\n"
+        "bro say xs[0] + xs[0 - 1]\nbro say len(xs) + sum(xs) + min(xs) + max(xs)\nbro say sum(range(1, 101))"
+    ),
+    "mixed_list": program('bro this is xs = [1, "a", 2]\nbro say xs\nbro say xs[1] + xs[2]'),
+    "list_condition": program("bro if [1, 2] == [1, 2] { bro say 1 }"),
+    "list_lengths": program("bro say [1, 2] + [1, 2, 3]"),
+    "index_out_of_range": program("bro say [1, 2][2]"),
+    "huge_ints": program(
+        "bro this is x = 1\nbro this is i = 0\nkeep going bro i < 70 { x = x * 3\ni = i + 1 }\nbro say x\nbro say [x, 1] * 2"
+    ),
+}
+PROGRAMS.update((os.path.basename(path), open(path).read()) for path in EXAMPLES)
+
+
+def run(source, engine, optimized):
+    """The program's output, or its error as 'Type: message'."""
+    answers = iter(INPUTS)
+
+    def input_callback():
+        try:
+            return next(answers)
+        except StopIteration:
+            raise RuntimeError("Bro, you ran out of input") from None
+
+    interpreter = Interpreter(engine)
+    interpreter.set_callbacks(input_callback)
+    try:
+        ast = parse(tokenize(source))
+        if optimized:
+            ast = optimize(ast)
+        return interpreter.visit(ast)
+    except Exception as error:
+        return f"{type(error).__name__}: {error}"
+
+
+@pytest.mark.parametrize("optimized", [False, True], ids=["plain", "optimized"])
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("name", sorted(PROGRAMS))
+def test_engines_agree(name, engine, optimized):
+    source = PROGRAMS[name]
+    assert run(source, engine, optimized) == run(source, "tree", False)
+
+
+def test_interpreter_rejects_unknown_engine():
+    with pytest.raises(ValueError):
+        Interpreter("jit")
+
+
+def test_start_pauses_for_input():
+    interpreter = Interpreter()
+    continuation = interpreter.start(parse(tokenize(PROGRAMS["input"])))
+    assert not continuation.done
+    continuation = continuation.resume("4")
+    assert interpreter.output == ["8"]
+    continuation = continuation.resume("yo")
+    assert continuation.done
+    assert interpreter.output == ["8", "yo!"]
@@ -0,0 +1,43 @@
+"""WorkerPool: results, streamed output and hard timeouts."""
+import pytest
+
+from lang.budget import ExecutionBudget
+from lang.workers import WorkerPool
+
+from tests.test_engines import program
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = WorkerPool(size=1, timeout=2)
+    yield pool
+    pool.close()
+
+
+def test_output_is_streamed(pool):
+    lines = []
+    result = pool.run(program("bro say 1\nbro say 2"), output_callback=lines.append)
+    assert result['success'] and result['output'] == "1\n2"
+    assert lines == ["1", "2"]
+    assert pool.stats()['program_cache']['misses'] >= 1
+
+
+def test_inputs_and_errors(pool):
+    result = pool.run(program("bro ask n\nbro say n / 0"), inputs=["3"])
+    assert not result['success']
+    assert result['error_type'] == "ZeroDivisionError"
+
+
+def test_budget_is_applied(pool):
+    result = pool.run(program("keep going bro 1 < 2 { bro say 1 }"), budget=ExecutionBudget(max_output=100))
+    assert result['budget_exceeded'] == "output"
+
+
+def test_runaway_worker_is_replaced(pool):
+    lines = []
+    code = program('bro say "start"\nkeep going bro 1 < 2 { bro this is i = 1 }')
+    result = pool.run(code, timeout=0.5, budget=ExecutionBudget(max_steps=None), output_callback=lines.append)
+    assert result['timed_out']
+    assert lines == ["start"]
+    assert pool.stats()['restarts'] == 1
+    assert pool.run(program("bro say 3"))['output'] == "3"